@@ -0,0 +1,293 @@
+import argparse
+import copy
+from typing import Dict, Iterable, Tuple, Union
+import numpy as np
+import pandas as pd
+
+from src.time_series import TS
+from src.fill_log import FillLog
+from src.results_io import iter_results
+from src.sparse_results import SparseResults
+
+"""
+Performance analytics of kandel_simulator results (the res TS: price, quote, base, mtm, volume,
+uptime columns), computed chunk by chunk so that results that do not fit in memory, memory-mapped
+or read back by results_io.iter_results, are summarized without loading them whole.
+Each chunk goes through single vectorized passes, only a few scalars are carried between chunks:
+returns vs HODL, max drawdown and its duration, Sharpe and Sortino ratios of the mtm resampled
+at any number of frequencies, fill counts, turnover and uptime ratio.
+Run from the repo root on a results file:
+    python -m src.analytics results/simul_results.tsz --window 1440 --freq row 1h 1D
+"""
+
+RESULT_COLUMNS = ('quote', 'base', 'mtm', 'volume', 'uptime')
+YEAR = pd.Timedelta(days=365)
+
+
+class _Returns:
+    """
+    Moments of the returns of the mtm resampled at one frequency: the mtm of a period is its
+    last row, empty periods are skipped. Chunks are merged with the parallel variance update.
+    period: length of a period in index units, None for row by row returns
+    """
+    def __init__(self, period : int = None) -> None:
+        self.period = period
+        self.n = 0
+        self.mean = 0.
+        self.m2 = 0.
+        self.down = 0.
+        # Last closed period mtm, and the period still open at the end of the last chunk
+        self.prev = None
+        self.pending = None
+
+    def _add(self, closed : np.array) -> None:
+        series = closed if self.prev is None else np.concatenate([[self.prev], closed])
+        if len(series):
+            self.prev = series[-1]
+        if len(series) < 2:
+            return
+        returns = series[1:] / series[:-1] - 1
+        n, mean = len(returns), returns.mean()
+        m2 = ((returns - mean) ** 2).sum()
+        delta = mean - self.mean
+        total = self.n + n
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.n * n / total
+        self.down += (np.minimum(returns, 0.) ** 2).sum()
+        self.n = total
+
+    def update(self, mtm : np.array, ids : np.array) -> None:
+        """
+        Adds rows with their mtm and period ids (increasing)
+        """
+        if not len(mtm):
+            return
+        if self.period is not None:
+            ids = ids // self.period
+        last = np.append(np.flatnonzero(ids[1:] != ids[:-1]), len(ids) - 1)
+        values, periods = mtm[last], ids[last]
+        closed = values[:-1]
+        if self.pending is not None and self.pending[0] != periods[0]:
+            closed = np.concatenate([[self.pending[1]], closed])
+        self._add(closed)
+        self.pending = (periods[-1], values[-1])
+
+    def finish(self) -> None:
+        if self.pending is not None:
+            self._add(np.array([self.pending[1]]))
+            self.pending = None
+
+    def ratios(self, periods_in_year : float) -> Tuple[float, float]:
+        """
+        Annualized (Sharpe, Sortino) ratios with a zero rate, nan without returns or dispersion
+        """
+        if self.n == 0:
+            return np.nan, np.nan
+        std = np.sqrt(self.m2 / self.n)
+        down = np.sqrt(self.down / self.n)
+        scale = np.sqrt(periods_in_year)
+        return (self.mean / std * scale if std > 0 else np.nan,
+                self.mean / down * scale if down > 0 else np.nan)
+
+
+class ResultAnalyzer:
+    """
+    Streaming summary of the results of one run, fed chunk by chunk (update) in row order.
+    window: rows up to window keep the initial inventory (see kandel_simulator), returns start
+            at row window as in sweep.run_config
+    freqs: return frequencies of the Sharpe and Sortino ratios, 'row' or pandas timedelta strings
+    hodl: (quote, base) held by the HODL benchmark, by default the inventory of the first row
+          after the init (the strategy's initial allocation)
+    price: price column, by default the first column that is not a result column
+    fill_log: fill log of the run, to count fills by side
+    """
+    def __init__(self,
+                 window : int = 0,
+                 freqs : Iterable[str] = ('row',),
+                 hodl : Tuple[float, float] = None,
+                 price : str = None,
+                 fill_log : FillLog = None) -> None:
+        self.window = window
+        self.freqs = list(freqs)
+        self.hodl = hodl
+        self.price = price
+        self.fill_log = fill_log
+        self.n_rows = 0
+        self.units_in_year = None
+        self.index_dtype = None
+        self.returns = None
+
+        self.first = self.last = None
+        self.peak = -np.inf
+        self.peak_time = None
+        self.max_drawdown = 0.
+        self.drawdown_peak = self.drawdown_trough = None
+        self.max_duration = 0
+        self.volume = 0.
+        self.fill_ticks = 0
+        self.uptime = 0.
+        self.uptime_rows = 0
+
+    def __repr__(self) -> str:
+        return f"ResultAnalyzer: {self.n_rows} rows"
+
+    def _start(self, chunk : TS) -> None:
+        # Frequencies are turned into period lengths in units of the index
+        self.units_in_year = chunk.units_in_year()
+        self.index_dtype = chunk.index_dtype
+        tick = pd.Timedelta(np.timedelta64(1, np.datetime_data(np.dtype(chunk.index_dtype))[0]))
+        self.returns = {}
+        for freq in self.freqs:
+            if freq == 'row':
+                self.returns[freq] = _Returns()
+            else:
+                period = pd.Timedelta(freq) / tick
+                if period != int(period) or period < 1:
+                    raise Exception(f"Frequency {freq} is not a multiple of the index unit")
+                self.returns[freq] = _Returns(int(period))
+
+    def _price(self, chunk : TS) -> np.array:
+        if self.price is not None:
+            return chunk.column(self.price)
+        for k, name in enumerate(chunk.col_names):
+            if str(name) not in RESULT_COLUMNS:
+                return chunk.column(k)
+        raise Exception("No price column in the results")
+
+    def update(self, chunk : TS) -> None:
+        """
+        Adds the next rows of the results
+        """
+        if chunk.n_rows == 0:
+            return
+        if self.returns is None:
+            self._start(chunk)
+        first_row = self.n_rows
+        self.n_rows += chunk.n_rows
+        names = [str(c) for c in chunk.col_names]
+        volume = chunk.column('volume')
+        self.volume += float(volume.sum())
+        self.fill_ticks += int(np.count_nonzero(volume))
+
+        # Rows from the init tick on
+        skip = min(max(self.window - first_row, 0), chunk.n_rows)
+        if skip == chunk.n_rows:
+            return
+        price = self._price(chunk)[skip:]
+        if 'mtm' in names:
+            mtm = chunk.column('mtm')[skip:]
+        else:
+            mtm = chunk.column('quote')[skip:] + chunk.column('base')[skip:] * price
+        ticks = chunk.index[skip:]
+        uptime = chunk.column('uptime')[max(self.window + 1 - first_row, 0):]
+        self.uptime += float(uptime.sum())
+        self.uptime_rows += len(uptime)
+
+        if self.first is None:
+            self.first = (float(mtm[0]), float(price[0]))
+        if self.hodl is None:
+            # Initial allocation, set on the row after the init tick
+            k = self.window + 1 - first_row - skip
+            if 0 <= k < len(mtm):
+                self.hodl = (float(chunk.column('quote')[skip + k]), float(chunk.column('base')[skip + k]))
+        self.last = (float(mtm[-1]), float(price[-1]))
+
+        for freq, returns in self.returns.items():
+            returns.update(mtm, np.arange(first_row + skip, self.n_rows) if freq == 'row' else ticks)
+
+        # Drawdown from the running peak, in one pass over the chunk
+        peaks = np.maximum(np.maximum.accumulate(mtm), self.peak)
+        drawdown = mtm / peaks - 1
+        trough = int(np.argmin(drawdown))
+        highs = mtm >= peaks
+        carried = ticks[0] if self.peak_time is None else self.peak_time
+        peak_times = np.maximum.accumulate(np.where(highs, ticks, carried))
+        if drawdown[trough] < self.max_drawdown:
+            self.max_drawdown = float(drawdown[trough])
+            self.drawdown_peak, self.drawdown_trough = int(peak_times[trough]), int(ticks[trough])
+        self.max_duration = max(self.max_duration, int((ticks - peak_times).max()))
+        self.peak, self.peak_time = float(peaks[-1]), int(peak_times[-1])
+
+    def _time(self, tick : int) -> pd.Timestamp:
+        return None if tick is None else pd.Timestamp(np.int64(tick).view(self.index_dtype))
+
+    def summary(self) -> Dict:
+        """
+        Summary of the rows added so far
+        """
+        if self.first is None:
+            return dict(n_rows=self.n_rows, volume=self.volume, fill_ticks=self.fill_ticks)
+        (mtm_0, price_0), (mtm_1, price_1) = self.first, self.last
+        quote, base = self.hodl if self.hodl is not None else (mtm_0, 0.)
+        hodl_0, hodl_1 = quote + base * price_0, quote + base * price_1
+        tick = pd.Timedelta(np.timedelta64(1, np.datetime_data(np.dtype(self.index_dtype))[0]))
+        res = dict(n_rows=self.n_rows,
+                   mtm=mtm_1,
+                   ret=mtm_1 / mtm_0 - 1,
+                   hodl_mtm=hodl_1,
+                   hodl_ret=hodl_1 / hodl_0 - 1,
+                   excess_ret=mtm_1 / mtm_0 - hodl_1 / hodl_0,
+                   max_drawdown=self.max_drawdown,
+                   drawdown_peak=self._time(self.drawdown_peak),
+                   drawdown_trough=self._time(self.drawdown_trough),
+                   max_drawdown_duration=self.max_duration * tick)
+        for freq, returns in self.returns.items():
+            # Ratios of the returns so far, the open period closed on a copy
+            returns = copy.copy(returns)
+            returns.finish()
+            periods_in_year = self.units_in_year if freq == 'row' else YEAR / (returns.period * tick)
+            res[f'sharpe_{freq}'], res[f'sortino_{freq}'] = returns.ratios(periods_in_year)
+        res.update(volume=self.volume,
+                   turnover=self.volume / mtm_0,
+                   fill_ticks=self.fill_ticks,
+                   uptime=self.uptime / self.uptime_rows if self.uptime_rows else np.nan)
+        if self.fill_log is not None:
+            res['fills'] = len(self.fill_log)
+            for side in ('bid', 'ask'):
+                res[f'{side}_fills'] = sum(len(c) for c in self.fill_log.iter_chunks(side=side))
+        return res
+
+
+def analyze(res : Union[TS, SparseResults, Iterable[TS]],
+            window : int = 0,
+            freqs : Iterable[str] = ('row',),
+            hodl : Tuple[float, float] = None,
+            price : str = None,
+            fill_log : FillLog = None,
+            chunk_rows : int = 1 << 20) -> Dict:
+    """
+    Summary of the results of a run (see ResultAnalyzer): a res TS from kandel_simulator,
+    possibly memory-mapped, read by chunks of chunk_rows rows (views), the SparseResults of a
+    sparse run, expanded chunk by chunk, or an iterable of consecutive result chunks
+    (kandel_stream outputs, results_io.iter_results)
+    """
+    analyzer = ResultAnalyzer(window, freqs, hodl, price, fill_log)
+    if isinstance(res, SparseResults):
+        chunks = res.iter_chunks(chunk_rows)
+    elif isinstance(res, TS):
+        chunks = (res[k:k + chunk_rows] for k in range(0, res.n_rows, chunk_rows))
+    else:
+        chunks = res
+    for chunk in chunks:
+        analyzer.update(chunk)
+    return analyzer.summary()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('results', help='results file (see results_io.write_results)')
+    parser.add_argument('--window', type=int, default=0, help='window of the run')
+    parser.add_argument('--freq', nargs='+', default=['row', '1h', '1D'],
+                        help="return frequencies: 'row' or pandas timedeltas")
+    parser.add_argument('--start', default=None)
+    parser.add_argument('--stop', default=None)
+    args = parser.parse_args()
+
+    summary = analyze(iter_results(args.results, start=args.start, stop=args.stop),
+                      window=args.window, freqs=args.freq)
+    for key, value in summary.items():
+        print(f"{key:>24} {value}")
+
+
+if __name__ == '__main__':
+    main()
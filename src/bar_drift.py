@@ -0,0 +1,96 @@
+import argparse
+import json
+import time
+from typing import Dict, Union
+import numpy as np
+
+from src.time_series import TS, load_csv, ohlc_bars, bar_rows
+from src.order_book import OrderBook
+from src.kandel import kandel_simulator, kandel_bar_simulator
+
+"""
+Drift of a bar run (kandel_bar_simulator on OHLC bars) against the tick run it approximates
+(kandel_simulator on the forward filled ticks the bars are built from).
+Run from the repo root:
+    python -m src.bar_drift data/ETHUSDC-1s-2024-09-15.csv --resolution 1min
+"""
+
+
+def bar_drift(ts : TS,
+              resolution : Union[int, str],
+              quote : float,
+              base : float,
+              vol_mult : float,
+              n_points : int,
+              step_size : int,
+              window : int,
+              ladder : bool = True,
+              event_skip : bool = True,
+              path : str = 'auto') -> Dict:
+    """
+    Runs the config on ts (window in ticks) and on its bars of resolution (window in bars),
+    returns the run times and how far the bar results drift from the tick ones:
+    mtm at the bar closes (final, mean and max relative difference), total volume,
+    number of fill ticks / bars and uptime ratio of both runs
+    """
+    bar = bar_rows(ts.unit, resolution)
+    if window % bar:
+        raise Exception(f"window {window} is not a whole number of bars of {bar} rows")
+    params = dict(quote=quote, base=base, vol_mult=vol_mult, n_points=n_points, step_size=step_size)
+
+    start = time.perf_counter()
+    _, ref, _ = kandel_simulator(ts, order_book=OrderBook(), window=window, ladder=ladder,
+                                 event_skip=event_skip, **params)
+    ref_seconds = time.perf_counter() - start
+    bars = ohlc_bars(ts, bar)
+    start = time.perf_counter()
+    _, res, _ = kandel_bar_simulator(bars, window=window // bar, ladder=ladder,
+                                     event_skip=event_skip, path=path, **params)
+    bar_seconds = time.perf_counter() - start
+
+    # Tick results at the close of each bar
+    closes = np.minimum(np.arange(1, bars.n_rows + 1) * bar, ts.n_rows) - 1
+    ref_mtm = ref.column('mtm')[closes]
+    drift = np.abs(res.column('mtm') - ref_mtm) / ref_mtm
+    ref_volume, bar_volume = ref.column('volume').sum(), res.column('volume').sum()
+    return dict(bar=bar,
+                ticks=ts.n_rows,
+                bars=bars.n_rows,
+                tick_seconds=ref_seconds,
+                bar_seconds=bar_seconds,
+                speedup=ref_seconds / bar_seconds,
+                tick_mtm=float(ref_mtm[-1]),
+                bar_mtm=float(res.column('mtm')[-1]),
+                final_mtm_drift=float(drift[-1]),
+                mean_mtm_drift=float(drift.mean()),
+                max_mtm_drift=float(drift.max()),
+                tick_volume=float(ref_volume),
+                bar_volume=float(bar_volume),
+                volume_ratio=float(bar_volume / ref_volume) if ref_volume else np.nan,
+                tick_fills=int(np.count_nonzero(ref.column('volume'))),
+                bar_fills=int(np.count_nonzero(res.column('volume'))),
+                tick_uptime=float(ref.column('uptime')[window + 1:].mean()),
+                bar_uptime=float(res.column('uptime')[window // bar:].mean()))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('data', help='csv path')
+    parser.add_argument('--resolution', default='1min', help='rows per bar or timedelta string')
+    parser.add_argument('--quote', type=float, default=75000)
+    parser.add_argument('--base', type=float, default=0)
+    parser.add_argument('--vol-mult', type=float, default=0.4)
+    parser.add_argument('--n-points', type=int, default=10)
+    parser.add_argument('--step-size', type=int, default=1)
+    parser.add_argument('--window', type=int, default=3600, help='in ticks')
+    parser.add_argument('--path', default='auto')
+    args = parser.parse_args()
+
+    ts = load_csv(args.data, cache=True)
+    resolution = int(args.resolution) if args.resolution.isdigit() else args.resolution
+    print(json.dumps(bar_drift(ts, resolution, args.quote, args.base, args.vol_mult, args.n_points,
+                               args.step_size, args.window, path=args.path), indent=2))
+
+
+if __name__ == '__main__':
+    main()
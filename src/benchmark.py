@@ -0,0 +1,258 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import time
+import timeit
+import tracemalloc
+from typing import Callable, Dict, List
+import numpy as np
+import pandas as pd
+
+from src.time_series import TS, load_csv
+from src.order import Order
+from src.order_book import OrderBook, add_limit_order, arbitrage_order_book, build_book, execute_market_order
+from src.matching import MatchingEngine
+from src.kandel import kandel_reset, kandel_simulator, geom_price_grid, KandelSimulator
+from src.fill_log import FillLog
+from src.utils_grid import brownian_price_series_generator
+
+"""
+Benchmarks of the order book, matching and simulator hot paths.
+Run from the repo root:
+    python -m src.benchmark --sizes 1e4 1e5 1e6 --out bench.json
+    python -m src.benchmark --compare bench.json --out bench_new.json
+Results are written as json: micro benchmarks (seconds per call), simulator runs per mode
+and size (ticks/sec, peak memory) and the log-log scaling exponent of each mode.
+"""
+
+DATA_PATH = 'data/ETHUSDC-1s-2024-09-15.csv'
+
+# Simulator modes, name -> kandel_simulator kwargs
+MODES = {
+    'sorted': dict(),
+    'ladder': dict(ladder=True),
+    'ladder_skip': dict(ladder=True, event_skip=True),
+    'ladder_skip_log': dict(ladder=True, event_skip=True, fill_log=FillLog),
+}
+# The SortedList book deep-copies on every order, keep it to small sizes
+SLOW_MODES = {'sorted': 100_000}
+
+PARAMS = dict(quote=75000, base=0, vol_mult=0.4, n_points=10, step_size=1, window=3600)
+
+
+def synthetic_ts(n_rows : int, volatility : float = 1.0, seed : int = 12) -> TS:
+    """
+    Brownian 1s price series of n_rows rows
+    """
+    prices = np.array(brownian_price_series_generator(n_rows, 2000.0, volatility, seed))
+    return TS(row_names=pd.date_range('2024-01-01', periods=n_rows, freq='s'),
+              unit=(1, 's'),
+              n_rows=n_rows,
+              col_names=np.array(['price']),
+              values=prices.reshape(1, -1))
+
+
+def time_call(f : Callable, min_time : float = 0.2) -> float:
+    """
+    Seconds per call of f, best of 3 runs of an auto-ranged number of calls
+    """
+    timer = timeit.Timer(f)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    return min(timer.repeat(repeat=3, number=number)) / number
+
+
+def time_run(f : Callable, budget : float = 1., max_runs : int = 5) -> float:
+    """
+    Best wall time of f, rerun while the total stays under budget seconds
+    """
+    times = []
+    while len(times) < max_runs and sum(times) < budget:
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def peak_memory(f : Callable) -> float:
+    """
+    Peak traced memory of f in MB (python and numpy allocations)
+    """
+    tracemalloc.start()
+    try:
+        f()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def micro_benchmarks(ts : TS) -> Dict[str, float]:
+    """
+    Seconds per call of the book primitives and the MatchingEngine behind execute_market_order
+    on a 10 points grid built from ts
+    """
+    spot_price = ts.values[0][PARAMS['window']]
+    price_grid = geom_price_grid(ts[:PARAMS['window']], spot_price, PARAMS['vol_mult'], PARAMS['n_points'])
+    capital = PARAMS['quote']
+    book = build_book(capital, price_grid, spot_price)
+    best_bid = book.bids[0]
+    (quote, base), book = kandel_reset(capital, 0., spot_price, price_grid, PARAMS['step_size'], init=True)
+    transactions, _ = arbitrage_order_book(best_bid.price, book)
+    engine = MatchingEngine.from_order_book(book)
+    bid_price, bid_qty = engine.depth('bid')[0]
+
+    def limit_cancel():
+        # Rests a bid below the book then cancels it, the engine is left unchanged
+        order_id, _ = engine.limit('bid', price_grid[0], 1.)
+        engine.cancel(order_id)
+
+    def market_refill():
+        # Takes the whole best bid level then rests it back
+        engine.market('ask', bid_qty)
+        engine.limit('bid', bid_price, bid_qty)
+
+    return {
+        'add_limit_order': time_call(lambda: add_limit_order(Order('bid', 1., price_grid[0]), book)),
+        'arbitrage_order_book_no_fill': time_call(lambda: arbitrage_order_book(spot_price, book)),
+        'arbitrage_order_book_fill': time_call(lambda: arbitrage_order_book(best_bid.price, book)),
+        'build_book': time_call(lambda: build_book(capital, price_grid, spot_price)),
+        'kandel_reset_init': time_call(lambda: kandel_reset(capital, 0., spot_price, price_grid,
+                                                            PARAMS['step_size'], init=True)),
+        'kandel_reset_fill': time_call(lambda: kandel_reset(quote, base, best_bid.price, price_grid,
+                                                            PARAMS['step_size'], transactions, book)),
+        'order_init': time_call(lambda: Order('bid', 1.2345678, 2400.1234567)),
+        'execute_market_order': time_call(lambda: execute_market_order(best_bid.price, 1., book)),
+        'matching_from_order_book': time_call(lambda: MatchingEngine.from_order_book(book)),
+        'matching_limit_cancel': time_call(limit_cancel),
+        'matching_market_refill': time_call(market_refill),
+    }
+
+
+def load_benchmarks(path : str) -> Dict[str, float]:
+    res = {'load_csv': time_call(lambda: load_csv(path), min_time=1.)}
+    cache_dir = path + '.bench.cache'
+    load_csv(path, cache=True, cache_dir=cache_dir)
+    res['load_csv_cached'] = time_call(lambda: load_csv(path, cache=True, cache_dir=cache_dir))
+    return res
+
+
+def run_simulator(ts : TS, mode : str) -> None:
+    kwargs = dict(MODES[mode])
+    if 'fill_log' in kwargs:
+        kwargs['fill_log'] = FillLog()
+    kandel_simulator(ts=ts, order_book=OrderBook(), **PARAMS, **kwargs)
+
+
+def simulator_benchmarks(sizes : List[int], modes : List[str], memory : bool = True) -> List[Dict]:
+    res = []
+    for n_rows in sizes:
+        ts = synthetic_ts(n_rows)
+        for mode in modes:
+            if n_rows > SLOW_MODES.get(mode, np.inf):
+                continue
+            seconds = time_run(lambda: run_simulator(ts, mode))
+            row = dict(mode=mode, n_rows=n_rows, seconds=seconds,
+                       ticks_per_sec=n_rows / seconds)
+            if memory:
+                row['peak_mb'] = peak_memory(lambda: run_simulator(ts, mode))
+            print(f"{mode:>16} {n_rows:>10} rows {seconds:10.3f}s {row['ticks_per_sec']:14,.0f} ticks/s")
+            res.append(row)
+    return res
+
+
+def step_latency(ts : TS, n_rows : int = 100_000) -> Dict[str, float]:
+    """
+    Per tick latency (seconds) of KandelSimulator.step over the first n_rows of ts
+    """
+    sim = KandelSimulator(**PARAMS, ladder=True, event_skip=True)
+    for price, timestamp in zip(ts.column(0)[:n_rows].tolist(), ts.index[:n_rows].tolist()):
+        sim.step(price, timestamp)
+    return sim.latency()
+
+
+def scaling(runs : List[Dict]) -> Dict[str, float]:
+    """
+    Exponent of seconds ~ n_rows ** k fitted per mode (1 is linear)
+    """
+    res = {}
+    for mode in set(r['mode'] for r in runs):
+        points = [(r['n_rows'], r['seconds']) for r in runs if r['mode'] == mode]
+        if len(points) > 1:
+            x, y = np.log(np.array(points)).T
+            res[mode] = float(np.polyfit(x, y, 1)[0])
+    return res
+
+
+def environment() -> Dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                                text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return dict(date=datetime.datetime.now().isoformat(),
+                commit=commit,
+                python=platform.python_version(),
+                numpy=np.__version__,
+                pandas=pd.__version__,
+                machine=platform.machine(),
+                processor=platform.processor(),
+                cpu_count=os.cpu_count())
+
+
+def compare(old : Dict, new : Dict) -> pd.DataFrame:
+    """
+    Table of old vs new seconds (speedup > 1 means new is faster)
+    """
+    rows = []
+    for section in ('micro', 'load'):
+        for name, seconds in new.get(section, {}).items():
+            if name in old.get(section, {}):
+                rows.append((name, old[section][name], seconds))
+    old_runs = {(r['mode'], r['n_rows']): r['seconds'] for r in old.get('simulator', [])}
+    for r in new.get('simulator', []):
+        if (r['mode'], r['n_rows']) in old_runs:
+            rows.append((f"{r['mode']}[{r['n_rows']}]", old_runs[(r['mode'], r['n_rows'])], r['seconds']))
+    res = pd.DataFrame(rows, columns=['benchmark', 'old', 'new'])
+    res['speedup'] = res['old'] / res['new']
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', nargs='+', type=float, default=[1e4, 1e5, 1e6])
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--no-memory', action='store_true', help='skip the peak memory runs')
+    parser.add_argument('--out', default='bench.json')
+    parser.add_argument('--compare', help='previous json to compare with')
+    args = parser.parse_args()
+
+    ts = load_csv(args.data)
+    res = dict(environment=environment(),
+               micro=micro_benchmarks(ts),
+               load=load_benchmarks(args.data))
+    for name, seconds in {**res['micro'], **res['load']}.items():
+        print(f"{name:>30} {seconds * 1e6:12.2f} us")
+
+    res['simulator'] = simulator_benchmarks([int(n) for n in args.sizes], args.modes,
+                                            memory=not args.no_memory)
+    seconds = time_run(lambda: run_simulator(ts, 'ladder_skip'))
+    res['simulator'].append(dict(mode='data:ladder_skip', data=args.data, n_rows=ts.n_rows,
+                                 seconds=seconds, ticks_per_sec=ts.n_rows / seconds))
+    res['step_latency'] = step_latency(ts)
+    print('step latency', {k: f"{v * 1e6:.1f} us" for k, v in res['step_latency'].items() if k != 'calls'})
+    res['scaling'] = scaling([r for r in res['simulator'] if 'data' not in r])
+    print('scaling exponents', res['scaling'])
+
+    with open(args.out, 'w') as f:
+        json.dump(res, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(json.load(f), res).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import pickle
+from typing import Dict, List, Tuple
+import numpy as np
+
+from src.time_series import TS
+from src.fill_log import FillLog
+
+"""
+Checkpoints of a kandel_simulator run, to resume it after a crash or extend it onto appended rows.
+A checkpoint directory holds one chunk per saved segment of rows (result arrays, transactions,
+and a digest of the input rows it was computed on), the strategy state after the last segment,
+and a meta.json listing them. meta.json is replaced atomically last, so a crash while saving
+leaves the previous checkpoint valid.
+"""
+
+CHECKPOINT_VERSION = 2
+META = 'meta.json'
+RESULTS = ('quote', 'base', 'volume', 'uptime')
+
+
+def rows_digest(ts : TS, start : int, stop : int) -> str:
+    """
+    blake2b digest of the timestamps and values of rows start..stop - 1
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(ts.index[start:stop]).data)
+    for col in ts.columns:
+        h.update(np.ascontiguousarray(col[start:stop]).data)
+    return h.hexdigest()
+
+
+class Checkpoint:
+    """
+    Checkpoint directory of one run.
+    params: run parameters, a checkpoint saved with other params is refused
+    """
+    def __init__(self, path : str, params : Dict) -> None:
+        self.path = path
+        self.params = params
+        self.meta = None
+        if os.path.exists(os.path.join(path, META)):
+            with open(os.path.join(path, META)) as f:
+                self.meta = json.load(f)
+
+    def __repr__(self) -> str:
+        rows = self.meta['n_rows'] if self.meta else 0
+        return f"Checkpoint: {rows} rows done ({self.path})"
+
+    def _file(self, name : str) -> str:
+        return os.path.join(self.path, name)
+
+    def load(self, ts : TS, results : Tuple[np.array, np.array, np.array, np.array],
+             fill_log : FillLog = None):
+        """
+        Restores the saved rows into results (quote, base, volume, uptime arrays of ts rows)
+        after checking that they were computed on the same rows of ts with the same params.
+        fill_log is reopened on the saved fills and truncated to the checkpoint.
+        returns (rows done, state, transactions per tick or None), None if there is no checkpoint
+        """
+        if self.meta is None:
+            return None
+        meta = self.meta
+        if meta['version'] != CHECKPOINT_VERSION or meta['params'] != self.params:
+            raise Exception(f"Checkpoint {self.path} was saved with other parameters")
+        if meta['n_rows'] > ts.n_rows:
+            raise Exception(f"Checkpoint {self.path} has more rows ({meta['n_rows']}) than the data")
+        transactions = [] if meta['fills'] is None else None
+        for chunk in meta['chunks']:
+            start, stop = chunk['start'], chunk['stop']
+            if rows_digest(ts, start, stop) != chunk['digest']:
+                raise Exception(f"Checkpoint {self.path}: rows {start}..{stop} changed in the data")
+            with np.load(self._file(chunk['file'])) as arrays:
+                for res, name in zip(results, RESULTS):
+                    res[start:stop] = arrays[name]
+            if transactions is not None:
+                with open(self._file(chunk['transactions']), 'rb') as f:
+                    transactions.extend(pickle.load(f))
+        with open(self._file(meta['state']), 'rb') as f:
+            state = pickle.load(f)
+        if fill_log is not None:
+            if meta['fills'] is None:
+                raise Exception(f"Checkpoint {self.path} has no fill log")
+            fill_log.reopen(meta['fills'])
+            fill_log.truncate(meta['n_fills'])
+        return meta['n_rows'], state, transactions
+
+    def save(self, ts : TS, start : int, stop : int, state,
+             results : Tuple[np.array, np.array, np.array, np.array],
+             transactions : List = None,
+             fill_log : FillLog = None) -> None:
+        """
+        Adds the chunk of rows start..stop - 1 (transactions: its transactions per tick,
+        when no fill_log is used) and the state after it
+        """
+        os.makedirs(self.path, exist_ok=True)
+        meta = self.meta or dict(version=CHECKPOINT_VERSION, params=self.params, n_rows=0,
+                                 chunks=[], state=None, fills=None, n_fills=0)
+        if start != meta['n_rows']:
+            raise Exception(f"Checkpoint {self.path} is at row {meta['n_rows']}, not {start}")
+        k = len(meta['chunks'])
+        chunk = dict(start=start, stop=stop, digest=rows_digest(ts, start, stop),
+                     file=f'chunk_{k}.npz')
+        np.savez(self._file(chunk['file']),
+                 **{name: res[start:stop] for res, name in zip(results, RESULTS)})
+        if fill_log is None:
+            chunk['transactions'] = f'transactions_{k}.pkl'
+            with open(self._file(chunk['transactions']), 'wb') as f:
+                pickle.dump(transactions, f, protocol=pickle.HIGHEST_PROTOCOL)
+        else:
+            if fill_log.path is None:
+                fill_log.path = self._file('fills.bin')
+            fill_log.flush()
+        old_state = meta['state']
+        state_file = f'state_{k}.pkl'
+        with open(self._file(state_file), 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        meta = dict(meta, n_rows=stop, chunks=meta['chunks'] + [chunk], state=state_file,
+                    fills=None if fill_log is None else os.path.abspath(fill_log.path),
+                    n_fills=0 if fill_log is None else len(fill_log))
+        with open(self._file(META + '.tmp'), 'w') as f:
+            json.dump(meta, f)
+        os.replace(self._file(META + '.tmp'), self._file(META))
+        self.meta = meta
+        if old_state is not None and old_state != state_file:
+            os.remove(self._file(old_state))
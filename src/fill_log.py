@@ -0,0 +1,186 @@
+import os
+import tempfile
+from typing import List, Union
+import numpy as np
+import pandas as pd
+
+from src.order import Order
+from src.time_series import TS
+
+"""
+Columnar log of the fills of a simulation.
+Fills are rows of a structured array (tick, side, price, qty, level) kept in a buffer
+that grows by chunks and is spilled to an append-only binary file past a memory threshold.
+The file is the raw array, readers memory-map it and only load the rows they filter.
+"""
+
+FILL_DTYPE = np.dtype([('tick', 'i8'),
+                       ('side', 'i1'),
+                       ('price', 'f8'),
+                       ('qty', 'f8'),
+                       ('level', 'i4')])
+
+SIDES = {'bid': 0, 'ask': 1}
+SIDE_NAMES = np.array(['bid', 'ask'])
+
+
+class FillLog:
+    """
+    Fill log of one run.
+    path: spill file, a temporary file is created on first spill if None
+    chunk_size: rows the in-memory buffer grows by
+    max_memory_rows: buffer size above which rows are spilled to path
+    """
+    def __init__(self,
+                 path : str = None,
+                 chunk_size : int = 1 << 16,
+                 max_memory_rows : int = 1 << 20) -> None:
+        self.path = path
+        self.chunk_size = chunk_size
+        self.max_memory_rows = max_memory_rows
+        self.buffer = np.empty(chunk_size, dtype=FILL_DTYPE)
+        self.n_buffer = 0
+        self.n_spilled = 0
+        if path is not None and os.path.exists(path):
+            self.n_spilled = os.path.getsize(path) // FILL_DTYPE.itemsize
+
+    @classmethod
+    def open(cls, path : str) -> 'FillLog':
+        """
+        Reopens a spilled log for reading (and appending)
+        """
+        return cls(path=path)
+
+    def reopen(self, path : str) -> None:
+        """
+        Points the log to the spill file path, dropping the buffered rows
+        """
+        self.path = path
+        self.n_spilled = os.path.getsize(path) // FILL_DTYPE.itemsize if os.path.exists(path) else 0
+        self.n_buffer = 0
+        self.buffer = np.empty(self.chunk_size, dtype=FILL_DTYPE)
+
+    def truncate(self, n : int) -> None:
+        """
+        Keeps the first n fills only
+        """
+        if n < self.n_spilled:
+            with open(self.path, 'r+b') as f:
+                f.truncate(n * FILL_DTYPE.itemsize)
+            self.n_spilled = n
+            self.n_buffer = 0
+        else:
+            self.n_buffer = min(self.n_buffer, n - self.n_spilled)
+
+    def __len__(self) -> int:
+        return self.n_spilled + self.n_buffer
+
+    def __repr__(self) -> str:
+        return f"FillLog: {len(self)} fills, {self.n_spilled} on disk ({self.path})"
+
+    def add(self, tick : int, transactions : List[Order], levels : List[int]) -> None:
+        """
+        Appends the transactions of one tick
+        """
+        n = len(transactions)
+        if self.n_buffer + n > len(self.buffer):
+            grown = np.empty(len(self.buffer) + max(self.chunk_size, n), dtype=FILL_DTYPE)
+            grown[:self.n_buffer] = self.buffer[:self.n_buffer]
+            self.buffer = grown
+        for k, (transaction, level) in enumerate(zip(transactions, levels)):
+            self.buffer[self.n_buffer + k] = (tick,
+                                              SIDES[transaction.order_type],
+                                              transaction.price,
+                                              transaction.qty,
+                                              level)
+        self.n_buffer += n
+        if self.n_buffer >= self.max_memory_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Appends the buffered rows to the spill file and shrinks the buffer back to one chunk
+        """
+        if self.n_buffer == 0:
+            return
+        if self.path is None:
+            fd, self.path = tempfile.mkstemp(suffix='.fills')
+            os.close(fd)
+        with open(self.path, 'ab') as f:
+            f.write(self.buffer[:self.n_buffer].tobytes())
+        self.n_spilled += self.n_buffer
+        self.n_buffer = 0
+        self.buffer = np.empty(self.chunk_size, dtype=FILL_DTYPE)
+
+    def _spilled(self) -> np.array:
+        if self.n_spilled == 0:
+            return np.empty(0, dtype=FILL_DTYPE)
+        return np.memmap(self.path, dtype=FILL_DTYPE, mode='r', shape=(self.n_spilled,))
+
+    def iter_chunks(self,
+                    start : int = None,
+                    stop : int = None,
+                    side : str = None,
+                    chunk_rows : int = 1 << 20):
+        """
+        Yields arrays of the fills with start <= tick < stop (and side if given), chunk by chunk.
+        Ticks are increasing, the tick range is found by binary search so that only
+        the matching part of the file is read.
+        """
+        for part in (self._spilled(), self.buffer[:self.n_buffer]):
+            ticks = part['tick']
+            first = 0 if start is None else int(np.searchsorted(ticks, start, side='left'))
+            last = len(part) if stop is None else int(np.searchsorted(ticks, stop, side='left'))
+            for k in range(first, last, chunk_rows):
+                chunk = np.array(part[k:min(k + chunk_rows, last)])
+                if side is not None:
+                    chunk = chunk[chunk['side'] == SIDES[side]]
+                if len(chunk):
+                    yield chunk
+
+    def read(self,
+             start : Union[int, pd.Timestamp] = None,
+             stop : Union[int, pd.Timestamp] = None,
+             side : str = None,
+             ts : TS = None) -> np.array:
+        """
+        Fills with start <= tick < stop and side, as one structured array.
+        start and stop are tick indices, or timestamps if the ts of the run is given.
+        """
+        if ts is not None:
+            start = None if start is None else _first_tick(ts, start)
+            stop = None if stop is None else _first_tick(ts, stop)
+        chunks = list(self.iter_chunks(start, stop, side))
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=FILL_DTYPE)
+
+    def to_pandas(self, ts : TS = None, **kwargs) -> pd.DataFrame:
+        """
+        Fills as a DataFrame, indexed by timestamp if the ts of the run is given (read arguments in kwargs)
+        """
+        fills = self.read(ts=ts, **kwargs)
+        res = pd.DataFrame({'tick': fills['tick'],
+                            'side': SIDE_NAMES[fills['side']],
+                            'price': fills['price'],
+                            'qty': fills['qty'],
+                            'level': fills['level']})
+        if ts is not None:
+            res.index = _tick_times(ts, fills['tick'])
+        return res
+
+
+def _tick_times(ts : TS, ticks : np.array) -> pd.DatetimeIndex:
+    # Timestamps of ticks: rows of ts, or ticks on the grid of a gap-aware ts (holes included)
+    if ts.gaps is None:
+        return ts.row_names[ticks]
+    index = ts.index[0] + np.asarray(ticks, dtype='int64') * ts.gaps.step
+    return pd.DatetimeIndex(index.view(ts.index_dtype))
+
+
+def _first_tick(ts : TS, timestamp : pd.Timestamp) -> int:
+    # First tick of ts at or after timestamp
+    if ts.gaps is None:
+        return int(ts.row_names.searchsorted(pd.Timestamp(timestamp), side='left'))
+    unit = np.datetime_data(np.dtype(ts.index_dtype))[0]
+    first = pd.Timestamp(np.datetime64(int(ts.index[0]), unit)).value
+    step = pd.Timedelta(ts.gaps.step, unit=unit).value
+    return max(-(-(pd.Timestamp(timestamp).value - first) // step), 0)
@@ -13,73 +13,90 @@ dates will always be handled as timestamps
 NA_VAL = -9999999
 
 
-def log_ret_(ts : TS) -> TS:
+def _per_column(res : np.array) -> Union[List, float]:
+    # One figure per column, a scalar for a single column TS
+    return list(res) if len(res) > 1 else res[0]
+
+
+def _like(ts : TS, values : np.array, col_names : np.array = None) -> TS:
+    # TS with the rows of ts and values, sharing the row index instead of copying it
+    return ts.like(ts.col_names if col_names is None else col_names, values=values)
+
+
+def _writable_values(ts : TS) -> np.array:
+    # ts.values to be overwritten in place, refused rather than silently copied
+    values = ts.values
+    if values.dtype != np.float64 or not values.flags.writeable:
+        raise Exception(f"inplace needs writable float64 values, got {values.dtype}"
+                        f"{'' if values.flags.writeable else ' read-only'} values")
+    return values
+
+
+def log_ret_(ts : TS, inplace : bool = False) -> TS:
     """
-    returns a copy of ts with the log-returns as values
+    returns ts with the log-returns as values (nan on first row), all columns at once
+    inplace: overwrite ts.values instead of allocating new ones
+             (which must be writable float64, e.g. not memory-mapped from the cache)
     """
-    res = ts.copy()
-    # TO DO : Parallelize this
-    for i, col in enumerate(res.values):
-        res.values[i] = np.insert(np.log(col[1:] / col[:-1]), 0, None)
+    values = _writable_values(ts) if inplace else np.asarray(ts.values, dtype=float)
+    res = values if inplace else np.empty(values.shape)
+    np.divide(values[:, 1:], values[:, :-1], out=res[:, 1:])
+    np.log(res[:, 1:], out=res[:, 1:])
+    res[:, :1] = np.nan
+    return ts if inplace else _like(ts, res)
 
-    return res
-
-def mean_(ts : TS) -> List:
+def mean_(ts : TS, axis : int = 1) -> Union[List, float]:
     """
-    returns annualized volatility of time series
-    TO DO: how to handle if multiple time series
+    returns the mean of each column ignoring nans (axis=1),
+    or of each row across columns (axis=0) as an array
     """
-    res = []
-    # TO DO: Parallelize
-    for i, col in enumerate(ts.values):
-        res.append(np.nanmean(col))
-    return res if len(res) > 1 else res[0]
+    res = np.nanmean(ts.values, axis=axis)
+    return _per_column(res) if axis == 1 else res
 
-def vol_(ts : Union[TS, pd.DataFrame], multiplier : float = None) -> List:
+def vol_(ts : Union[TS, pd.DataFrame], multiplier : float = None, axis : int = 1) -> List:
     """
-    returns annualized volatility of time series
-    TO DO: how to handle if multiple time series
+    returns annualized volatility of each column of the time series
+    multiplier: units in a year, required for a DataFrame
     """
     if isinstance(ts, TS):
-        res = []
-        # TO DO: Parallelize
-        for i, col in enumerate(ts.values):
-            res.append(np.nanstd(col) * np.sqrt(ts.units_in_year()))
-        return res if len(res) > 1 else res[0]
+        res = np.nanstd(ts.values, axis=axis) * np.sqrt(ts.units_in_year())
+        return _per_column(res) if axis == 1 else res
     elif isinstance(ts, pd.DataFrame):
         if not multiplier:
-            raise("I need a multiplier to annualize the vol")
-        else:
-            return 
+            raise Exception("I need a multiplier to annualize the vol")
+        return _per_column(np.nanstd(ts.values, axis=0) * np.sqrt(multiplier))
     else:
-        raise("Don't know that type of input")
+        raise Exception("Don't know that type of input")
 
-def std_(ts : TS) -> List:
+def std_(ts : TS, axis : int = 1) -> Union[List, float]:
     """
-    returns annualized volatility of time series
-    TO DO: how to handle if multiple time series
+    returns the standard deviation of each column ignoring nans (axis=1),
+    or of each row across columns (axis=0) as an array
     """
-    res = []
-    # TO DO: Parallelize
-    for i, col in enumerate(ts.values):
-        res.append(np.nanstd(col))
-    return res if len(res) > 1 else res[0]
-
-def one_(ts : TS) -> TS:
-    res = ts.copy()
-    # TO DO : Parallelize this
-    for i, col in enumerate(res.values):
-        res.values[i] = res.values[i] / res.values[i][0]
+    res = np.nanstd(ts.values, axis=axis)
+    return _per_column(res) if axis == 1 else res
 
-    return res
-
-def cumsum_(ts : TS) -> TS:
-    res = ts.copy()
-    # TO DO : Parallelize this
-    for i, col in enumerate(res.values):
-        res.values[i] = np.cumsum(res.values[i])
+def one_(ts : TS, inplace : bool = False) -> TS:
+    """
+    returns ts rebased so that each column starts at 1
+    inplace: as in log_ret_
+    """
+    values = _writable_values(ts) if inplace else np.asarray(ts.values, dtype=float)
+    if inplace:
+        values /= values[:, :1].copy()
+        return ts
+    return _like(ts, values / values[:, :1])
 
-    return res
+def cumsum_(ts : TS, inplace : bool = False) -> TS:
+    """
+    returns the cumulative sums of each column
+    inplace: as in log_ret_
+    """
+    values = _writable_values(ts) if inplace else np.asarray(ts.values, dtype=float)
+    if inplace:
+        np.cumsum(values, axis=1, out=values)
+        return ts
+    return _like(ts, np.cumsum(values, axis=1))
 
 def bollinger_bands_(ts: TS,
                     num_std: int) -> List:
@@ -94,7 +111,151 @@ def bollinger_bands_(ts: TS,
     return res
 
 
-    
+def _window_sum(x : np.array, window : int) -> np.array:
+    # Sums of x over the trailing windows of each column ending at rows window - 1 .. n - 1
+    cum = np.cumsum(x, axis=1)
+    res = cum[:, window - 1:].copy()
+    res[:, 1:] -= cum[:, :-window]
+    return res
+
+
+def _rolling_moments(ts : TS, window : int, squares : bool = True):
+    """
+    O(n) trailing window moments of each column ignoring nans, from cumulative sums
+    of the values shifted by their column mean (limits cancellation over long series).
+    returns (center, count, mean, mean of squares) of the shifted values, for the windows
+    ending at rows window - 1 .. n - 1 (mean of squares is None if not squares)
+    """
+    if window < 1:
+        raise Exception("window must be at least 1")
+    values = np.asarray(ts.values, dtype=float)
+    valid = ~np.isnan(values)
+    counts = valid.sum(axis=1, keepdims=True)
+    center = np.nansum(values, axis=1, keepdims=True) / np.maximum(counts, 1)
+    shifted = np.where(valid, values - center, 0.)
+    count = _window_sum(valid, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = _window_sum(shifted, window) / count
+        sq = _window_sum(shifted * shifted, window) / count if squares else None
+    return center, count, mean, sq
+
+
+def _aligned(ts : TS, tail : np.array, window : int, col_names : np.array = None) -> TS:
+    # TS aligned on ts: rows before the first full window are nan
+    res = np.full((tail.shape[0], ts.n_rows), np.nan)
+    res[:, window - 1:] = tail
+    return _like(ts, res, col_names)
+
+
+def rolling_mean_(ts : TS, window : int) -> TS:
+    """
+    mean of each column over the trailing window rows (current row included), nans ignored.
+    Same rows as ts, nan until the first full window.
+    """
+    if window > ts.n_rows:
+        return _aligned(ts, np.empty((ts.n_cols, 0)), ts.n_rows + 1)
+    center, count, mean, _ = _rolling_moments(ts, window, squares=False)
+    return _aligned(ts, mean + center, window)
+
+
+def rolling_std_(ts : TS, window : int) -> TS:
+    """
+    standard deviation (as np.nanstd) of each column over the trailing window rows.
+    Computed from cumulative sums in O(n): the variance is within ~1e-12 of the column spread
+    squared from the one of np.nanstd, so a window of equal values has a std of ~1e-6 of that
+    spread instead of 0.
+    """
+    if window > ts.n_rows:
+        return _aligned(ts, np.empty((ts.n_cols, 0)), ts.n_rows + 1)
+    _, _, mean, sq = _rolling_moments(ts, window)
+    return _aligned(ts, np.sqrt(np.maximum(sq - mean * mean, 0.)), window)
+
+
+def rolling_vol_(ts : TS, window : int) -> TS:
+    """
+    annualized volatility of each column over the trailing window rows (see rolling_std_),
+    call on log_ret_(ts) for the vol of prices
+    """
+    res = rolling_std_(ts, window)
+    res.values *= np.sqrt(ts.units_in_year())
+    return res
+
+
+def rolling_bollinger_bands_(ts : TS, window : int, num_std : float) -> TS:
+    """
+    bollinger_bands_ over the trailing window rows of each row.
+    returns a TS with columns <col>_mean, <col>_lower, <col>_upper for each column of ts
+    """
+    col_names = np.array([f"{c}_{band}" for c in ts.col_names for band in ('mean', 'lower', 'upper')])
+    if window > ts.n_rows:
+        return _aligned(ts, np.empty((3 * ts.n_cols, 0)), ts.n_rows + 1, col_names)
+    center, _, mean, sq = _rolling_moments(ts, window)
+    std = np.sqrt(np.maximum(sq - mean * mean, 0.))
+    mean += center
+    bands = np.empty((3 * ts.n_cols, mean.shape[1]))
+    bands[0::3] = mean
+    bands[1::3] = mean - num_std * std
+    bands[2::3] = mean + num_std * std
+    return _aligned(ts, bands, window, col_names)
+
+
+class RollingVol:
+    """
+    Trailing volatility index over the first column of a TS.
+    Log-returns and their cumulative sums are computed once (O(n)), then the volatility
+    of any trailing window is an O(1) lookup:
+    vol(i, window) == vol_(log_ret_(ts[i - window:i][-lookback:]))
+    up to float rounding of the cumulative sums (relative error ~1e-12). A grid price next to
+    a rounding boundary of DECIMALS can then round to the other side than with the recomputed
+    vol, so results are within that tolerance of a run without the index, not bit for bit equal.
+    exact: compute each lookup on the precomputed returns exactly like vol_(log_ret_()),
+           O(lookback), for runs that must equal the ones without the index bit for bit
+    """
+    def __init__(self, ts : TS, lookback : int = 1440, exact : bool = False) -> None:
+        prices = ts.column(0)
+        self.lookback = lookback
+        self.exact = exact
+        self.annualize = np.sqrt(ts.units_in_year())
+        self.log_ret = np.empty(len(prices))
+        self.log_ret[0] = np.nan
+        self.log_ret[1:] = np.log(prices[1:] / prices[:-1])
+        valid = np.isfinite(self.log_ret)
+        # Shift by the mean to limit cancellation in sum of squares - squared sum
+        shifted = np.where(valid, self.log_ret - np.nanmean(self.log_ret[valid]) if valid.any() else 0, 0)
+        self.cum_count = np.concatenate([[0], np.cumsum(valid)])
+        self.cum_sum = np.concatenate([[0], np.cumsum(shifted)])
+        self.cum_sq = np.concatenate([[0], np.cumsum(shifted ** 2)])
 
+    def vol(self, i : int, window : int) -> float:
+        """
+        annualized vol of the log-returns inside rows [i - min(window, lookback), i)
+        """
+        m = min(window, self.lookback)
+        if self.exact:
+            returns = self.log_ret[i - m:i].copy()
+            # log_ret_ of the slice has no return for its first row
+            returns[0] = np.nan
+            return np.nanstd(returns) * self.annualize
+        # returns of rows i - m + 1 .. i - 1
+        a = i - m + 1
+        count = self.cum_count[i] - self.cum_count[a]
+        if count <= 0:
+            return np.nan
+        s1 = (self.cum_sum[i] - self.cum_sum[a]) / count
+        s2 = (self.cum_sq[i] - self.cum_sq[a]) / count
+        return np.sqrt(max(s2 - s1 * s1, 0.)) * self.annualize
 
-    
\ No newline at end of file
+    def rolling(self, window : int) -> np.array:
+        """
+        vol(i, window) for every row i (nan where the window is not full), in one vectorized pass
+        """
+        m = min(window, self.lookback)
+        res = np.full(len(self.log_ret), np.nan)
+        i = np.arange(m, len(self.log_ret))
+        a = i - m + 1
+        count = self.cum_count[i] - self.cum_count[a]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            s1 = (self.cum_sum[i] - self.cum_sum[a]) / count
+            s2 = (self.cum_sq[i] - self.cum_sq[a]) / count
+            res[m:] = np.sqrt(np.maximum(s2 - s1 * s1, 0.)) * self.annualize
+        return res
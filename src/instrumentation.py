@@ -0,0 +1,107 @@
+import json
+import time
+import tqdm
+
+"""
+Opt-in instrumentation of simulation runs.
+The simulator calls lap(phase) after each phase of a tick, so that the time since the previous
+lap is added to that phase, and count() for its counters. When no RunStats is given the
+simulator only pays an `is not None` check per phase.
+"""
+
+PHASES = ('init', 'skip', 'arbitrage', 'reset', 'regrid', 'bookkeeping')
+COUNTERS = ('ticks', 'events', 'skipped_ticks', 'fills', 'regrids', 'book_copies')
+PROGRESS_EVERY = 10_000
+
+
+class RunStats:
+    """
+    Cumulative wall time per phase and counters of one run.
+    progress: show a tqdm bar with live throughput and ETA
+    """
+    def __init__(self, progress : bool = False) -> None:
+        self.progress = progress
+        self.times = dict.fromkeys(PHASES, 0.)
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self.wall = 0.
+        self.bar = None
+        self._start = None
+        self._last = None
+        self._pending = 0
+
+    def start(self, total : int = None) -> None:
+        """
+        Starts the wall clock (and the progress bar over total ticks)
+        """
+        self._start = self._last = time.perf_counter()
+        if self.progress:
+            self.bar = tqdm.tqdm(total=total, unit='tick', unit_scale=True, smoothing=0.1)
+
+    def lap(self, phase : str = None) -> None:
+        """
+        Adds the time since the previous lap to phase (only restarts the lap if phase is None)
+        """
+        now = time.perf_counter()
+        if phase is not None:
+            self.times[phase] += now - self._last
+        self._last = now
+
+    def count(self, counter : str, n : int = 1) -> None:
+        self.counts[counter] += n
+
+    def advance(self, n : int = 1) -> None:
+        """
+        Counts n processed ticks and moves the progress bar
+        """
+        self.counts['ticks'] += n
+        if self.bar is not None:
+            self._pending += n
+            if self._pending >= PROGRESS_EVERY:
+                self.bar.update(self._pending)
+                self._pending = 0
+
+    def elapsed(self) -> float:
+        """
+        Wall time so far, including the running part if started and not finished
+        """
+        if self._start is None:
+            return self.wall
+        return self.wall + time.perf_counter() - self._start
+
+    def finish(self) -> None:
+        self.wall = self.elapsed()
+        self._start = None
+        if self.bar is not None:
+            self.bar.update(self._pending)
+            self.bar.close()
+            self.bar = None
+            self._pending = 0
+
+    def summary(self) -> dict:
+        """
+        json-able summary: wall time, time and share per phase, counters and throughput
+        """
+        wall = self.elapsed()
+        tracked = sum(self.times.values())
+        return dict(wall=wall,
+                    ticks_per_sec=self.counts['ticks'] / wall if wall else None,
+                    phases={phase: dict(seconds=seconds,
+                                        share=seconds / wall if wall else None)
+                            for phase, seconds in self.times.items()},
+                    untracked=wall - tracked,
+                    counts=dict(self.counts))
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.summary(), **kwargs)
+
+    def __repr__(self) -> str:
+        return str(self)
+
+    def __str__(self) -> str:
+        wall = self.elapsed()
+        lines = [f"wall {wall:.3f}s, {self.counts['ticks']} ticks"]
+        for phase, seconds in self.times.items():
+            share = seconds / wall if wall else 0
+            lines.append(f"  {phase:<12} {seconds:10.4f}s {share:7.1%}")
+        lines.append('  ' + ', '.join(f"{k}={v}" for k, v in self.counts.items()))
+        return '\n'.join(lines)
@@ -1,11 +1,20 @@
-from typing import List, Tuple, Callable, Union
+from typing import List, Tuple, Callable, Union, Iterable
+import time
+from itertools import repeat
 import numpy as np
 from sortedcontainers import SortedList
 import tqdm
 
-from src.time_series import TS, col_concat
+from src.time_series import TS, col_concat, is_ohlc
+from src.order import OrderPool
 from src.order_book import Order, OrderBook, add_limit_order, build_book, arbitrage_order_book
-from src.fin_stats import bollinger_bands_, vol_, log_ret_
+from src.order_book import LadderOrderBook, build_ladder_book
+from src.fin_stats import bollinger_bands_, vol_, log_ret_, RollingVol
+from src.fill_log import FillLog
+from src.instrumentation import RunStats
+from src.checkpoint import Checkpoint
+from src.price_grid import PriceGrid
+from src.sparse_results import RunLength, SparseResults, BLOCK_ROWS
 
 DECIMALS = 6
 
@@ -20,14 +29,6 @@ def kandel_reset(quote : float,
         ) -> Tuple[Tuple[float, float], OrderBook]:
 
     # Easy case of initialization
-    bids = order_book.bids.copy() if (order_book.bids and order_book) else None
-    asks = order_book.asks.copy() if (order_book.asks and order_book) else None
- 
-    bids_map = {round(price, DECIMALS): round(price_grid[i + step_size], DECIMALS)\
-            for i, price in enumerate(price_grid[:(-step_size)])}
-    asks_map = {round(price, DECIMALS): round(price_grid[i - step_size], DECIMALS)\
-                          for i, price in enumerate(price_grid[step_size:], start=step_size)}
-
     if init:
         order_book = build_book(capital = quote + base * price, 
                    price_grid = price_grid,
@@ -43,6 +44,8 @@ def kandel_reset(quote : float,
         # If nothing happened and not initialization the do nothing return order book
         return ((quote, base), order_book)
     else:
+        # Dual offer maps are built once per grid
+        bids_map, asks_map = PriceGrid.of(price_grid).dual_maps(step_size)
         # Update quote and base amounts and update order_book
         for transaction in transactions:
             side = transaction.order_type
@@ -65,13 +68,120 @@ def kandel_reset(quote : float,
     return (quote, base), order_book
 
 
+def ladder_reset(quote : float,
+        base : float,
+        price : float,
+        price_grid : np.array,
+        step_size : int,
+        transactions : List = [],
+        order_book : LadderOrderBook = None,
+        init : bool = False
+        ) -> Tuple[Tuple[float, float], LadderOrderBook]:
+    """
+    Same as kandel_reset on a LadderOrderBook, the book is updated in place
+    and dual offers are placed step_size levels away from the filled level
+    (at the price kandel_reset would use, a KeyError past the ends of the grid as there)
+    """
+    if init:
+        order_book = build_ladder_book(capital = quote + base * price,
+                                       price_grid = price_grid,
+                                       initial_price = price,
+                                       order_book = order_book)
+        base_bought = sum(order_book.ask_qty[order_book.ask_live].tolist())
+        quote -= base_bought * price
+        base += base_bought
+
+        return ((quote, base), order_book)
+
+    if not transactions:
+        return (quote, base), order_book
+    # Dual prices come from the same maps as kandel_reset, so that both books place (or refuse)
+    # the same offers, a collapsed grid of equal prices included
+    bids_map, asks_map = PriceGrid.of(price_grid).dual_maps(step_size)
+    level_of = order_book.level_of
+    for transaction in transactions:
+        if transaction.order_type == 'bid':
+            # I bought
+            quote -= transaction.price * transaction.qty
+            base += transaction.qty
+            order_book.add_limit_order('ask', level_of[bids_map[transaction.price]], transaction.qty)
+        else:
+            # I sold
+            quote = quote + (transaction.price * transaction.qty)
+            base = base - transaction.qty
+            new_price = asks_map[transaction.price]
+            order_book.add_limit_order('bid', level_of[new_price],
+                                       transaction.qty * transaction.price / new_price)
+
+    return (quote, base), order_book
+
+
+def grid_vol(ts : TS) -> float:
+    """
+    Volatility used to size the price grid
+    """
+    # Take only last day to calculate vol for price_grid
+    return vol_(log_ret_(ts[-1440:])) / np.sqrt(365) # TODO A CORRIGER
+
+
+def regrid_vol(ts : TS,
+               i : int,
+               window : int,
+               vol_index : RollingVol = None,
+               offset : int = 0,
+               ticks : np.array = None) -> float:
+    """
+    grid_vol of ts[i - window: i], looked up in vol_index (built on the whole series,
+    ts row i being its row i + offset) when given.
+    ticks: tick number of each row of a gap-aware ts, i is then a tick and the vol is taken
+           on the forward filled ticks i - window .. i - 1
+    """
+    if ticks is not None:
+        return grid_vol(gap_window(ts, ticks, i - window, i))
+    if vol_index is None:
+        return grid_vol(ts[i - window: i])
+    return vol_index.vol(i + offset, window) / np.sqrt(365)
+
+
+def gap_window(ts : TS, ticks : np.array, start : int, stop : int) -> TS:
+    """
+    Forward filled ticks start..stop - 1 of a gap-aware ts (ticks: tick number of each row),
+    materialized for that window only
+    """
+    rows = np.searchsorted(ticks, np.arange(start, stop), side='right') - 1
+    return TS(row_names=ts.index[0] + np.arange(start, stop, dtype='int64') * ts.gaps.step,
+              unit=ts.unit,
+              n_rows=stop - start,
+              col_names=ts.col_names,
+              columns=[col[rows] for col in ts.columns],
+              index_dtype=ts.index_dtype)
+
+
 def geom_price_grid(ts : TS,
                     spot_price : float,
                     vol_mult : float = 1.645,
-                    n_points : int = 10) -> List:
+                    n_points : int = 10,
+                    vol_index : RollingVol = None,
+                    index : int = None) -> PriceGrid:
+    """
+    Price grid around spot_price sized on the vol of ts.
+    With a vol_index, ts is the slice ending before row index of the indexed series
+    and its vol is looked up instead of recomputed.
+    """
+    if vol_index is not None:
+        sig = vol_index.vol(index, ts.n_rows) / np.sqrt(365)
+    else:
+        sig = grid_vol(ts)
+    return geom_grid(spot_price, sig, vol_mult, n_points)
 
-    # Take only last day to calculate vol for price_grid
-    sig = vol_(log_ret_(ts[-1440:])) / np.sqrt(365) # TODO A CORRIGER
+
+def geom_grid(spot_price : float,
+              sig : float,
+              vol_mult : float = 1.645,
+              n_points : int = 10) -> PriceGrid:
+    """
+    Geometric grid of 2 * n_points + 1 prices centered on spot_price, spanning exp(+/- vol_mult * sig)
+    """
     #print(sig)
     rangeMultiplier = np.exp(vol_mult * sig)
     minPrice = spot_price * (1 / rangeMultiplier)
@@ -81,120 +191,869 @@ def geom_price_grid(ts : TS,
     bids = [spot_price / gridstep**i for i in range(1, n_points + 1)]
     asks = [spot_price * gridstep**i for i in range(1, n_points + 1)]
 
-    return bids[::-1] + [spot_price] + asks
-    
-def kandel_simulator(ts : Union[TS, List[str]],
-            quote : float,
-            base : float,
-            vol_mult : float,
-            n_points : int,
-            step_size : int,
-            order_book : Tuple[SortedList, SortedList],
-            window : int,
-            ) -> TS:
+    return PriceGrid(bids[::-1] + [spot_price] + asks)
     
-    # Results Initialization
-    quotes = np.zeros(ts.n_rows)
-    bases = np.zeros(ts.n_rows)
-    volume = np.zeros(ts.n_rows)
-    uptime = np.zeros(ts.n_rows)
-    tot_transactions = []
+def book_bounds(order_book : Union[OrderBook, LadderOrderBook]) -> Tuple[float, float, float, float]:
+    """
+    returns (best bid, best ask, lowest bid, highest ask) prices of the book,
+    missing sides are +/- inf so that they never trigger a crossing
+    """
+    if isinstance(order_book, LadderOrderBook):
+        return (order_book.best_bid_price, order_book.best_ask_price,
+                order_book.low_bid_price, order_book.high_ask_price)
+    bids, asks = order_book.bids, order_book.asks
+    return (bids[0].price if bids else -np.inf,
+            asks[0].price if asks else np.inf,
+            bids[-1].price if bids else np.inf,
+            asks[-1].price if asks else -np.inf)
 
-    quotes[:(1 if window == 0 else window + 1)] = quote
-    bases[:(1 if window == 0 else window + 1)] = base
-    volume[:(1 if window == 0 else window + 1)] = 0
-    uptime[:(1 if window == 0 else window + 1)] = 0
 
-    # First initialize the strategy
-    #avg, p_min, p_max = bollinger_bands_(ts[:window], num_std = std_mult) 
-    #price_grid = np.linspace(p_min, p_max, n_points)
+def next_crossing(prices : np.array,
+                  start : int,
+                  stop : int,
+                  best_bid : float,
+                  best_ask : float,
+                  chunk : int = 256) -> int:
+    """
+    returns the first index in [start, stop) where price reaches best_bid or best_ask, stop if none.
+    Searches in doubling chunks so that a close event does not scan the whole series
+    """
+    while start < stop:
+        end = min(start + chunk, stop)
+        segment = prices[start:end]
+        hits = np.flatnonzero((segment <= best_bid) | (segment >= best_ask))
+        if len(hits):
+            return start + int(hits[0])
+        start = end
+        chunk *= 2
+    return stop
 
-    spot_price = ts.values[0][window]
-    #print('Setup : ')
-    price_grid = geom_price_grid(ts[:window], spot_price,
-                                 vol_mult, n_points)
-    
-    
-    #price_grid = [98, 99, 100, 101, 102]
- 
-    (quote, base), order_book = kandel_reset(quote,
-                                            base,
-                                            spot_price,
-                                            price_grid,
-                                            step_size,
-                                            init = True)
-    
-    
-    #np.insert(bases, window, base)
 
-    
+class KandelState:
+    """
+    Strategy state carried from one tick to the next:
+    inventory, order book and current price grid
+    """
+    quote : float
+    base : float
+    order_book : Union[OrderBook, LadderOrderBook]
+    price_grid : PriceGrid
+
+    def __init__(self, quote : float, base : float,
+                 order_book : Union[OrderBook, LadderOrderBook],
+                 price_grid : PriceGrid) -> None:
+        self.quote = quote
+        self.base = base
+        self.order_book = order_book
+        self.price_grid = price_grid
+
+
+def kandel_init(ts : TS,
+                quote : float,
+                base : float,
+                vol_mult : float,
+                n_points : int,
+                step_size : int,
+                window : int,
+                ladder : bool = False,
+                vol_index : RollingVol = None,
+                ticks : np.array = None) -> KandelState:
+    """
+    Builds the first price grid on ts[:window] and the book at ts row window
+    (at tick window if ticks, the tick number of each row of a gap-aware ts, is given)
+    """
+    reset = ladder_reset if ladder else kandel_reset
+    if ticks is None:
+        spot_price = ts.column(0)[window]
+    else:
+        spot_price = ts.column(0)[np.searchsorted(ticks, window, side='right') - 1]
+    price_grid = geom_grid(spot_price, regrid_vol(ts, window, window, vol_index, ticks=ticks),
+                           vol_mult, n_points)
+    (quote, base), order_book = reset(quote,
+                                      base,
+                                      spot_price,
+                                      price_grid,
+                                      step_size,
+                                      init = True)
+    return KandelState(quote, base, order_book, price_grid)
+
+
+def kandel_gap(ts : TS,
+               ticks : np.array,
+               i : int,
+               state : KandelState,
+               vol_mult : float,
+               n_points : int,
+               step_size : int,
+               window : int,
+               ladder : bool = False,
+               pool : OrderPool = None,
+               fill_log : FillLog = None) -> Tuple[List, float]:
+    """
+    Runs the ticks missing before row i of a gap-aware ts (ticks: tick number of each row),
+    the price staying at the one of row i - 1. Only the ticks where the book is crossed
+    or a regrid is due change anything, the others are skipped.
+    state is updated in place, returns (fills, volume) of the gap
+    (fills are not kept with a fill_log, where they are logged at their tick)
+    """
+    reset = ladder_reset if ladder else kandel_reset
+    quote, base = state.quote, state.base
+    order_book, price_grid = state.order_book, state.price_grid
+    period = 1 if window == 0 else window
+    spot_price = ts.column(0)[i - 1]
+    fills, volume = [], 0.
+
+    t, end = max(ticks[i - 1] + 1, window + 1), ticks[i]
+    while t < end:
+        best_bid, best_ask, _, _ = book_bounds(order_book)
+        if best_bid < spot_price < best_ask:
+            # Nothing happens before the next regrid
+            t = -(-t // period) * period
+            if t >= end:
+                break
+        if ladder:
+            transactions = order_book.arbitrage(spot_price, pool)
+        else:
+            transactions, order_book = arbitrage_order_book(price=spot_price,
+                                                            order_book=order_book)
+        if transactions:
+            volume += sum([tr.price * tr.qty for tr in transactions])
+            if fill_log is None:
+                fills.extend(transactions)
+            else:
+                fill_log.add(t, transactions, [price_grid.level_of[tr.price] for tr in transactions])
+        (quote, base), order_book = reset(quote, base, spot_price, price_grid, step_size,
+                                          transactions, order_book, init = False)
+        if t % period == 0:
+            price_grid = geom_grid(spot_price, regrid_vol(ts, t, window, ticks=ticks),
+                                   vol_mult, n_points)
+            quote = quote + base * spot_price
+            base = 0
+            (quote, base), order_book = reset(quote, base, spot_price, price_grid, step_size,
+                                              transactions = [],
+                                              order_book = order_book if ladder else OrderBook(),
+                                              init = True)
+        if pool is not None:
+            pool.release(transactions)
+        t += 1
+
+    state.quote, state.base = quote, base
+    state.order_book, state.price_grid = order_book, price_grid
+    return fills, volume
+
+
+def kandel_run(ts : TS,
+               start : int,
+               state : KandelState,
+               results : Tuple[np.array, np.array, np.array, np.array],
+               tot_transactions : List,
+               vol_mult : float,
+               n_points : int,
+               step_size : int,
+               window : int,
+               ladder : bool = False,
+               event_skip : bool = False,
+               offset : int = 0,
+               vol_index : RollingVol = None,
+               fill_log : FillLog = None,
+               stats : RunStats = None,
+               ticks : np.array = None) -> KandelState:
+    """
+    Runs the strategy on rows start..ts.n_rows of ts, row i being tick i + offset of the whole series.
+    Rows before start are only used as history for regrids (at least window of them).
+    results: (quotes, bases, volume, uptime) arrays written at i - start
+    vol_index: regrid vols are looked up in it instead of recomputed
+    fill_log: fills are written to it instead of appending one list per tick to tot_transactions
+    stats: RunStats receiving phase times and counters, already started
+    ticks: tick number of each row of a gap-aware ts (see kandel_gap), rows are recorded
+           but not the missing ticks, whose fills are added to the next row
+    state is updated in place and returned
+    """
+    reset = ladder_reset if ladder else kandel_reset
+    quotes, bases, volume, uptime = results
+    quote, base = state.quote, state.base
+    order_book, price_grid = state.order_book, state.price_grid
+
+    prices = ts.column(0)
+    period = 1 if window == 0 else window
+    # Logged fills are dropped after their tick, their orders can be reused
+    pool = OrderPool() if (ladder and fill_log is not None) else None
+    if ticks is not None:
+        # Rows the event skip must stop at: a regrid is due at their tick or in the gap before them
+        stops = np.flatnonzero(ticks // period > np.concatenate([[-1], ticks[:-1]]) // period)
+        tick_of = ticks.tolist()
+    if stats is not None:
+        stats.lap()
+
     # For every unit of time starting at window
-    for i in range(window + 1, ts.n_rows):
+    i = start
+    while i < ts.n_rows:
+        if event_skip:
+            # Nothing happens until price crosses the book or next regrid
+            if ticks is None:
+                next_regrid = min(-(-(i + offset) // period) * period - offset, ts.n_rows)
+            else:
+                k = np.searchsorted(stops, i)
+                next_regrid = int(stops[k]) if k < len(stops) else ts.n_rows
+            best_bid, best_ask, low_bid, high_ask = book_bounds(order_book)
+            if ticks is not None and tick_of[i] - tick_of[i - 1] > 1 \
+                    and not (best_bid < prices[i - 1] < best_ask):
+                # The gap before row i starts crossed
+                next_regrid = i
+            j = next_crossing(prices, i, next_regrid, best_bid, best_ask)
+            if j > i:
+                quotes[i - start:j - start] = quote
+                bases[i - start:j - start] = base
+                if np.isinf(low_bid) or np.isinf(high_ask):
+                    uptime[i - start:j - start] = 0
+                else:
+                    segment = prices[i:j]
+                    uptime[i - start:j - start] = ~((segment > high_ask) | (segment < low_bid))
+                if fill_log is None:
+                    tot_transactions.extend(map(list, repeat((), j - i)))
+                if stats is not None:
+                    stats.count('skipped_ticks', j - i)
+                    stats.advance(j - i)
+                i = j
+            if stats is not None:
+                stats.lap('skip')
+            if i >= ts.n_rows:
+                break
+
         #print(ts.row_names[i])
-        spot_price = ts.values[0][i]
+        tick = i + offset
+        gap_fills, gap_volume = None, 0.
+        if ticks is not None:
+            tick, last_tick = tick_of[i], tick_of[i - 1]
+            if tick - last_tick > 1:
+                best_bid, best_ask, _, _ = book_bounds(order_book)
+                # Only run the gap if a regrid is due in it or the book is crossed at its price
+                run_gap = (tick - 1) // period > last_tick // period \
+                    or not (best_bid < prices[i - 1] < best_ask)
+            else:
+                run_gap = False
+            if run_gap:
+                state.quote, state.base = quote, base
+                state.order_book, state.price_grid = order_book, price_grid
+                gap_fills, gap_volume = kandel_gap(ts, ticks, i, state, vol_mult, n_points, step_size,
+                                                   window, ladder, pool, fill_log)
+                quote, base = state.quote, state.base
+                order_book, price_grid = state.order_book, state.price_grid
+        spot_price = prices[i]
         #if spot_price > price_grid[-1]:
         #    up_exit = up_exit[i-1] + 1
         #if spot_price < price_grid[0]:
         #    down_exit = down_exit[i-1] + 1
         
-        transactions, order_book = arbitrage_order_book(price=spot_price,
-                                                        order_book=order_book)
-        
-        uptime[i] = 0 if (not order_book.asks or\
-                    spot_price > order_book.asks[-1].price or\
-                    not order_book.bids or\
-                    spot_price < order_book.bids[-1].price) else 1
+        if ladder:
+            transactions = order_book.arbitrage(spot_price, pool)
+            uptime[i - start] = 1 if order_book.in_range(spot_price) else 0
+        else:
+            transactions, order_book = arbitrage_order_book(price=spot_price,
+                                                            order_book=order_book)
+
+            uptime[i - start] = 0 if (not order_book.asks or\
+                        spot_price > order_book.asks[-1].price or\
+                        not order_book.bids or\
+                        spot_price < order_book.bids[-1].price) else 1
+        if stats is not None:
+            stats.lap('arbitrage')
         
-        tot_transactions.append(transactions)
-        (quote, base), order_book = kandel_reset(quote, base,
-                                                 spot_price,
-                                                 price_grid,
-                                                 step_size,
-                                                 transactions,
-                                                 order_book,
-                                                 init = False)
+        if fill_log is None:
+            tot_transactions.append(transactions if not gap_fills else gap_fills + transactions)
+        elif transactions:
+            fill_log.add(tick, transactions, [price_grid.level_of[t.price] for t in transactions])
+        if stats is not None:
+            stats.lap('bookkeeping')
+        (quote, base), order_book = reset(quote, base,
+                                          spot_price,
+                                          price_grid,
+                                          step_size,
+                                          transactions,
+                                          order_book,
+                                          init = False)
+        if stats is not None:
+            stats.lap('reset')
         #spot_price = ts.values[0][i]
         #either every day or every window if there is enough data
-        if i % (1 if window == 0 else window) == 0:
+        if tick % period == 0:
             
             # if reset time then reset price_grid
             #print('Reset')
-            price_grid = geom_price_grid(ts[i - window: i], spot_price,
-                                        vol_mult, n_points)
+            if ticks is None:
+                sig = regrid_vol(ts, i, window, vol_index, offset)
+            else:
+                sig = regrid_vol(ts, tick, window, ticks=ticks)
+            price_grid = geom_grid(spot_price, sig, vol_mult, n_points)
             
             # Sell all base before rebalancing
             quote = quote + base * spot_price
             base = 0
-            (quote, base), order_book = kandel_reset(quote, base,
-                                                 spot_price,
-                                                 price_grid,
-                                                 step_size,
-                                                 transactions = [],
-                                                 order_book = OrderBook(),
-                                                 init = True)
+            (quote, base), order_book = reset(quote, base,
+                                              spot_price,
+                                              price_grid,
+                                              step_size,
+                                              transactions = [],
+                                              order_book = order_book if ladder else OrderBook(),
+                                              init = True)
             #price_grid = [98, 99, 100, 101, 102]
-            
+            if stats is not None:
+                stats.lap('regrid')
+                stats.count('regrids')
+                if not ladder:
+                    # build_book places one order (one deep copy) per grid point
+                    stats.count('book_copies', len(price_grid))
 
-        
-        
-        
-        quotes[i] = quote
-        bases[i] = base
-        volume[i] = sum([t.price * t.qty for t in transactions])
+        quotes[i - start] = quote
+        bases[i - start] = base
+        volume[i - start] = sum([t.price * t.qty for t in transactions])
+        if gap_volume:
+            volume[i - start] += gap_volume
+        if pool is not None:
+            pool.release(transactions)
+        if stats is not None:
+            stats.lap('bookkeeping')
+            stats.count('events')
+            stats.count('fills', len(transactions))
+            if not ladder:
+                # arbitrage and reset copy the book, then one copy per placed dual offer
+                stats.count('book_copies', 2 + len(transactions))
+            stats.advance()
+        i += 1
 
-    mtm = quotes + bases * ts.values[0]
-    
-    res = TS(row_names=ts.row_names,
-              unit = ts.unit,
-              n_rows=ts.n_rows,
-              col_names = ['quote', 'base', 'mtm', 'volume', 'uptime'],
-              values = np.array((quotes, bases, mtm, volume, uptime)))
-    res = col_concat(ts, res)
+    state.quote, state.base = quote, base
+    state.order_book, state.price_grid = order_book, price_grid
+    return state
+
+
+class KandelSimulator:
+    """
+    Push-based Kandel strategy: prices are fed one tick at a time (step) or by batches (step_batch)
+    and the state (order book, inventory, price grid) is kept between calls.
+    The prices needed for the regrid vols are written in place in a preallocated history buffer,
+    compacted to its last window rows when full, so a call never copies the history: a tick costs
+    the tick logic, plus O(min(window, 1440)) on regrids and O(window) once every
+    capacity - window ticks for the compaction.
+    The time of each call is kept in a ring of the last latency_size calls (see latency()).
+    kandel_simulator runs one over a whole ts (run), kandel_stream feeds it chunk by chunk.
+    unit, col_name, index_dtype: of the history TS the regrid vols are computed on
+    fill_log: FillLog receiving the fills, in place of the transactions lists
+    stats: RunStats receiving phase times and counters, already started
+    """
+    def __init__(self,
+                 quote : float,
+                 base : float,
+                 vol_mult : float,
+                 n_points : int,
+                 step_size : int,
+                 window : int,
+                 ladder : bool = True,
+                 event_skip : bool = True,
+                 unit : Tuple[int, str] = (1, 's'),
+                 col_name : str = 'price',
+                 index_dtype : str = 'datetime64[s]',
+                 fill_log : FillLog = None,
+                 stats : RunStats = None,
+                 capacity : int = 1 << 16,
+                 latency_size : int = 1 << 16) -> None:
+        self.quote, self.base = quote, base
+        self.vol_mult = vol_mult
+        self.n_points = n_points
+        self.step_size = step_size
+        self.window = window
+        self.ladder = ladder
+        self.event_skip = event_skip
+        self.fill_log = fill_log
+        self.stats = stats
+        # State after the init tick, None before
+        self.state = None
+        # Ticks done
+        self.tick = 0
+
+        # History buffer: row r is tick r + offset
+        self.unit = unit
+        self.col_names = np.array([col_name])
+        self.index_dtype = index_dtype
+        self.keep = max(window, 1)
+        capacity = max(capacity, window + 2)
+        self._prices = np.empty(capacity)
+        self._index = np.empty(capacity, dtype='int64')
+        self.n_history = 0
+        self.offset = 0
+        self._step_results = tuple(np.zeros(1) for _ in range(4))
+
+        self._latency = np.zeros(latency_size)
+        self.n_calls = 0
+        self.max_latency = 0.
+
+    def __repr__(self) -> str:
+        return f"KandelSimulator: tick {self.tick}, quote {self.quote}, base {self.base}"
+
+    @property
+    def order_book(self) -> Union[OrderBook, LadderOrderBook]:
+        return self.state.order_book if self.state else None
+
+    @property
+    def price_grid(self) -> PriceGrid:
+        return self.state.price_grid if self.state else None
+
+    def run(self,
+            ts : TS,
+            stop : int,
+            results : Tuple[np.array, np.array, np.array, np.array],
+            transactions : List,
+            offset : int = 0,
+            vol_index : RollingVol = None,
+            ticks : np.array = None) -> None:
+        """
+        Runs the rows of ts from the current tick to row stop - 1, row i being tick i + offset.
+        results: (quotes, bases, volume, uptime) arrays written from the current tick on,
+                 rows up to the init tick (window) keep the initial inventory
+        transactions: receives the list of fills of each row after the init (unless fill_log)
+        vol_index, ticks: see kandel_run
+        """
+        i = first = self.tick - offset
+        quotes, bases, volume, uptime = results
+        if self.state is None:
+            # The strategy starts on the row after tick window
+            start = self.window + 1 - offset if ticks is None else \
+                int(np.searchsorted(ticks, self.window, side='right'))
+            i = min(start, stop)
+            quotes[:i - first] = self.quote
+            bases[:i - first] = self.base
+            volume[:i - first] = 0
+            uptime[:i - first] = 0
+            if i == start:
+                self.state = kandel_init(ts, self.quote, self.base, self.vol_mult, self.n_points,
+                                         self.step_size, self.window, self.ladder, vol_index,
+                                         ticks=ticks)
+                if self.stats is not None:
+                    self.stats.lap('init')
+        if i < stop:
+            kandel_run(ts[:stop], i, self.state,
+                       (quotes[i - first:], bases[i - first:], volume[i - first:], uptime[i - first:]),
+                       transactions,
+                       self.vol_mult, self.n_points, self.step_size, self.window,
+                       ladder=self.ladder, event_skip=self.event_skip, offset=offset,
+                       vol_index=vol_index, fill_log=self.fill_log, stats=self.stats,
+                       ticks=None if ticks is None else ticks[:stop])
+        if self.state is not None:
+            self.quote, self.base = self.state.quote, self.state.base
+        self.tick = stop + offset
+
+    def _push(self, prices : np.array, index : np.array) -> TS:
+        """
+        Appends prices to the history buffer, returns the history as a TS (a view of the buffer)
+        """
+        n = len(prices)
+        if self.n_history + n > len(self._prices):
+            # Rows before the init are all kept, then the last window rows for the regrids
+            keep = self.n_history if self.state is None else min(self.keep, self.n_history)
+            rows = slice(self.n_history - keep, self.n_history)
+            if keep + n > len(self._prices):
+                size = max(2 * len(self._prices), keep + n)
+                prices_buffer, index_buffer = np.empty(size), np.empty(size, dtype='int64')
+                prices_buffer[:keep], index_buffer[:keep] = self._prices[rows], self._index[rows]
+                self._prices, self._index = prices_buffer, index_buffer
+            else:
+                self._prices[:keep] = self._prices[rows]
+                self._index[:keep] = self._index[rows]
+            self.offset += self.n_history - keep
+            self.n_history = keep
+        self._prices[self.n_history:self.n_history + n] = prices
+        self._index[self.n_history:self.n_history + n] = index
+        self.n_history += n
+        return TS(row_names=self._index[:self.n_history],
+                  unit=self.unit,
+                  n_rows=self.n_history,
+                  col_names=self.col_names,
+                  columns=[self._prices[:self.n_history]],
+                  index_dtype=self.index_dtype)
+
+    def _record(self, start : float) -> None:
+        latency = time.perf_counter() - start
+        self._latency[self.n_calls % len(self._latency)] = latency
+        self.n_calls += 1
+        self.max_latency = max(self.max_latency, latency)
+
+    def step(self, price : float, timestamp : int = None) -> Tuple[List, float, float, float, float]:
+        """
+        Runs one tick at price (timestamp: int64 in units of index_dtype, the tick number if None)
+        returns (fills, quote, base, volume, uptime) after the tick
+        """
+        start = time.perf_counter()
+        ts = self._push((price,), (self.tick if timestamp is None else timestamp,))
+        transactions = []
+        quotes, bases, volume, uptime = results = self._step_results
+        volume[0] = 0
+        self.run(ts, self.n_history, results, transactions, offset=self.offset)
+        self._record(start)
+        return transactions[0] if transactions else [], quotes[0], bases[0], volume[0], uptime[0]
+
+    def step_batch(self, prices : np.array, index : np.array = None) -> Tuple[List, dict]:
+        """
+        Runs one tick per price of prices (index: their int64 timestamps, tick numbers if None)
+        returns (transactions, results): one list of fills per tick after the strategy start
+        (as kandel_simulator, fill_log instead if set), and the quote, base, volume, uptime
+        arrays of the ticks
+        """
+        start = time.perf_counter()
+        n = len(prices)
+        if index is None:
+            index = np.arange(self.tick, self.tick + n)
+        ts = self._push(prices, index)
+        results = tuple(np.zeros(n) for _ in range(4))
+        transactions = []
+        self.run(ts, self.n_history, results, transactions, offset=self.offset)
+        self._record(start)
+        return (transactions if self.fill_log is None else self.fill_log,
+                dict(zip(('quote', 'base', 'volume', 'uptime'), results)))
+
+    def latency(self) -> dict:
+        """
+        Call times (seconds) over the last calls: count, mean, p50, p99, p999 and the max of all calls
+        """
+        times = self._latency[:min(self.n_calls, len(self._latency))]
+        if not len(times):
+            return dict(calls=0)
+        p50, p99, p999 = np.percentile(times, [50, 99, 99.9])
+        return dict(calls=self.n_calls, mean=float(times.mean()), p50=float(p50), p99=float(p99),
+                    p999=float(p999), max=self.max_latency)
+
+
+def strategy_start(ts : TS, window : int) -> int:
+    """
+    First row of ts run by the strategy, the rows before it keeping the initial inventory:
+    the row after tick window, or bar window for OHLC bars
+    """
+    if is_ohlc(ts):
+        return window
+    if ts.gaps is None:
+        return window + 1
+    return int(np.searchsorted(ts.gaps.ticks(ts.n_rows), window, side='right'))
+
+
+def kandel_simulator(ts : Union[TS, List[str]],
+            quote : float,
+            base : float,
+            vol_mult : float,
+            n_points : int,
+            step_size : int,
+            order_book : Tuple[SortedList, SortedList],
+            window : int,
+            ladder : bool = False,
+            event_skip : bool = False,
+            vol_index : RollingVol = None,
+            fill_log : FillLog = None,
+            stats : RunStats = None,
+            checkpoint_dir : str = None,
+            checkpoint_every : int = 1_000_000,
+            sparse : bool = False,
+            ) -> TS:
+    """
+    Runs the Kandel strategy over ts (a KandelSimulator run over all its rows)
+    ladder: use the array backed LadderOrderBook, updated in place, instead of OrderBook
+    event_skip: only run the tick logic when price reaches the best bid/ask or at a regrid,
+                ticks in between are filled with bulk writes (same output)
+    vol_index: RollingVol of ts used for the regrid vols, can be shared between runs
+    fill_log: FillLog receiving the fills, returned in place of the list of transactions per tick
+    stats: RunStats timing the phases of the run, its json-able summary is set as res.stats
+    A gap-aware ts (ts.gaps, see load_csv(gaps=True)) is run as its forward filled version
+    without building it: window and regrids count ticks, results are kept for the observed rows
+    only and the fills of the missing ticks (if any) are added to the next row.
+    vol_index is not used in that case.
+    checkpoint_dir: directory where the run is checkpointed every checkpoint_every rows and at
+                    the end (see checkpoint.Checkpoint). A run started on a directory holding a
+                    checkpoint of the same parameters resumes from it: after a crash, or on the
+                    same data with new rows appended, in which case only the new rows are run.
+                    fill_log is then reopened on the checkpointed fills.
+    sparse: keep quote, base, volume and uptime run-length encoded, res is then a SparseResults
+            (dense TS on slicing, mtm computed on demand) holding O(events) memory instead of
+            dense columns, with the same values. Rows are run into dense blocks of BLOCK_ROWS
+            rows encoded once done, so the tick loop is the same as a dense run's
+    OHLC bars (see time_series.ohlc_bars) are run by kandel_bar_simulator, window counting bars.
+    """
+    if is_ohlc(ts):
+        if checkpoint_dir is not None:
+            raise Exception("Bar runs are not checkpointed")
+        if sparse:
+            raise Exception("Bar runs are not kept sparse")
+        return kandel_bar_simulator(ts, quote, base, vol_mult, n_points, step_size, window,
+                                    ladder=ladder, event_skip=event_skip, vol_index=vol_index,
+                                    fill_log=fill_log, stats=stats)
+    ticks = None if ts.gaps is None else ts.gaps.ticks(ts.n_rows)
+    if ticks is not None:
+        vol_index = None
+    # Results Initialization
+    if sparse:
+        encoded = [RunLength(ts.n_rows) for _ in range(4)]
+        # Rows are run into dense blocks, encoded once done (checkpoints read and write the views)
+        quotes, bases, volume, uptime = (column.writer() for column in encoded)
+        blocks = [np.zeros(min(BLOCK_ROWS, ts.n_rows)) for _ in range(4)]
+    else:
+        quotes = np.zeros(ts.n_rows)
+        bases = np.zeros(ts.n_rows)
+        volume = np.zeros(ts.n_rows)
+        uptime = np.zeros(ts.n_rows)
+    tot_transactions = []
+    sim = KandelSimulator(quote, base, vol_mult, n_points, step_size, window,
+                          ladder=ladder, event_skip=event_skip, fill_log=fill_log, stats=stats)
+
+    checkpoint = None
+    if checkpoint_dir is not None:
+        params = dict(quote=float(quote), base=float(base), vol_mult=float(vol_mult),
+                      n_points=int(n_points), step_size=int(step_size), window=int(window),
+                      ladder=bool(ladder), gaps=ticks is not None)
+        checkpoint = Checkpoint(checkpoint_dir, params)
+        resumed = checkpoint.load(ts, (quotes, bases, volume, uptime), fill_log)
+        if resumed is not None:
+            sim.tick, sim.state, transactions = resumed
+            if transactions is not None:
+                tot_transactions = transactions
+    if stats is not None:
+        # Rows up to tick window keep the initial inventory
+        stats.start(total=max(ts.n_rows - max(strategy_start(ts, window), sim.tick), 0))
+
+    # Checkpointed runs go by segments of rows, the state carries over from one to the next
+    while sim.tick < ts.n_rows:
+        i = sim.tick
+        stop = ts.n_rows if checkpoint is None else min(i + checkpoint_every, ts.n_rows)
+        n_transactions = len(tot_transactions)
+        if sparse:
+            for k in range(i, stop, BLOCK_ROWS):
+                end = min(k + BLOCK_ROWS, stop)
+                dense = [block[:end - k] for block in blocks]
+                for values in dense:
+                    values[:] = 0
+                sim.run(ts, end, dense, tot_transactions, vol_index=vol_index, ticks=ticks)
+                for column, values in zip((quotes, bases, volume, uptime), dense):
+                    column[k:end] = values
+        else:
+            sim.run(ts, stop, (quotes[i:stop], bases[i:stop], volume[i:stop], uptime[i:stop]),
+                    tot_transactions, vol_index=vol_index, ticks=ticks)
+        if checkpoint is not None:
+            checkpoint.save(ts, i, stop, sim.state, (quotes, bases, volume, uptime),
+                            tot_transactions[n_transactions:], fill_log)
+    order_book = sim.order_book
+    if fill_log is not None:
+        tot_transactions = fill_log
+
+    if sparse:
+        res = SparseResults(ts, *encoded)
+    else:
+        mtm = quotes + bases * ts.column(0)
+
+        res = ts.like(['quote', 'base', 'mtm', 'volume', 'uptime'],
+                      columns = [quotes, bases, mtm, volume, uptime])
+        res = col_concat(ts, res)
+    if stats is not None:
+        stats.lap('bookkeeping')
+        stats.finish()
+        res.stats = stats.summary()
     return tot_transactions, res, order_book
 
 
+def kandel_stream(chunks : Iterable[TS],
+                  quote : float,
+                  base : float,
+                  vol_mult : float,
+                  n_points : int,
+                  step_size : int,
+                  window : int,
+                  ladder : bool = False,
+                  event_skip : bool = False,
+                  fill_log : FillLog = None,
+                  stats : RunStats = None):
+    """
+    Generator version of kandel_simulator over consecutive TS chunks (see time_series.iter_csv),
+    fed to a KandelSimulator. Only the last window rows are kept between chunks for the regrids,
+    so memory does not grow with the length of the data.
+    Yields (transactions, res, order_book) for each chunk, res having the same columns as
+    the kandel_simulator result for the chunk rows.
+    fill_log: FillLog receiving the fills, yielded in place of the chunk transactions
+    stats: RunStats accumulated over the chunks, its summary so far is set as res.stats
+    """
+    if stats is not None:
+        stats.start()
+    sim = None
+    for chunk in chunks:
+        if chunk.gaps is not None:
+            raise Exception("kandel_stream needs forward filled chunks, not gap-aware ones")
+        if sim is None:
+            sim = KandelSimulator(quote, base, vol_mult, n_points, step_size, window,
+                                  ladder=ladder, event_skip=event_skip,
+                                  unit=chunk.unit, col_name=chunk.col_names[0],
+                                  index_dtype=chunk.index_dtype, fill_log=fill_log, stats=stats,
+                                  capacity=max(2 * chunk.n_rows, 1 << 16))
+        transactions, results = sim.step_batch(chunk.column(0), chunk.index)
+
+        mtm = results['quote'] + results['base'] * chunk.column(0)
+        res = chunk.like(['quote', 'base', 'mtm', 'volume', 'uptime'],
+                         columns = [results['quote'], results['base'], mtm,
+                                    results['volume'], results['uptime']])
+        res = col_concat(chunk, res)
+        if stats is not None:
+            stats.lap('bookkeeping')
+            res.stats = stats.summary()
+        yield transactions, res, sim.order_book
+    if stats is not None:
+        stats.finish()
+
+
+BAR_PATHS = ('auto', 'olhc', 'ohlc')
+
+
+def bar_path(bars : TS, path : str = 'auto') -> np.array:
+    """
+    (n_bars, 4) prices each OHLC bar is swept through, in order:
+    'olhc' open, low, high, close; 'ohlc' open, high, low, close;
+    'auto' olhc for the bars closing at or above their open, ohlc for the others
+    """
+    if path not in BAR_PATHS:
+        raise Exception(f"Unknown bar path {path}, use one of {BAR_PATHS}")
+    open_, high, low, close = (bars.column(c) for c in range(4))
+    res = np.stack([open_, low, high, close], axis=1)
+    down = np.zeros(bars.n_rows, dtype=bool) if path == 'olhc' else \
+        np.ones(bars.n_rows, dtype=bool) if path == 'ohlc' else close < open_
+    res[down, 1], res[down, 2] = high[down], low[down]
+    return res
 
-    
 
+def kandel_bar_simulator(bars : TS,
+                         quote : float,
+                         base : float,
+                         vol_mult : float,
+                         n_points : int,
+                         step_size : int,
+                         window : int,
+                         ladder : bool = False,
+                         event_skip : bool = False,
+                         path : str = 'auto',
+                         vol_index : RollingVol = None,
+                         fill_log : FillLog = None,
+                         stats : RunStats = None):
+    """
+    Runs the Kandel strategy over OHLC bars (see time_series.ohlc_bars), window counting bars.
+    Each bar is swept as 4 ticks along its path (see bar_path), the book being arbitraged and
+    the dual offers placed at each of them. The strategy starts at the open of bar window and
+    regrids at the open of the bars multiple of window, on the vol of the previous closes,
+    as a tick run does at the first tick of the same time span.
+    Rows are the bars: quote and base after the close, volume of the bar ticks, share of the
+    bar ticks in the book range as uptime. Returns the same as kandel_simulator, the
+    transactions being one list per bar.
+    vol_index: RollingVol of the bar closes
+    event_skip: bars whose low and high stay inside the best bid and ask are not swept
+    """
+    reset = ladder_reset if ladder else kandel_reset
+    closes = bars['close']
+    paths = bar_path(bars, path)
+    lows, highs = bars.column('low'), bars.column('high')
+    n_rows = bars.n_rows
+    period = 1 if window == 0 else window
+    pool = OrderPool() if (ladder and fill_log is not None) else None
+    if stats is not None:
+        stats.start(total=max(n_rows - window, 0))
 
+    quotes = np.zeros(n_rows)
+    bases = np.zeros(n_rows)
+    volume = np.zeros(n_rows)
+    uptime = np.zeros(n_rows)
+    tot_transactions = []
+    quotes[:window] = quote
+    bases[:window] = base
+    order_book = None
+
+    if window < n_rows:
+        # The open of bar window is the init tick
+        spot_price = paths[window][0]
+        price_grid = geom_grid(spot_price, regrid_vol(closes, window, window, vol_index),
+                               vol_mult, n_points)
+        (quote, base), order_book = reset(quote, base, spot_price, price_grid, step_size, init = True)
+        if stats is not None:
+            stats.lap('init')
+
+    i = window
+    while i < n_rows:
+        if event_skip and i > window:
+            # Nothing happens until a bar reaches the best bid/ask or next regrid
+            next_regrid = min(-(-i // period) * period, n_rows)
+            best_bid, best_ask, low_bid, high_ask = book_bounds(order_book)
+            j = min(next_crossing(lows, i, next_regrid, best_bid, np.inf),
+                    next_crossing(highs, i, next_regrid, -np.inf, best_ask))
+            if j > i:
+                quotes[i:j] = quote
+                bases[i:j] = base
+                # The bar ticks are strictly inside the best bid and ask
+                uptime[i:j] = 0 if (np.isinf(low_bid) or np.isinf(high_ask)) else 1
+                if fill_log is None:
+                    tot_transactions.extend(map(list, repeat((), j - i)))
+                if stats is not None:
+                    stats.count('skipped_ticks', j - i)
+                    stats.advance(j - i)
+                i = j
+            if stats is not None:
+                stats.lap('skip')
+            if i >= n_rows:
+                break
+
+        bar_transactions = []
+        bar_volume = 0.
+        n_up = n_ticks = 0
+        for k, spot_price in enumerate(paths[i].tolist()):
+            if i == window and k == 0:
+                continue
+            if ladder:
+                transactions = order_book.arbitrage(spot_price, pool)
+            else:
+                transactions, order_book = arbitrage_order_book(price=spot_price,
+                                                                order_book=order_book)
+            _, _, low_bid, high_ask = book_bounds(order_book)
+            n_up += low_bid <= spot_price <= high_ask
+            n_ticks += 1
+            if transactions:
+                bar_volume += sum([t.price * t.qty for t in transactions])
+                if fill_log is None:
+                    bar_transactions.extend(transactions)
+                else:
+                    fill_log.add(i, transactions, [price_grid.level_of[t.price] for t in transactions])
+            (quote, base), order_book = reset(quote, base, spot_price, price_grid, step_size,
+                                              transactions, order_book, init = False)
+            if k == 0 and i % period == 0:
+                price_grid = geom_grid(spot_price, regrid_vol(closes, i, window, vol_index),
+                                       vol_mult, n_points)
+                # Sell all base before rebalancing
+                quote = quote + base * spot_price
+                base = 0
+                (quote, base), order_book = reset(quote, base, spot_price, price_grid, step_size,
+                                                  transactions = [],
+                                                  order_book = order_book if ladder else OrderBook(),
+                                                  init = True)
+                if stats is not None:
+                    stats.count('regrids')
+            if stats is not None:
+                stats.count('fills', len(transactions))
+            if pool is not None:
+                pool.release(transactions)
+        if stats is not None:
+            stats.lap('arbitrage')
+
+        if fill_log is None:
+            tot_transactions.append(bar_transactions)
+        quotes[i] = quote
+        bases[i] = base
+        volume[i] = bar_volume
+        uptime[i] = n_up / n_ticks
+        if stats is not None:
+            stats.count('events')
+            stats.advance()
+        i += 1
 
+    mtm = quotes + bases * closes.column(0)
+    res = bars.like(['quote', 'base', 'mtm', 'volume', 'uptime'],
+                    columns = [quotes, bases, mtm, volume, uptime])
+    res = col_concat(bars, res)
+    if stats is not None:
+        stats.lap('bookkeeping')
+        stats.finish()
+        res.stats = stats.summary()
+    return tot_transactions if fill_log is None else fill_log, res, order_book
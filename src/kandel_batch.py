@@ -0,0 +1,301 @@
+from typing import Tuple, Union
+import numpy as np
+import pandas as pd
+
+from src.time_series import TS, col_concat
+from src.kandel import regrid_vol, geom_grid
+from src.fin_stats import RollingVol
+
+"""
+Batched Kandel simulator: K configs sharing the same prices and window are run in one pass.
+The K books are kept as (config x grid level) arrays, every tick compares the shared price
+with all the books at once and only the ticks where some book is crossed (or a regrid) run
+the fill logic, vectorized over the crossed configs.
+Arithmetic follows kandel_simulator operation by operation and rounding uses python's round,
+so each config gives the same result as kandel_simulator(..., ladder=True).
+"""
+
+DECIMALS = 6
+MAX_SCAN = 1 << 22
+
+
+def _round(values : np.array) -> np.array:
+    """
+    Same as python round(v, DECIMALS) on each value.
+    np.round scales then rounds, which can pick the wrong side next to a half,
+    those values go through python round
+    """
+    values = np.asarray(values, dtype=float)
+    scaled = values * 10 ** DECIMALS
+    res = np.round(values, DECIMALS)
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-3
+    if near_half.any():
+        res[near_half] = [round(v, DECIMALS) for v in values[near_half].tolist()]
+    return res
+
+
+class KandelBatch:
+    """
+    State of K Kandel strategies: inventories (K,) and ladder books (K, n_levels).
+    Configs with fewer points leave their upper levels empty (nan prices).
+    """
+    def __init__(self,
+                 quote : np.array,
+                 base : np.array,
+                 vol_mult : np.array,
+                 n_points : np.array,
+                 step_size : np.array) -> None:
+        self.n_configs = len(vol_mult)
+        self.quote = np.asarray(quote, dtype=float).copy()
+        self.base = np.asarray(base, dtype=float).copy()
+        self.vol_mult = np.asarray(vol_mult, dtype=float)
+        self.n_points = np.asarray(n_points, dtype=int)
+        self.step_size = np.asarray(step_size, dtype=int)
+        n_levels = 2 * int(self.n_points.max()) + 1
+        shape = (self.n_configs, n_levels)
+        self.grid = np.full(shape, np.nan)
+        self.levels = np.full(shape, np.nan)
+        self.bid_qty = np.zeros(shape)
+        self.ask_qty = np.zeros(shape)
+        self.bid_live = np.zeros(shape, dtype=bool)
+        self.ask_live = np.zeros(shape, dtype=bool)
+        self.best_bid = np.full(self.n_configs, -np.inf)
+        self.best_ask = np.full(self.n_configs, np.inf)
+        self.low_bid = np.full(self.n_configs, np.inf)
+        self.high_ask = np.full(self.n_configs, -np.inf)
+
+    def refresh(self, rows : np.array = slice(None)) -> None:
+        """
+        Recomputes best and extreme prices of the books in rows, missing sides are +/- inf
+        """
+        levels = self.levels[rows]
+        bids = self.bid_live[rows]
+        asks = self.ask_live[rows]
+        self.best_bid[rows] = np.where(bids, levels, -np.inf).max(axis=1)
+        self.low_bid[rows] = np.where(bids, levels, np.inf).min(axis=1)
+        self.best_ask[rows] = np.where(asks, levels, np.inf).min(axis=1)
+        self.high_ask[rows] = np.where(asks, levels, -np.inf).max(axis=1)
+
+    def rebuild(self, spot_price : float, sig : float) -> None:
+        """
+        New grids centered on spot_price and new books for all configs (ladder_reset with init)
+        """
+        for k in range(self.n_configs):
+            n = self.n_points[k]
+            self.grid[k, :2 * n + 1] = geom_grid(spot_price, sig, self.vol_mult[k], n)
+        self.levels[:] = _round(self.grid)
+        self.bid_live[:] = False
+        self.ask_live[:] = False
+
+        # initial_inventory_allocation with the price in range
+        capital = self.quote + self.base * spot_price
+        rows = np.arange(self.n_configs)
+        p_min = self.grid[:, 0]
+        p_max = self.grid[rows, 2 * self.n_points]
+        inverse_concentrator = 2 * np.sqrt(spot_price) - spot_price / np.sqrt(p_max) - np.sqrt(p_min)
+        concentrator_val = capital * (1 / inverse_concentrator)
+        capital_A = concentrator_val * (1 / np.sqrt(spot_price) - 1 / np.sqrt(p_max))
+        capital_B = concentrator_val * (np.sqrt(spot_price) - np.sqrt(p_min))
+
+        # Spot is the middle point of the grid: n bids below, n asks above
+        level = np.arange(self.grid.shape[1])[None, :]
+        n = self.n_points[:, None]
+        self.bid_live[:] = level < n
+        self.ask_live[:] = (level > n) & (level <= 2 * n)
+        self.bid_qty[:] = np.where(self.bid_live, _round(capital_B[:, None] / n * 1 / self.grid), 0)
+        self.ask_qty[:] = np.where(self.ask_live, _round(capital_A / self.n_points)[:, None], 0)
+
+        base_bought = np.zeros(self.n_configs)
+        for j in range(self.grid.shape[1]):
+            base_bought = np.where(self.ask_live[:, j], base_bought + self.ask_qty[:, j], base_bought)
+        self.quote = self.quote - base_bought * spot_price
+        self.base = self.base + base_bought
+        self.refresh()
+
+    def fill(self, price : float, rows : np.array) -> np.array:
+        """
+        Arbitrages the books in rows against price and places the dual offers (ladder_reset),
+        returns the traded volume and uptime of each row
+        """
+        levels = self.levels[rows]
+        bids_filled = self.bid_live[rows] & (levels >= price)
+        asks_filled = self.ask_live[rows] & (levels <= price)
+        self.bid_live[rows] &= ~bids_filled
+        self.ask_live[rows] &= ~asks_filled
+        self.refresh(rows)
+        # uptime is measured on the book after arbitrage, before the dual offers
+        up = (self.low_bid[rows] <= price) & (price <= self.high_ask[rows])
+        volume = np.zeros(len(rows))
+
+        # Same transaction order as arbitrage: bids from best down then asks from best up
+        for side, filled, columns in (('bid', bids_filled, np.flatnonzero(bids_filled.any(axis=0))[::-1]),
+                                      ('ask', asks_filled, np.flatnonzero(asks_filled.any(axis=0)))):
+            for j in columns:
+                mask = filled[:, j]
+                k = rows[mask]
+                px = self.levels[k, j]
+                step = self.step_size[k]
+                if side == 'bid':
+                    qty = self.bid_qty[k, j]
+                    self.quote[k] -= px * qty
+                    self.base[k] += qty
+                    target = j + step
+                    new_qty = qty
+                    live, book = self.ask_live, self.ask_qty
+                else:
+                    qty = self.ask_qty[k, j]
+                    self.quote[k] = self.quote[k] + (px * qty)
+                    self.base[k] = self.base[k] - qty
+                    target = j - step
+                    if (target < 0).any():
+                        raise Exception('Dual offer out of the price grid')
+                    new_qty = qty * px / self.levels[k, target]
+                    live, book = self.bid_live, self.bid_qty
+                if (target > 2 * self.n_points[k]).any():
+                    raise Exception('Dual offer out of the price grid')
+                volume[mask] += px * qty
+                new_qty = _round(new_qty)
+                book[k, target] = np.where(live[k, target], book[k, target] + new_qty, new_qty)
+                live[k, target] = True
+        self.refresh(rows)
+        return volume, up
+
+    def in_range(self, price : float) -> np.array:
+        return (self.low_bid <= price) & (price <= self.high_ask)
+
+
+def _next_event(prices : np.array,
+                start : int,
+                stop : int,
+                best_bid : np.array,
+                best_ask : np.array,
+                chunk : int = 64) -> int:
+    """
+    First index in [start, stop) where price crosses any of the books, stop if none
+    """
+    max_chunk = max(MAX_SCAN // len(best_bid), 1)
+    while start < stop:
+        end = min(start + chunk, stop)
+        segment = prices[start:end, None]
+        hits = np.flatnonzero(((segment <= best_bid) | (segment >= best_ask)).any(axis=1))
+        if len(hits):
+            return start + int(hits[0])
+        start = end
+        chunk = min(chunk * 2, max_chunk)
+    return stop
+
+
+def kandel_batch_simulator(ts : TS,
+                           quote : Union[float, np.array],
+                           base : Union[float, np.array],
+                           vol_mult : np.array,
+                           n_points : np.array,
+                           step_size : np.array,
+                           window : int,
+                           record : bool = True,
+                           vol_index : RollingVol = None
+                           ) -> Tuple[pd.DataFrame, dict]:
+    """
+    Runs K = len(vol_mult) Kandel configs over ts in one pass.
+    quote and base are scalars or one value per config, window is shared.
+    Returns (summary, results): summary has one row per config with final mtm, total volume,
+    number of fill ticks and uptime ratio (as sweep.run_config, without the Sharpe ratio), results holds the
+    (K, n_rows) quote/base/volume/uptime arrays if record else None (see batch_result).
+    vol_index: RollingVol of ts used for the regrid vols
+    """
+    if ts.gaps is not None:
+        raise Exception("kandel_batch_simulator needs a forward filled ts, expand its gaps first")
+    n_configs = len(vol_mult)
+    # A dual offer more than n_points + 1 levels away can fall off the grid, which would abort
+    # the whole batch mid run, and kandel_simulator has no dual offers for step_size 0:
+    # such configs are refused upfront
+    n_points, step_size = np.asarray(n_points, dtype=int), np.asarray(step_size, dtype=int)
+    bad = np.flatnonzero((n_points < 1) | (step_size < 1) | (step_size > n_points + 1))
+    if len(bad):
+        raise Exception("Configs need n_points >= 1 and 1 <= step_size <= n_points + 1, got " +
+                        ", ".join(f"config {k} (n_points={n_points[k]}, step_size={step_size[k]})"
+                                  for k in bad.tolist()))
+    batch = KandelBatch(np.broadcast_to(quote, n_configs),
+                        np.broadcast_to(base, n_configs),
+                        vol_mult, n_points, step_size)
+    prices = ts.column(0)
+    n_rows = ts.n_rows
+    period = 1 if window == 0 else window
+    start = window + 1
+
+    if record:
+        quotes = np.empty((n_configs, n_rows))
+        bases = np.empty((n_configs, n_rows))
+        volume = np.zeros((n_configs, n_rows))
+        uptime = np.zeros((n_configs, n_rows))
+        quotes[:, :start] = batch.quote[:, None]
+        bases[:, :start] = batch.base[:, None]
+    tot_volume = np.zeros(n_configs)
+    n_fills = np.zeros(n_configs, dtype=int)
+    tot_uptime = np.zeros(n_configs)
+
+    batch.rebuild(prices[window], regrid_vol(ts, window, window, vol_index))
+
+    i = start
+    while i < n_rows:
+        # Nothing happens until price crosses one of the books or next regrid
+        next_regrid = min(-(-i // period) * period, n_rows)
+        j = _next_event(prices, i, next_regrid, batch.best_bid, batch.best_ask)
+        if j > i:
+            segment = prices[None, i:j]
+            up = (segment >= batch.low_bid[:, None]) & (segment <= batch.high_ask[:, None])
+            tot_uptime += up.sum(axis=1)
+            if record:
+                quotes[:, i:j] = batch.quote[:, None]
+                bases[:, i:j] = batch.base[:, None]
+                uptime[:, i:j] = up
+            i = j
+            if i >= n_rows:
+                break
+
+        spot_price = prices[i]
+        rows = np.flatnonzero((spot_price <= batch.best_bid) | (spot_price >= batch.best_ask))
+        up = batch.in_range(spot_price)
+        if len(rows):
+            traded, up[rows] = batch.fill(spot_price, rows)
+        tot_uptime += up
+        if len(rows):
+            tot_volume[rows] += traded
+            n_fills[rows] += traded != 0
+            if record:
+                volume[rows, i] = traded
+        if record:
+            uptime[:, i] = up
+
+        if i % period == 0:
+            # Sell all base before rebalancing
+            batch.quote = batch.quote + batch.base * spot_price
+            batch.base = np.zeros(n_configs)
+            batch.rebuild(spot_price, regrid_vol(ts, i, window, vol_index))
+
+        if record:
+            quotes[:, i] = batch.quote
+            bases[:, i] = batch.base
+        i += 1
+
+    summary = pd.DataFrame(dict(vol_mult=batch.vol_mult,
+                                n_points=batch.n_points,
+                                step_size=batch.step_size,
+                                window=window,
+                                mtm=batch.quote + batch.base * prices[-1],
+                                volume=tot_volume,
+                                n_fills=n_fills,
+                                uptime=tot_uptime / (n_rows - start) if start < n_rows else np.nan))
+    results = dict(quote=quotes, base=bases, volume=volume, uptime=uptime) if record else None
+    return summary, results
+
+
+def batch_result(ts : TS, results : dict, k : int) -> TS:
+    """
+    Result TS of config k, with the same columns as kandel_simulator's
+    """
+    quotes, bases = results['quote'][k], results['base'][k]
+    mtm = quotes + bases * ts.column(0)
+    res = ts.like(['quote', 'base', 'mtm', 'volume', 'uptime'],
+                  columns = [quotes, bases, mtm, results['volume'][k], results['uptime'][k]])
+    return col_concat(ts, res)
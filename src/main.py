@@ -1,6 +1,7 @@
 from time_series import load_csv
 from order_book import OrderBook
 from kandel import kandel_simulator
+from results_io import write_results
 
 
 def main():
@@ -22,7 +23,8 @@ def main():
                 step_size=step_size,
                 order_book= order_book,
                 window= window)
-    res.to_pandas().to_csv('results/simul_results.csv')
+    # Read back with results_io.read_results(path, columns, start, stop)
+    write_results(res, 'results/simul_results.tsz')
 
     
 
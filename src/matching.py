@@ -0,0 +1,208 @@
+from collections import deque
+from typing import List, Tuple
+import numpy as np
+import pandas as pd
+from sortedcontainers import SortedDict, SortedList
+
+from src.order import Order, TOLERANCE, DECIMALS, next_order_id
+from src.time_series import TS
+from src.fill_log import SIDES, SIDE_NAMES
+
+"""
+Matching engine over a limit order book with price-time priority.
+Each side maps prices to levels in a SortedDict (O(log n) level lookup, best level in O(1)),
+a level is a FIFO queue of resting orders so that the first order placed at a price fills first,
+and a taker can partially fill the order at the head of a level.
+Fills are returned as a structured array (MATCH_DTYPE), one row per (taker, maker) match.
+replay runs the trades of a TS (price and traded volume columns) against the book:
+the volume of each trade caps what fills, to model volume-limited fills.
+"""
+
+# side is the taker side: 'bid' buys from the asks, 'ask' sells to the bids
+MATCH_DTYPE = np.dtype([('tick', 'i8'),
+                        ('side', 'i1'),
+                        ('price', 'f8'),
+                        ('qty', 'f8'),
+                        ('maker_id', 'i8'),
+                        ('taker_id', 'i8')])
+
+
+def fills_to_pandas(fills : np.array) -> pd.DataFrame:
+    """
+    MATCH_DTYPE fills as a DataFrame with side names
+    """
+    res = pd.DataFrame(fills)
+    res['side'] = SIDE_NAMES[fills['side']]
+    return res
+
+
+class MatchingEngine:
+    """
+    Limit order book with price-time priority.
+    bids and asks: SortedDict price -> deque of resting [order_id, qty], oldest first
+    """
+    def __init__(self) -> None:
+        self.bids = SortedDict()
+        self.asks = SortedDict()
+        # order_id -> (side, price, entry) of the resting orders
+        self.orders = {}
+
+    @classmethod
+    def from_order_book(cls, order_book) -> 'MatchingEngine':
+        """
+        Engine resting the orders of an OrderBook (or LadderOrderBook), best levels first
+        """
+        engine = cls()
+        # A side emptied by arbitrage_order_book is None
+        for order in list(order_book.bids or []) + list(order_book.asks or []):
+            engine._rest(order.order_type, order.price, order.qty, order.order_id)
+        return engine
+
+    def __repr__(self) -> str:
+        return f"MatchingEngine: {len(self.orders)} orders, best bid {self.best_bid()}, best ask {self.best_ask()}"
+
+    def __len__(self) -> int:
+        return len(self.orders)
+
+    def best_bid(self) -> float:
+        return self.bids.peekitem(-1)[0] if self.bids else -np.inf
+
+    def best_ask(self) -> float:
+        return self.asks.peekitem(0)[0] if self.asks else np.inf
+
+    def depth(self, side : str) -> List[Tuple[float, float]]:
+        """
+        (price, total qty) of each level of side, best first
+        """
+        levels = self.bids if side == 'bid' else self.asks
+        prices = reversed(levels) if side == 'bid' else iter(levels)
+        return [(p, sum(entry[1] for entry in levels[p])) for p in prices]
+
+    def resting(self, side : str) -> SortedList:
+        """
+        Resting orders of side as Orders (an OrderBook side)
+        """
+        levels = self.bids if side == 'bid' else self.asks
+        return SortedList(Order.exact(side, entry[1], price)
+                          for price, level in levels.items() for entry in level)
+
+    def _rest(self, side : str, price : float, qty : float, order_id : int) -> None:
+        levels = self.bids if side == 'bid' else self.asks
+        level = levels.get(price)
+        if level is None:
+            level = levels[price] = deque()
+        entry = [order_id, qty]
+        level.append(entry)
+        self.orders[order_id] = (side, price, entry)
+
+    def cancel(self, order_id : int) -> float:
+        """
+        Removes a resting order, returns its remaining qty (0 if it is not resting)
+        """
+        if order_id not in self.orders:
+            return 0.
+        side, price, entry = self.orders.pop(order_id)
+        levels = self.bids if side == 'bid' else self.asks
+        level = levels[price]
+        level.remove(entry)
+        if not level:
+            del levels[price]
+        return entry[1]
+
+    def _sweep(self, side : str, qty : float, limit : float, taker_id : int, tick : int,
+               fills : List) -> float:
+        """
+        Fills a taker of side for up to qty against the opposite levels priced within limit,
+        appends the fills (MATCH_DTYPE tuples) and returns the qty left
+        """
+        side_code = SIDES[side]
+        if side == 'bid':
+            levels, index, crosses = self.asks, 0, lambda p: p <= limit
+        else:
+            levels, index, crosses = self.bids, -1, lambda p: p >= limit
+        while qty > TOLERANCE and levels:
+            price, level = levels.peekitem(index)
+            if not crosses(price):
+                break
+            while level and qty > TOLERANCE:
+                entry = level[0]
+                traded = min(entry[1], qty)
+                fills.append((tick, side_code, price, traded, entry[0], taker_id))
+                qty -= traded
+                if entry[1] - traded > TOLERANCE:
+                    # Partial fill, the order keeps its place at the head of the level
+                    entry[1] = round(entry[1] - traded, DECIMALS)
+                else:
+                    level.popleft()
+                    del self.orders[entry[0]]
+            if not level:
+                del levels[price]
+        return qty
+
+    def market(self, side : str, qty : float, tick : int = 0) -> np.array:
+        """
+        Market order of side for qty: sweeps the opposite side best level first until qty is filled
+        or the side is empty, returns the fills
+        """
+        if side not in SIDES:
+            raise Exception(f"order_type {side} not bid nor ask")
+        fills = []
+        self._sweep(side, qty, np.inf if side == 'bid' else -np.inf, next_order_id(), tick, fills)
+        return np.array(fills, dtype=MATCH_DTYPE)
+
+    def limit(self, side : str, price : float, qty : float, tick : int = 0,
+              rest : bool = True) -> Tuple[int, np.array]:
+        """
+        Limit order of side for qty at price: fills against the opposite levels up to price,
+        the rest is placed at price (dropped if not rest, immediate or cancel).
+        returns (order_id, fills)
+        """
+        if side not in SIDES:
+            raise Exception(f"order_type {side} not bid nor ask")
+        price = round(price, DECIMALS)
+        order_id = next_order_id()
+        fills = []
+        left = self._sweep(side, round(qty, DECIMALS), price, order_id, tick, fills)
+        if rest and left > TOLERANCE:
+            self._rest(side, price, round(left, DECIMALS), order_id)
+        return order_id, np.array(fills, dtype=MATCH_DTYPE)
+
+    def replay(self,
+               ts : TS,
+               volume : str = 'volume',
+               price : str = None,
+               participation : float = 1.,
+               tick_offset : int = 0) -> np.array:
+        """
+        Runs the trades of ts against the book, row i being a trade at its price (first column
+        unless price is given) for its volume column (base qty) at tick i + tick_offset.
+        A trade at or below the best bid sells to the bids priced at or above it, one at or above
+        the best ask buys from the asks priced at or below it, for at most participation times
+        its volume. Rows that do not cross the book are skipped in vectorized chunks.
+        returns the fills of all the rows
+        """
+        prices = np.asarray(ts.column(0 if price is None else price))
+        volumes = np.asarray(ts.column(volume))
+        fills = []
+        i = 0
+        while i < ts.n_rows:
+            best_bid, best_ask = self.best_bid(), self.best_ask()
+            # Next row crossing the book, in doubling chunks
+            chunk = 256
+            while i < ts.n_rows:
+                segment = prices[i:i + chunk]
+                hits = np.flatnonzero((segment <= best_bid) | (segment >= best_ask))
+                if len(hits):
+                    i += int(hits[0])
+                    break
+                i += len(segment)
+                chunk *= 2
+            if i >= ts.n_rows:
+                break
+            trade_price = float(prices[i])
+            qty = float(volumes[i]) * participation
+            if qty > TOLERANCE:
+                side = 'ask' if trade_price <= best_bid else 'bid'
+                self._sweep(side, qty, trade_price, -1, i + tick_offset, fills)
+            i += 1
+        return np.array(fills, dtype=MATCH_DTYPE)
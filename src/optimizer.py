@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+from typing import Dict, List, Tuple
+import numpy as np
+import pandas as pd
+
+from src.time_series import TS, load_csv
+from src.sweep import param_grid, sweep
+
+"""
+Multi-fidelity parameter search of kandel_simulator configs by successive halving.
+Every config is first run on a cheap version of the data (a short prefix, or the data
+downsampled to one row every step rows), the best 1 / eta by the objective are kept and run
+again on eta times more data, until the survivors run on the whole series.
+Each rung is a sweep over a process pool. The history of every rung is returned so that
+the pruning can be checked (see rank_agreement).
+Run from the repo root:
+    python -m src.optimizer data/ETHUSDC-1s-2024-09-15.csv --grid '{"vol_mult": [0.2, 0.4, 0.8],
+        "n_points": [5, 10, 20], "step_size": [1, 2], "window": [1800, 3600]}' --objective sharpe
+"""
+
+FIDELITIES = ('slice', 'downsample')
+
+
+def fidelities(n_rows : int,
+               n_configs : int,
+               eta : int = 3,
+               min_rows : int = 1,
+               fidelity : str = 'slice') -> List[Tuple[int, int]]:
+    """
+    (n_rows, step) of the data of each rung, cheapest first: rung r of R runs on 1 / eta ** (R - r)
+    of the rows, with enough rungs to get down to one config. Rungs with less than min_rows rows
+    are dropped, the last rung is always the whole series.
+    fidelity: 'slice' runs on the first rows, 'downsample' on every step rows of the whole series
+    """
+    if fidelity not in FIDELITIES:
+        raise Exception(f"Unknown fidelity {fidelity}, use one of {FIDELITIES}")
+    n_rungs = 1 + max(int(np.ceil(np.log(max(n_configs, 1)) / np.log(eta))), 0)
+    res = []
+    for r in range(n_rungs - 1):
+        scale = eta ** (n_rungs - 1 - r)
+        if n_rows // scale >= min_rows:
+            res.append((n_rows // scale, 1) if fidelity == 'slice' else (n_rows, scale))
+    return res + [(n_rows, 1)]
+
+
+def rung_ts(ts : TS, n_rows : int, step : int = 1) -> TS:
+    """
+    First n_rows of ts, one row every step rows (a view), its unit scaled by step
+    """
+    if step == 1:
+        return ts[:n_rows]
+    res = ts[:n_rows:step]
+    res.unit = (ts.unit[0] * step, ts.unit[1])
+    return res
+
+
+def rung_config(config : Dict, step : int = 1) -> Dict:
+    """
+    config on data downsampled by step: its window counts the downsampled rows
+    """
+    return dict(config, window=config['window'] // step)
+
+
+def successive_halving(ts : TS,
+                       configs : List[Dict],
+                       quote : float,
+                       base : float,
+                       objective : str = 'mtm',
+                       eta : int = 3,
+                       fidelity : str = 'slice',
+                       min_rows : int = None,
+                       n_workers : int = None,
+                       ladder : bool = True,
+                       event_skip : bool = True) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Successive halving of configs (see sweep.param_grid) on ts, keeping the best 1 / eta of the
+    configs at each rung by objective, a column of sweep.run_config (mtm, sharpe, volume, ...),
+    higher being better. Configs that fail are ranked last.
+    min_rows: fewest rows of a rung, twice the longest window by default
+    returns (ranking, history): the sweep rows of the last rung best first, indexed by
+    config_id (position in configs), and one row per config and rung with the rung data
+    (n_rows, step), the objective, the rank in the rung and whether the config was kept
+    """
+    if min_rows is None:
+        min_rows = 2 * (max(config['window'] for config in configs) + 1)
+    rungs = fidelities(ts.n_rows, len(configs), eta, min_rows, fidelity)
+    alive = list(range(len(configs)))
+    history = []
+    for r, (n_rows, step) in enumerate(rungs):
+        res = sweep(rung_ts(ts, n_rows, step),
+                    [rung_config(configs[k], step) for k in alive],
+                    quote, base, n_workers=n_workers, ladder=ladder, event_skip=event_skip)
+        res.index = pd.Index(alive, name='config_id')
+        score = res[objective] if objective in res else pd.Series(np.nan, index=res.index)
+        if 'error' in res:
+            score = score.where(res['error'].isna())
+        rank = score.rank(ascending=False, method='first', na_option='bottom').astype(int)
+        last = r == len(rungs) - 1
+        n_keep = len(alive) if last else max(1, int(np.ceil(len(alive) / eta)))
+        history.append(pd.DataFrame(dict(rung=r,
+                                         n_rows=n_rows,
+                                         step=step,
+                                         objective=score,
+                                         rank=rank,
+                                         kept=rank <= n_keep,
+                                         error=res['error'] if 'error' in res else None)))
+        res = res.assign(rank=rank).sort_values('rank')
+        alive = list(res.index[:n_keep])
+    history = pd.concat(history).reset_index()
+    configs_df = pd.DataFrame(configs).rename_axis('config_id').reset_index()
+    history = configs_df.merge(history, on='config_id').sort_values(['rung', 'rank'])
+    # Last rung runs on the whole series with the configs as given
+    ranking = res.drop(columns='rank')
+    return ranking, history.reset_index(drop=True)
+
+
+def rank_agreement(history : pd.DataFrame) -> pd.DataFrame:
+    """
+    For each rung, the Spearman correlation of its objective with the next rung's over the
+    configs run on both, and the rank in the rung of the next rung's best config: a low
+    correlation, or a best config ranked close to the cut (n_kept), means the rung prunes on noise
+    """
+    rows = []
+    rungs = sorted(history['rung'].unique())
+    for r, next_r in zip(rungs[:-1], rungs[1:]):
+        cur = history[history['rung'] == r].set_index('config_id')
+        nxt = history[history['rung'] == next_r].set_index('config_id')
+        both = cur.join(nxt[['objective', 'rank']], rsuffix='_next', how='inner')
+        ranks = both[['objective', 'objective_next']].rank()
+        spearman = ranks.corr().iloc[0, 1] if len(both) > 1 else np.nan
+        best_next_rank = both.loc[both['rank_next'].idxmin(), 'rank'] if len(both) else np.nan
+        rows.append(dict(rung=r, n_rows=cur['n_rows'].iloc[0], step=cur['step'].iloc[0],
+                         n_configs=len(cur), n_kept=int(cur['kept'].sum()),
+                         spearman_next=spearman, best_next_rank=best_next_rank))
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('data', help='csv path')
+    parser.add_argument('--grid', required=True, help='json {param: [values]} or path to a json file')
+    parser.add_argument('--quote', type=float, default=75000)
+    parser.add_argument('--base', type=float, default=0)
+    parser.add_argument('--objective', default='mtm')
+    parser.add_argument('--eta', type=int, default=3)
+    parser.add_argument('--fidelity', default='slice', choices=FIDELITIES)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--out', default='results/halving.csv', help='history csv')
+    args = parser.parse_args()
+
+    if os.path.exists(args.grid):
+        with open(args.grid) as f:
+            grid = json.load(f)
+    else:
+        grid = json.loads(args.grid)
+    ts = load_csv(args.data, cache=True)
+    ranking, history = successive_halving(ts, param_grid(grid), args.quote, args.base,
+                                          objective=args.objective, eta=args.eta,
+                                          fidelity=args.fidelity, n_workers=args.workers)
+    history.to_csv(args.out, index=False)
+    print(rank_agreement(history).to_string(index=False))
+    print(ranking.head(10).to_string())
+
+
+if __name__ == '__main__':
+    main()
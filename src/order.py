@@ -1,14 +1,29 @@
 from math import isclose
-import uuid
+from itertools import count
+from typing import List
 
 TOLERANCE = 1E-7
 DECIMALS = 6
 
+# Cheap monotonically increasing order ids
+_order_ids = count()
+
+
+def next_order_id() -> int:
+    return next(_order_ids)
+
+
 class Order:
+    """
+    Limit order. Slotted, with an integer id and a sort key precomputed from
+    side and price: in a SortedList bids are sorted best (highest) first,
+    asks best (lowest) first.
+    """
+    __slots__ = ('order_type', 'qty', '_price', 'key', 'order_id')
+
     order_type : str
     qty : float
-    price : float
-    uuid : uuid.UUID
+    order_id : int
 
     def __init__(self,
                  order_type : str,
@@ -19,13 +34,43 @@ class Order:
         self.order_type = order_type
         self.qty = round(qty, DECIMALS)
         self.price = round(price, DECIMALS)
-        self.uuid = uuid.uuid4()
-    
+        self.order_id = next(_order_ids)
+
+    @classmethod
+    def exact(cls,
+              order_type : str,
+              qty : float,
+              price : float) -> 'Order':
+        """
+        Builds an order without validation nor rounding, for values already on the book
+        """
+        order = cls.__new__(cls)
+        order.order_type = order_type
+        order.qty = qty
+        order._price = price
+        order.key = -price if order_type == 'bid' else price
+        order.order_id = next(_order_ids)
+        return order
+
+    @property
+    def price(self) -> float:
+        return self._price
+
+    @price.setter
+    def price(self, price : float) -> None:
+        self._price = price
+        self.key = -price if self.order_type == 'bid' else price
+
+    @property
+    def uuid(self) -> int:
+        # Kept for callers of the former uuid attribute
+        return self.order_id
+
     def copy(self):
         return Order(self.order_type,
                      self.qty,
                      self.price)
-    
+
     def test(self, obj):
         if not isinstance(obj, Order):
             print('not an order')
@@ -35,26 +80,53 @@ class Order:
             type=self.order_type,
             quantity=self.qty,
             price=self.price
-        ) 
-    
+        )
+
     def __repr__(self):
         return str(self)
-    
+
     def __eq__(self, obj):
-        return isinstance(obj, Order) and obj.order_type == self.order_type \
-            and isclose(obj.price, self.price, rel_tol=TOLERANCE) \
-            and isclose(obj.qty, self.qty, rel_tol=TOLERANCE) \
-            #and obj.uuid == self.uuid
+        if not isinstance(obj, Order) or obj.order_type != self.order_type:
+            return False
+        # Exact match first, isclose only when needed
+        return (obj._price == self._price or isclose(obj._price, self._price, rel_tol=TOLERANCE)) \
+            and (obj.qty == self.qty or isclose(obj.qty, self.qty, rel_tol=TOLERANCE))
+
+    __hash__ = None
 
     def __lt__(self, obj):
         if not isinstance(obj, Order):
             return False
         if self.order_type == obj.order_type:
-            return (self.price < obj.price) ^ (self.order_type == 'bid')
+            return self.key < obj.key
         else:
-            return (self.price < obj.price)
+            return (self._price < obj._price)
+
+
+class OrderPool:
+    """
+    Free list of Order objects, so that short lived orders (fills that are logged
+    then dropped) are reused instead of allocated. Released orders must not be referenced anymore.
+    """
+    def __init__(self) -> None:
+        self.free = []
 
+    def acquire(self,
+                order_type : str,
+                qty : float,
+                price : float) -> Order:
+        """
+        Same as Order.exact, reusing a released order if any
+        """
+        if not self.free:
+            return Order.exact(order_type, qty, price)
+        order = self.free.pop()
+        order.order_type = order_type
+        order.qty = qty
+        order._price = price
+        order.key = -price if order_type == 'bid' else price
+        order.order_id = next(_order_ids)
+        return order
 
-            
-    
-    
\ No newline at end of file
+    def release(self, orders : List[Order]) -> None:
+        self.free.extend(orders)
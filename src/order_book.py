@@ -9,9 +9,11 @@ from tabulate import tabulate
 from termcolor import colored
 
 
-from src.order import Order
+from src.order import Order, OrderPool
+from src.matching import MatchingEngine
+from src.fill_log import SIDES
 from src.utils_inventory import initial_inventory_allocation
-from src.utils_grid import cursor
+from src.price_grid import PriceGrid
 
 
 TOLERANCE = 1E-7
@@ -138,60 +140,35 @@ def add_limit_order(order : Order,
 def execute_market_order(price : float,
                         qty : float, 
                         order_book : OrderBook)\
-                        -> Tuple[List[Order], OrderBook]:
+                        -> Tuple[List[Tuple[float, float]], Tuple[SortedList, SortedList]]:
     
     """
     Market order needs to buy/sell all up to the price in the order or to qty executed
-    returns ([(price, qty) for each executed order], new_order_book)
+    returns ([(price, qty) for each executed order], (bids, asks) left)
+    (see match_market_order, which returns the fills as Orders and the book left as an OrderBook)
     """
+    trades, order_book = match_market_order(price, qty, order_book)
+    return ([(t.price, t.qty) for t in trades], (order_book.bids, order_book.asks))
 
-    to_trade = qty
-    trades = []
-    bids = order_book.bids.copy() if (order_book and order_book.bids) else SortedList()
-    asks = order_book.asks.copy() if (order_book and order_book.asks) else SortedList()
-    #if bids
-    if len(bids) > 0:
-        # if price greater than best bid nothind
-        if price > bids[0].price:
-            pass
-        else:
-            bid = bids[0]
-            while bid and price <= bid.price and to_trade > TOLERANCE:
-                #If not enough then all order is executed
-                if to_trade >= bid.qty:
-                    executed_order = bids.pop(0)
-                    executed_order = (executed_order.price, executed_order.qty)
-                    to_trade -= executed_order[1]
-                else:
-                    # If enough then to_trade is qty at this price
-                    executed_order = Order('bid', bid.price, to_trade)
-                    bids[0].qty -= to_trade
-                    to_trade = 0
-                    
-                bid = bids[0] if len(bids) > 0 else None
-                trades.append(executed_order)
-    if len(asks) > 0:
-        # if price greater than best bid nothind
-        if price < asks[0].price:
-            pass
-        else:
-            ask = asks[0]
-            while ask and price >= asks[0].price and to_trade > TOLERANCE:
-                #If not enough then all order is executed
-                if to_trade >= ask.qty:
-                    executed_order = asks.pop(0)
-                    executed_order = (executed_order.price, executed_order.qty)
-                    to_trade -= executed_order[1]
-                else:
-                    # If enough then to_trade is qty at this price
-                    executed_order = Order('ask', ask.price, to_trade)
-                    asks[0].qty -= to_trade
-                    to_trade = 0
-                    
-                ask = asks[0] if len(asks) > 0 else None
-                trades.append(executed_order)
-    
-    return (trades, (bids, asks))
+def match_market_order(price : float,
+                       qty : float,
+                       order_book : OrderBook) -> Tuple[List[Order], OrderBook]:
+    """
+    Market order needs to buy/sell all up to the price in the order or to qty executed:
+    sells to the bids priced at or above price, then buys the asks priced at or below price
+    with the qty left, through a MatchingEngine (order_book is not modified).
+    returns (executed orders: resting side, price and filled qty, new order_book)
+    """
+    engine = MatchingEngine.from_order_book(order_book) if order_book else MatchingEngine()
+    _, fills = engine.limit('ask', price, qty, rest=False)
+    left = qty - fills['qty'].sum()
+    if left > TOLERANCE:
+        _, bought = engine.limit('bid', price, left, rest=False)
+        fills = np.concatenate([fills, bought])
+    trades = [Order.exact('bid' if side == SIDES['ask'] else 'ask', q, p)
+              for side, p, q in zip(fills['side'].tolist(), fills['price'].tolist(),
+                                    fills['qty'].tolist())]
+    return (trades, OrderBook(engine.resting('bid'), engine.resting('ask')))
 
 def arbitrage_order_book(price : float,
                          order_book : OrderBook) -> Tuple[List[Order], OrderBook]:
@@ -269,9 +246,9 @@ def build_book(capital : float,
         list_quantity_B = np.array([initial_capital_B / (nb_price_points - 1)] * (nb_price_points - 1)) / np.array(
             sliced_price_grid)
         bids = SortedList([Order('bid', q, p) for p, q in zip(sliced_price_grid, list(list_quantity_B))])
-        return Order(bids = bids)
+        return OrderBook(bids = bids)
 
-    floor_price0_index, floor_price0 = cursor(initial_price, price_grid)
+    floor_price0_index, floor_price0 = PriceGrid.of(price_grid).cursor(initial_price)
     # print("floorprice", floor_price0_index, floor_price0)
     # Checking floor price index is None even if it's not possible with two previous ifs  (we never know)
     if floor_price0_index is None:
@@ -296,4 +273,228 @@ def build_book(capital : float,
 
     # print(nb_asks, nb_bids)
 
-    return order_book
\ No newline at end of file
+    return order_book
+
+class LadderOrderBook:
+    """
+    Order book stored as per-level arrays keyed by grid index.
+    Levels are preallocated once per price grid and updated in place,
+    bids and asks live in separate arrays so a level can hold both sides.
+    Exposes the same bids/asks/to_pandas/__str__ API as OrderBook.
+    """
+    prices : np.array
+    bid_qty : np.array
+    ask_qty : np.array
+    bid_live : np.array
+    ask_live : np.array
+
+    def __init__(self, price_grid : List) -> None:
+        self.prices = np.empty(0)
+        self.reset(price_grid)
+
+    def reset(self, price_grid : List) -> None:
+        """
+        Empties the book and sets level prices from price_grid, reusing the arrays
+        when the number of levels is unchanged
+        """
+        price_grid = PriceGrid.of(price_grid)
+        n_levels = len(price_grid)
+        if n_levels != len(self.prices):
+            self.prices = np.empty(n_levels)
+            self.bid_qty = np.zeros(n_levels)
+            self.ask_qty = np.zeros(n_levels)
+            self.bid_live = np.zeros(n_levels, dtype=bool)
+            self.ask_live = np.zeros(n_levels, dtype=bool)
+        # Rounded prices and their levels come from the grid, built once per regrid
+        self.grid = price_grid
+        self.prices[:] = price_grid.keys
+        self._prices = price_grid.keys
+        self.level_of = price_grid.level_of
+        self.bid_qty[:] = 0
+        self.ask_qty[:] = 0
+        self.bid_live[:] = False
+        self.ask_live[:] = False
+        self._refresh()
+
+    def _refresh(self) -> None:
+        # Rescans all levels, only on reset and copy: single level changes update the bounds
+        bids = np.flatnonzero(self.bid_live)
+        asks = np.flatnonzero(self.ask_live)
+        self._bid_bounds(int(bids[-1]) if len(bids) else -1, int(bids[0]) if len(bids) else -1)
+        self._ask_bounds(int(asks[0]) if len(asks) else -1, int(asks[-1]) if len(asks) else -1)
+
+    def _bid_bounds(self, best : int, low : int) -> None:
+        # Cache best/extreme levels and prices as python scalars for per-tick checks (-1: no bids)
+        self.best_bid = best
+        self.low_bid = low
+        self.best_bid_price = self._prices[best] if best >= 0 else -np.inf
+        self.low_bid_price = self._prices[low] if low >= 0 else np.inf
+
+    def _ask_bounds(self, best : int, high : int) -> None:
+        self.best_ask = best
+        self.high_ask = high
+        self.best_ask_price = self._prices[best] if best >= 0 else np.inf
+        self.high_ask_price = self._prices[high] if high >= 0 else -np.inf
+
+    @property
+    def bids(self) -> SortedList:
+        return SortedList([Order.exact('bid', q, p) for p, q in
+                           zip(self.prices[self.bid_live].tolist(),
+                               self.bid_qty[self.bid_live].tolist())])
+
+    @property
+    def asks(self) -> SortedList:
+        return SortedList([Order.exact('ask', q, p) for p, q in
+                           zip(self.prices[self.ask_live].tolist(),
+                               self.ask_qty[self.ask_live].tolist())])
+
+    def __repr__(self):
+        return str(self)
+
+    def __str__(self):
+        return str(OrderBook(self.bids, self.asks))
+
+    def to_pandas(self):
+        return OrderBook(self.bids, self.asks).to_pandas()
+
+    def copy(self):
+        res = LadderOrderBook(self.grid)
+        res.bid_qty[:] = self.bid_qty
+        res.ask_qty[:] = self.ask_qty
+        res.bid_live[:] = self.bid_live
+        res.ask_live[:] = self.ask_live
+        res._refresh()
+        return res
+
+    def crossed(self, price : float) -> bool:
+        """
+        True if price reaches the best bid or the best ask
+        """
+        return price <= self.best_bid_price or price >= self.best_ask_price
+
+    def in_range(self, price : float) -> bool:
+        """
+        True if both sides are quoted and price is between lowest bid and highest ask
+        """
+        return self.low_bid_price <= price <= self.high_ask_price
+
+    def add_limit_order(self, order_type : str, level : int, qty : float) -> None:
+        """
+        Adds qty at grid level, merging with the resting order if any (same as add_limit_order)
+        """
+        qty = round(qty, DECIMALS)
+        if order_type == 'bid':
+            if self.bid_live[level]:
+                self.bid_qty[level] += qty
+            else:
+                self.bid_qty[level] = qty
+                self.bid_live[level] = True
+                if self.best_bid < 0:
+                    self._bid_bounds(level, level)
+                elif not self.low_bid <= level <= self.best_bid:
+                    self._bid_bounds(max(level, self.best_bid), min(level, self.low_bid))
+        elif order_type == 'ask':
+            if self.ask_live[level]:
+                self.ask_qty[level] += qty
+            else:
+                self.ask_qty[level] = qty
+                self.ask_live[level] = True
+                if self.best_ask < 0:
+                    self._ask_bounds(level, level)
+                elif not self.best_ask <= level <= self.high_ask:
+                    self._ask_bounds(min(level, self.best_ask), max(level, self.high_ask))
+        else:
+            raise Exception('order_type not recognized')
+
+    def arbitrage(self, price : float, pool : OrderPool = None) -> List[Order]:
+        """
+        In place version of arbitrage_order_book
+        Pops all bids then all asks up until price, returns transactions
+        pool: transactions are taken from it instead of allocated
+        """
+        if not self.crossed(price):
+            return []
+        transactions = []
+        prices = self._prices
+        filled_order = pool.acquire if pool is not None else Order.exact
+        # Levels are popped from the best one, the first level left is the new best
+        best = -1
+        for i in range(self.best_bid, -1, -1):
+            if not self.bid_live[i]:
+                continue
+            if price > prices[i]:
+                best = i
+                break
+            transactions.append(filled_order('bid', float(self.bid_qty[i]), prices[i]))
+            self.bid_live[i] = False
+        self._bid_bounds(best, self.low_bid if best >= 0 else -1)
+        best = -1
+        if self.best_ask >= 0:
+            for i in range(self.best_ask, len(prices)):
+                if not self.ask_live[i]:
+                    continue
+                if price < prices[i]:
+                    best = i
+                    break
+                transactions.append(filled_order('ask', float(self.ask_qty[i]), prices[i]))
+                self.ask_live[i] = False
+        self._ask_bounds(best, self.high_ask if best >= 0 else -1)
+        return transactions
+
+
+def build_ladder_book(capital : float,
+                      price_grid : List,
+                      initial_price : float,
+                      order_book : LadderOrderBook = None
+                      ) -> LadderOrderBook:
+    """
+    Same as build_book but fills a LadderOrderBook, reusing order_book's arrays if given
+    """
+    nb_price_points = len(price_grid)
+
+    if capital <= 0:
+        raise Exception("Capital must be positive.")
+
+    if nb_price_points < 2:
+        raise Exception("Price grid must contains at least two points.")
+
+    if initial_price <= 0:
+        raise Exception("Current price need to be superior to 0")
+
+    if order_book is None:
+        order_book = LadderOrderBook(price_grid)
+    else:
+        order_book.reset(price_grid)
+
+    initial_capital_A, initial_capital_B = initial_inventory_allocation(
+        initial_price,
+        price_grid[0],
+        price_grid[-1],
+        capital)
+
+    # Initial price is left of range, we only have asks !
+    if initial_price <= price_grid[0]:
+        for i in range(1, nb_price_points):
+            order_book.add_limit_order('ask', i, initial_capital_A / (nb_price_points - 1))
+        return order_book
+
+    # Initial price right of range, we only have bids !
+    if initial_price >= price_grid[-1]:
+        for i in range(nb_price_points - 1):
+            order_book.add_limit_order('bid', i,
+                                       initial_capital_B / (nb_price_points - 1) / price_grid[i])
+        return order_book
+
+    floor_price0_index, floor_price0 = PriceGrid.of(price_grid).cursor(initial_price)
+    if floor_price0_index is None:
+        raise Exception("Floor price index is None")
+
+    nb_bids = floor_price0_index
+    for i in range(floor_price0_index - 1, -1, -1):
+        order_book.add_limit_order('bid', i, initial_capital_B / nb_bids * 1 / price_grid[i])
+
+    nb_asks = nb_price_points - nb_bids - 1
+    for i in range(floor_price0_index + 1, nb_price_points):
+        order_book.add_limit_order('ask', i, initial_capital_A / nb_asks)
+
+    return order_book
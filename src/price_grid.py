@@ -0,0 +1,89 @@
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+import numpy as np
+
+from src.order import DECIMALS
+
+"""
+Price grid of a Kandel run, built once per regrid.
+Holds the grid prices as given (a list, for the exact float values the book is built on) and as
+a NumPy array, the rounded prices used as book keys, their level index, and the dual offer maps
+of each step_size, built on first use and then cached, so that no grid work is left per tick.
+A PriceGrid behaves as the list of its prices (len, indexing, slicing, iteration).
+"""
+
+
+class PriceGrid:
+    """
+    prices: increasing grid prices
+    """
+    def __init__(self, prices : List[float]) -> None:
+        self.values = list(prices)
+        if len(self.values) < 2:
+            raise Exception("Price grid need to have at least two points")
+        self.prices = np.array(self.values, dtype=float)
+        self.keys = [float(round(p, DECIMALS)) for p in self.values]
+        self.level_of = {p: i for i, p in enumerate(self.keys)}
+        # step_size -> (bids_map, asks_map)
+        self._dual_maps = {}
+
+    def __repr__(self) -> str:
+        return f"PriceGrid: {len(self)} levels from {self.values[0]} to {self.values[-1]}"
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, k):
+        return self.values[k]
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __array__(self, dtype=None, copy=None) -> np.array:
+        return self.prices if dtype is None else self.prices.astype(dtype)
+
+    def __getstate__(self) -> Dict:
+        # Derived maps are rebuilt on load
+        return {'values': self.values}
+
+    def __setstate__(self, state : Dict) -> None:
+        self.__init__(state['values'])
+
+    def dual_maps(self, step_size : int) -> Tuple[Dict[float, float], Dict[float, float]]:
+        """
+        (bids_map, asks_map) of step_size: rounded price of a filled bid -> price of its dual ask
+        step_size levels up, rounded price of a filled ask -> price of its dual bid step_size levels down
+        """
+        if step_size not in self._dual_maps:
+            keys = self.keys
+            bids_map = dict(zip(keys[:-step_size], keys[step_size:]))
+            asks_map = dict(zip(keys[step_size:], keys[:-step_size]))
+            self._dual_maps[step_size] = (bids_map, asks_map)
+        return self._dual_maps[step_size]
+
+    def cursor(self, price : float) -> Tuple[int, float]:
+        """
+        (index, grid price) of the first grid price equal to price, else of the highest one below it,
+        found by bisection, (None, 0.) below the grid and (None, inf) above it (see utils_grid.cursor)
+        """
+        if price < self.values[0]:
+            return (None, 0.0)
+        if price > self.values[-1]:
+            return (None, np.inf)
+        index = bisect_left(self.values, price)
+        if self.values[index] != price:
+            index -= 1
+        return index, self.values[index]
+
+    def level(self, price : float) -> int:
+        """
+        Level of a price on the book (rounded grid price), None if it is not on the grid
+        """
+        return self.level_of.get(round(price, DECIMALS))
+
+    @classmethod
+    def of(cls, price_grid : List[float]) -> 'PriceGrid':
+        """
+        price_grid as a PriceGrid, itself if it already is one
+        """
+        return price_grid if isinstance(price_grid, cls) else cls(price_grid)
@@ -0,0 +1,174 @@
+import json
+import os
+import zipfile
+from typing import List, Union
+import numpy as np
+import pandas as pd
+
+from src.time_series import TS
+
+"""
+Compressed columnar storage for result TS.
+A results file is a zip archive holding, for each chunk of rows, one deflated entry per column
+plus one for the timestamps, and a meta.json entry listing columns, unit and the time bounds
+of every chunk. Floats are byte-shuffled and timestamps delta-encoded before compression.
+Readers only inflate the chunks overlapping the requested time range and the requested columns.
+"""
+
+META = 'meta.json'
+CHUNK_SIZE = 1_000_000
+
+
+def _shuffle(values : np.array) -> bytes:
+    # Groups the bytes of same significance together, which deflate compresses far better
+    values = np.ascontiguousarray(values)
+    return np.frombuffer(values.tobytes(), dtype=np.uint8).reshape(-1, values.itemsize).T.tobytes()
+
+
+def _unshuffle(data : bytes, dtype : np.dtype) -> np.array:
+    dtype = np.dtype(dtype)
+    raw = np.frombuffer(data, dtype=np.uint8).reshape(dtype.itemsize, -1).T
+    return np.ascontiguousarray(raw).view(dtype).ravel()
+
+
+class ResultWriter:
+    """
+    Writes TS chunks with the same columns one after the other to path.
+    Use as a context manager or call close() to write the metadata.
+    """
+    def __init__(self, path : str, compresslevel : int = 1) -> None:
+        self.path = path
+        self.zip = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED,
+                                   compresslevel=compresslevel)
+        self.meta = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is not None and self.meta is None:
+            # Do not hide the error raised in the block behind the empty writer one
+            self._discard()
+            return
+        self.close()
+
+    def write(self, ts : TS) -> None:
+        """
+        Appends the rows of ts as a new chunk
+        """
+        col_names = [str(c) for c in ts.col_names]
+        columns = ts.columns
+        if self.meta is None:
+            self.meta = dict(col_names=col_names,
+                             dtypes=[col.dtype.str for col in columns],
+                             index_dtype=ts.index_dtype,
+                             unit=list(ts.unit),
+                             chunks=[])
+        elif col_names != self.meta['col_names']:
+            raise Exception('Cannot write chunk, not same columns')
+        elif ts.index_dtype != self.meta['index_dtype']:
+            raise Exception('Cannot write chunk, not same index dtype')
+        if ts.n_rows == 0:
+            return
+        k = len(self.meta['chunks'])
+        ticks = ts.index
+        self.zip.writestr(f'{k}/index', _shuffle(np.diff(ticks, prepend=0)))
+        for name, col in zip(col_names, columns):
+            self.zip.writestr(f'{k}/{name}', _shuffle(col))
+        self.meta['chunks'].append(dict(n_rows=int(ts.n_rows),
+                                        first=int(ticks[0]),
+                                        last=int(ticks[-1])))
+
+    def _discard(self) -> None:
+        # Removes an archive without any chunk written, it would have no columns for the readers
+        if self.zip is not None:
+            self.zip.close()
+            self.zip = None
+            os.remove(self.path)
+
+    def close(self) -> None:
+        if self.zip is None:
+            return
+        if self.meta is None:
+            self._discard()
+            raise Exception(f"Nothing written to {self.path}, no results file created")
+        self.zip.writestr(META, json.dumps(self.meta))
+        self.zip.close()
+        self.zip = None
+
+
+def write_results(ts : TS, path : str, chunk_size : int = CHUNK_SIZE, compresslevel : int = 1) -> None:
+    """
+    Writes ts to path by chunks of chunk_size rows
+    """
+    with ResultWriter(path, compresslevel) as writer:
+        # An empty ts still writes its columns, as an empty results file
+        for start in range(0, max(ts.n_rows, 1), chunk_size):
+            writer.write(ts[start:start + chunk_size])
+
+
+def read_meta(path : str) -> dict:
+    with zipfile.ZipFile(path) as archive:
+        return json.loads(archive.read(META))
+
+
+def iter_results(path : str,
+                 columns : List[str] = None,
+                 start : Union[str, pd.Timestamp] = None,
+                 stop : Union[str, pd.Timestamp] = None):
+    """
+    Yields the chunks of path as TS, restricted to columns and to start <= time < stop
+    """
+    with zipfile.ZipFile(path) as archive:
+        meta = json.loads(archive.read(META))
+        columns = meta['col_names'] if columns is None else list(columns)
+        for name in columns:
+            if name not in meta['col_names']:
+                raise Exception(f"Column {name} not found")
+        dtypes = dict(zip(meta['col_names'], meta['dtypes']))
+        index_dtype = np.dtype(meta['index_dtype'])
+        lo = None if start is None else pd.Timestamp(start).to_datetime64().astype(index_dtype).view('int64')
+        hi = None if stop is None else pd.Timestamp(stop).to_datetime64().astype(index_dtype).view('int64')
+
+        for k, chunk in enumerate(meta['chunks']):
+            if (lo is not None and chunk['last'] < lo) or (hi is not None and chunk['first'] >= hi):
+                continue
+            ticks = np.cumsum(_unshuffle(archive.read(f'{k}/index'), 'int64'))
+            first = 0 if lo is None else int(np.searchsorted(ticks, lo, side='left'))
+            last = len(ticks) if hi is None else int(np.searchsorted(ticks, hi, side='left'))
+            if first >= last:
+                continue
+            yield TS(row_names=ticks[first:last],
+                     unit=tuple(meta['unit']),
+                     n_rows=last - first,
+                     col_names=np.array(columns),
+                     columns=[_unshuffle(archive.read(f'{k}/{name}'), dtypes[name])[first:last]
+                              for name in columns],
+                     index_dtype=index_dtype)
+
+
+def read_results(path : str,
+                 columns : List[str] = None,
+                 start : Union[str, pd.Timestamp] = None,
+                 stop : Union[str, pd.Timestamp] = None) -> TS:
+    """
+    Loads columns of the results in path for start <= time < stop as one TS
+    """
+    chunks = list(iter_results(path, columns, start, stop))
+    if not chunks:
+        meta = read_meta(path)
+        columns = meta['col_names'] if columns is None else list(columns)
+        return TS(row_names=np.empty(0, dtype='int64'),
+                  unit=tuple(meta['unit']),
+                  n_rows=0,
+                  col_names=np.array(columns),
+                  values=np.empty((len(columns), 0)),
+                  index_dtype=meta['index_dtype'])
+    if len(chunks) == 1:
+        return chunks[0]
+    return TS(row_names=np.concatenate([c.index for c in chunks]),
+              unit=chunks[0].unit,
+              n_rows=sum(c.n_rows for c in chunks),
+              col_names=chunks[0].col_names,
+              columns=[np.concatenate(cols) for cols in zip(*(c.columns for c in chunks))],
+              index_dtype=chunks[0].index_dtype)
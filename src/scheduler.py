@@ -0,0 +1,161 @@
+import argparse
+import glob
+import json
+import os
+import time
+from functools import partial
+from typing import Dict, List, Tuple
+import pandas as pd
+
+from src.time_series import TS, load_cached
+from src.fin_stats import RollingVol
+from src.sweep import param_grid, run_config, run_jobs
+
+"""
+Batch scheduler of many datasets (pairs, days) x many configs over a process pool.
+Every dataset first goes through the binary cache (time_series.load_cached), built in parallel,
+so that workers memory-map it: pages are shared between workers, and a worker opens a dataset
+once then reuses it (and its regrid vols) for all the configs it runs on it.
+Jobs are one config on one dataset, started largest dataset first for load balancing.
+Run from the repo root:
+    python -m src.scheduler 'data/*.csv' --grid '{"vol_mult": [0.4, 0.8], "n_points": [10],
+        "step_size": [1], "window": [3600]}' --out results/summary.csv
+"""
+
+# Worker side datasets: path -> (TS, RollingVol), only the last one used is kept
+_DATASETS = {}
+
+
+def expand_paths(datasets : List[str]) -> List[str]:
+    """
+    Paths of datasets, glob patterns expanded, in order and without duplicates
+    """
+    paths = []
+    for pattern in datasets:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        paths.extend(p for p in matches if p not in paths)
+    return paths
+
+
+def prepare(path : str, ffill : bool = True, gaps : bool = False) -> int:
+    """
+    Builds (or validates) the cache of path and returns its number of rows
+    """
+    return load_cached(path, ffill=ffill, gaps=gaps).n_rows
+
+
+def open_dataset(path : str, ffill : bool = True, gaps : bool = False,
+                 exact_vol : bool = False) -> Tuple[TS, RollingVol]:
+    """
+    Memory-mapped TS of path and its regrid vol index, opened once per worker
+    """
+    if path not in _DATASETS:
+        # Jobs come grouped by dataset, keep only the current one
+        _DATASETS.clear()
+        ts = load_cached(path, ffill=ffill, gaps=gaps)
+        _DATASETS[path] = (ts, None if gaps else RollingVol(ts, exact=exact_vol))
+    return _DATASETS[path]
+
+
+def run_job(path : str,
+            config : Dict,
+            quote : float,
+            base : float,
+            ffill : bool = True,
+            gaps : bool = False,
+            exact_vol : bool = False,
+            **kwargs) -> Dict:
+    """
+    Runs one config on one dataset, returns its summary row (see sweep.run_config)
+    """
+    start = time.perf_counter()
+    ts, vol_index = open_dataset(path, ffill, gaps, exact_vol)
+    row = run_config(config, quote, base, ts=ts, vol_index=vol_index, **kwargs)
+    return dict(row, seconds=time.perf_counter() - start)
+
+
+def schedule(datasets : List[str],
+             configs : List[Dict],
+             quote : float,
+             base : float,
+             n_workers : int = None,
+             out_path : str = None,
+             ladder : bool = True,
+             event_skip : bool = True,
+             ffill : bool = True,
+             gaps : bool = False,
+             exact_vol : bool = False) -> pd.DataFrame:
+    """
+    Runs every config of configs (see sweep.param_grid) on every dataset (csv paths or glob patterns).
+    Returns one row per (dataset, config) with the dataset rows, final mtm, Sharpe ratio,
+    total volume, number of fill ticks, uptime ratio and run time, sorted by dataset then config_id,
+    and writes it to out_path (csv). A dataset that cannot be loaded, or a job that raises
+    or crashes its worker, gets an error message instead of results.
+    exact_vol: as in sweep.sweep
+    """
+    n_workers = n_workers or os.cpu_count()
+    paths = expand_paths(datasets)
+    n_rows = {}
+    rows = []
+
+    def failed_dataset(k, error):
+        n_rows[paths[k]] = None
+        rows.extend(dict(config, dataset=paths[k], config_id=c, error=error)
+                    for c, config in enumerate(configs))
+
+    run_jobs([(k, (path, ffill, gaps)) for k, path in enumerate(paths)],
+             prepare,
+             done=lambda k, n: n_rows.__setitem__(paths[k], n),
+             failed=failed_dataset,
+             n_workers=n_workers)
+
+    # Largest dataset first, configs in order within a dataset
+    loaded = sorted((p for p in paths if n_rows.get(p) is not None), key=lambda p: -n_rows[p])
+    jobs = [((path, c), (path, config, quote, base)) for path in loaded
+            for c, config in enumerate(configs)]
+
+    def record(key, row):
+        path, c = key
+        rows.append(dict(row, dataset=path, n_rows=n_rows[path], config_id=c))
+
+    run_jobs(jobs,
+             partial(run_job, ffill=ffill, gaps=gaps, exact_vol=exact_vol, ladder=ladder,
+                     event_skip=event_skip),
+             done=record,
+             failed=lambda key, error: record(key, dict(configs[key[1]], error=error)),
+             n_workers=n_workers)
+
+    res = pd.DataFrame(rows)
+    if len(res):
+        first, last = ['dataset', 'n_rows', 'config_id'], ['error']
+        res = res[first + [c for c in res.columns if c not in first + last] + last]
+        res['n_rows'] = res['n_rows'].astype('Int64')
+        res = res.sort_values(['dataset', 'config_id']).reset_index(drop=True)
+    if out_path:
+        res.to_csv(out_path, index=False)
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('datasets', nargs='+', help='csv paths or glob patterns')
+    parser.add_argument('--grid', required=True, help='json {param: [values]} or path to a json file')
+    parser.add_argument('--quote', type=float, default=75000)
+    parser.add_argument('--base', type=float, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--gaps', action='store_true', help='load datasets gap-aware')
+    parser.add_argument('--out', default='results/summary.csv')
+    args = parser.parse_args()
+
+    if os.path.exists(args.grid):
+        with open(args.grid) as f:
+            grid = json.load(f)
+    else:
+        grid = json.loads(args.grid)
+    res = schedule(args.datasets, param_grid(grid), args.quote, args.base,
+                   n_workers=args.workers, out_path=args.out, gaps=args.gaps)
+    print(res.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,332 @@
+import math
+from typing import Iterator, Tuple, Union
+import numpy as np
+
+from src.time_series import TS, col_concat
+
+"""
+Run-length storage of the per-tick result columns of a run.
+quote, base, volume and uptime only change at fills and regrids, so a column is kept as its
+change points: the first row of each run of equal values and that value. Rows are written in
+order through a RunLengthView (what kandel_run sees in place of a dense array), read back
+dense on access or slice, and reconstruct the dense column bit for bit: signed zeros are
+kept apart and equal runs are only merged on equal bits.
+SparseResults holds the four columns with the input ts (referenced, not copied) and computes
+mtm from the price on demand, so that a long run keeps O(events) result memory.
+"""
+
+RESULTS = ('quote', 'base', 'volume', 'uptime')
+# Rows of the dense blocks a sparse kandel_simulator run goes through
+BLOCK_ROWS = 1 << 16
+
+
+def _same(a : float, b : float) -> bool:
+    # Equal as stored: 0. and -0. differ, nans never merge
+    return a == b and (a != 0. or math.copysign(1., a) == math.copysign(1., b))
+
+
+def _runs(values : np.array) -> np.array:
+    """
+    First row of each run of equal bits of values
+    """
+    bits = values.view(f'u{values.itemsize}') if values.dtype.kind == 'f' else values
+    return np.concatenate([[0], np.flatnonzero(bits[1:] != bits[:-1]) + 1])
+
+
+class RunLength:
+    """
+    Run-length encoded column of size rows, rows not written yet read as 0 (as np.zeros).
+    starts, values: first row and value of each run, in buffers grown by doubling
+    end: rows written so far
+    """
+    def __init__(self, size : int, dtype : np.dtype = float, capacity : int = 1024) -> None:
+        self.size = size
+        self.dtype = np.dtype(dtype)
+        self.starts = np.empty(capacity, dtype='int64')
+        self.values = np.empty(capacity, dtype=self.dtype)
+        self.n_runs = 0
+        self.end = 0
+        self._last = None
+
+    @classmethod
+    def from_dense(cls, values : np.array) -> 'RunLength':
+        """
+        Encodes a dense column
+        """
+        values = np.ascontiguousarray(values)
+        res = cls(len(values), values.dtype, capacity=1)
+        res.write(0, values)
+        return res
+
+    def __repr__(self) -> str:
+        return f"RunLength: {self.size} rows, {self.n_runs} runs"
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def nbytes(self) -> int:
+        return self.n_runs * (self.starts.itemsize + self.values.itemsize)
+
+    def runs(self) -> Tuple[np.array, np.array]:
+        """
+        (first row, value) of the runs written so far, views
+        """
+        return self.starts[:self.n_runs], self.values[:self.n_runs]
+
+    def _grow(self, n : int) -> None:
+        if self.n_runs + n > len(self.starts):
+            capacity = max(2 * len(self.starts), self.n_runs + n)
+            for name in ('starts', 'values'):
+                grown = np.empty(capacity, dtype=getattr(self, name).dtype)
+                grown[:self.n_runs] = getattr(self, name)[:self.n_runs]
+                setattr(self, name, grown)
+
+    def _extend(self, value, n : int) -> None:
+        # Appends n rows of value after the written rows
+        if n <= 0:
+            return
+        if self.n_runs == 0 or not _same(value, self._last):
+            self._grow(1)
+            self.starts[self.n_runs] = self.end
+            self.values[self.n_runs] = value
+            self._last = self.values[self.n_runs].item()
+            self.n_runs += 1
+        self.end += n
+
+    def _extend_array(self, values : np.array) -> None:
+        # Appends the rows of values after the written rows, encoded in one pass
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        if not len(values):
+            return
+        starts = _runs(values)
+        if self.n_runs and values[:1].view(f'u{values.itemsize}') == \
+                self.values[self.n_runs - 1:self.n_runs].view(f'u{values.itemsize}'):
+            # First run continues the last written one
+            starts = starts[1:]
+        self._grow(len(starts))
+        self.starts[self.n_runs:self.n_runs + len(starts)] = starts + self.end
+        self.values[self.n_runs:self.n_runs + len(starts)] = values[starts]
+        self.n_runs += len(starts)
+        self._last = self.values[self.n_runs - 1].item()
+        self.end += len(values)
+
+    def _seek(self, row : int) -> None:
+        # Next write starts at row: rows from row on are dropped, missing rows before it are 0
+        if row < self.end:
+            self.n_runs = int(np.searchsorted(self.starts[:self.n_runs], row, side='left'))
+            self._last = self.values[self.n_runs - 1].item() if self.n_runs else None
+            self.end = row
+        else:
+            self._extend(0, row - self.end)
+
+    def fill(self, start : int, stop : int, value) -> None:
+        """
+        Writes value on rows start..stop - 1, dropping the rows written after start
+        """
+        if stop <= start:
+            return
+        if stop > self.size:
+            raise Exception(f"Rows {start}..{stop} out of a column of {self.size} rows")
+        self._seek(start)
+        self._extend(self.dtype.type(value).item(), stop - start)
+
+    def write(self, start : int, values : np.array) -> None:
+        """
+        Writes values on rows start.., dropping the rows written after start
+        """
+        if not len(values):
+            return
+        if start + len(values) > self.size:
+            raise Exception(f"Rows {start}..{start + len(values)} out of a column of {self.size} rows")
+        self._seek(start)
+        self._extend_array(values)
+
+    def value(self, row : int):
+        """
+        Value of one row
+        """
+        if row >= self.end:
+            return self.dtype.type(0)
+        return self.values[int(np.searchsorted(self.starts[:self.n_runs], row, side='right')) - 1]
+
+    def dense(self, start : int = 0, stop : int = None) -> np.array:
+        """
+        Rows start..stop - 1 as a dense array
+        """
+        stop = self.size if stop is None else min(stop, self.size)
+        res = np.zeros(max(stop - start, 0), dtype=self.dtype)
+        written = min(stop, self.end)
+        if written <= start:
+            return res
+        starts, values = self.runs()
+        first = int(np.searchsorted(starts, start, side='right')) - 1
+        last = int(np.searchsorted(starts, written, side='left'))
+        bounds = np.append(np.maximum(starts[first:last], start), written)
+        res[:written - start] = np.repeat(values[first:last], np.diff(bounds))
+        return res
+
+    def __getitem__(self, index : Union[int, slice]):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.size)
+            if step == 1:
+                return self.dense(start, stop)
+            rows = np.arange(start, stop, step)
+            return self.dense(rows.min(), rows.max() + 1)[rows - rows.min()] if len(rows) else \
+                np.empty(0, dtype=self.dtype)
+        row = index + self.size if index < 0 else index
+        if not 0 <= row < self.size:
+            raise IndexError(f"Row {index} out of a column of {self.size} rows")
+        return self.value(row)
+
+    def __array__(self, dtype=None, copy=None) -> np.array:
+        res = self.dense()
+        return res if dtype is None else res.astype(dtype)
+
+    def writer(self) -> 'RunLengthView':
+        return RunLengthView(self, 0, self.size)
+
+
+class RunLengthView:
+    """
+    Rows offset..offset + n_rows - 1 of a RunLength, written and sliced like a dense array
+    (slices are views). Writes must come in row order: a write drops the rows written after it,
+    rereading and rewriting the last written row (+=) is fine.
+    """
+    def __init__(self, column : RunLength, offset : int, n_rows : int) -> None:
+        self.column = column
+        self.offset = offset
+        self.n_rows = n_rows
+
+    def __repr__(self) -> str:
+        return f"RunLengthView: rows {self.offset}..{self.offset + self.n_rows} of {self.column}"
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    def _row(self, index : int) -> int:
+        row = index + self.n_rows if index < 0 else index
+        if not 0 <= row < self.n_rows:
+            raise IndexError(f"Row {index} out of a view of {self.n_rows} rows")
+        return self.offset + row
+
+    def __getitem__(self, index : Union[int, slice]):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.n_rows)
+            if step != 1:
+                raise Exception("RunLengthView slices take contiguous rows")
+            return RunLengthView(self.column, self.offset + start, max(stop - start, 0))
+        return self.column.value(self._row(index))
+
+    def __setitem__(self, index : Union[int, slice], value) -> None:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.n_rows)
+            if step != 1:
+                raise Exception("RunLengthView slices take contiguous rows")
+            if np.ndim(value):
+                if len(value) != stop - start:
+                    raise Exception(f"Cannot write {len(value)} values on {stop - start} rows")
+                self.column.write(self.offset + start, value)
+            else:
+                self.column.fill(self.offset + start, self.offset + stop, value)
+        else:
+            row = self._row(index)
+            self.column.fill(row, row + 1, value)
+
+    def __array__(self, dtype=None, copy=None) -> np.array:
+        res = self.column.dense(self.offset, self.offset + self.n_rows)
+        return res if dtype is None else res.astype(dtype)
+
+
+class SparseResults:
+    """
+    Results of a run over ts with run-length encoded quote, base, volume and uptime columns.
+    Reads like the res TS of kandel_simulator: column(), slices and iter_chunks give dense
+    columns and TS (bit identical to it), mtm being computed from the first column of ts.
+    """
+    def __init__(self, ts : TS, quote : RunLength, base : RunLength,
+                 volume : RunLength, uptime : RunLength) -> None:
+        self.ts = ts
+        self.results = dict(zip(RESULTS, (quote, base, volume, uptime)))
+        self.n_rows = ts.n_rows
+        self.unit = ts.unit
+        self.index = ts.index
+        self.index_dtype = ts.index_dtype
+        self.col_names = np.concatenate([ts.col_names, ['quote', 'base', 'mtm', 'volume', 'uptime']])
+
+    @classmethod
+    def from_ts(cls, res : TS) -> 'SparseResults':
+        """
+        Encodes a dense res TS of kandel_simulator
+        """
+        names = [str(c) for c in res.col_names]
+        ts = res.like(res.col_names[:names.index('quote')],
+                      columns=res.columns[:names.index('quote')])
+        return cls(ts, *(RunLength.from_dense(res.column(name)) for name in RESULTS))
+
+    def __repr__(self) -> str:
+        runs = {name: col.n_runs for name, col in self.results.items()}
+        return f"SparseResults: {self.n_rows} rows, runs {runs}, {self.nbytes} bytes"
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Bytes of the encoded result columns (the input ts is not counted)
+        """
+        return sum(col.nbytes for col in self.results.values())
+
+    def units_in_year(self) -> int:
+        return self.ts.units_in_year()
+
+    def mtm(self, start : int = 0, stop : int = None) -> np.array:
+        """
+        quote + base * price of rows start..stop - 1
+        """
+        stop = self.n_rows if stop is None else stop
+        return self.results['quote'].dense(start, stop) + \
+            self.results['base'].dense(start, stop) * self.ts.column(0)[start:stop]
+
+    def column(self, col : Union[int, str]) -> np.array:
+        """
+        Dense column, by position or name
+        """
+        if not isinstance(col, str):
+            col = str(self.col_names[col])
+        if col == 'mtm':
+            return self.mtm()
+        if col in self.results:
+            return self.results[col].dense()
+        return self.ts.column(col)
+
+    def __getitem__(self, index : slice) -> TS:
+        """
+        Dense TS of a slice of the rows, with the columns of the res TS of kandel_simulator
+        """
+        if not isinstance(index, slice):
+            raise TypeError("Index must be a slice")
+        start, stop, step = index.indices(self.n_rows)
+        ts = self.ts[index]
+        if step == 1:
+            quote, base, volume, uptime = (self.results[name].dense(start, stop) for name in RESULTS)
+        else:
+            quote, base, volume, uptime = (self.results[name][index] for name in RESULTS)
+        mtm = quote + base * ts.column(0)
+        res = ts.like(['quote', 'base', 'mtm', 'volume', 'uptime'],
+                      columns = [quote, base, mtm, volume, uptime])
+        return col_concat(ts, res)
+
+    def to_ts(self) -> TS:
+        """
+        Dense res TS
+        """
+        return self[:]
+
+    def iter_chunks(self, chunk_rows : int = 1 << 20) -> Iterator[TS]:
+        """
+        Yields the rows as dense TS chunks of chunk_rows rows (see analytics.analyze)
+        """
+        for start in range(0, self.n_rows, chunk_rows):
+            yield self[start:start + chunk_rows]
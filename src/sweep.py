@@ -0,0 +1,212 @@
+import os
+import itertools
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+import pandas as pd
+
+from src.time_series import TS, GapMap, is_ohlc
+from src.order_book import OrderBook
+from src.kandel import kandel_simulator, strategy_start
+from src.fin_stats import RollingVol
+
+"""
+Parameter sweep of kandel_simulator over a process pool.
+The price series is put once in shared memory and every worker maps it,
+so the TS is never pickled to the workers.
+"""
+
+# Worker side TS, attached once per process by _init_worker, and its regrid vols
+_TS = None
+_VOL = None
+_SHM = []
+
+
+def param_grid(grid : Dict[str, List]) -> List[Dict]:
+    """
+    Cartesian product of a {param: [values]} dict into a list of configs
+    """
+    keys = list(grid.keys())
+    return [dict(zip(keys, values)) for values in itertools.product(*grid.values())]
+
+
+def _to_shared(array : np.array) -> Tuple[shared_memory.SharedMemory, Tuple]:
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _from_shared(spec : Tuple) -> np.array:
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    # Keep the segment open for the life of the worker
+    _SHM.append(shm)
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+def _init_worker(values_spec : Tuple,
+                 index_spec : Tuple,
+                 unit : Tuple[int, str],
+                 col_names : np.array,
+                 index_dtype : str,
+                 gaps : Tuple = None,
+                 exact_vol : bool = False) -> None:
+    global _TS, _VOL
+    values = _from_shared(values_spec)
+    index = _from_shared(index_spec)
+    _TS = TS(row_names=index,
+             unit=unit,
+             n_rows=values.shape[1],
+             col_names=col_names,
+             values=values,
+             index_dtype=index_dtype,
+             gaps=None if gaps is None else GapMap(*gaps))
+    # O(1) lookups off the shared cumulative sums, or exact ones (see RollingVol)
+    # (gap-aware runs take their vols on the forward filled windows instead)
+    _VOL = None if gaps is not None else RollingVol(_TS['close'] if is_ohlc(_TS) else _TS, exact=exact_vol)
+
+
+def sharpe(mtm : np.array, units_in_year : int) -> float:
+    """
+    Annualized Sharpe ratio (zero rate) of the row by row returns of mtm, nan if they are constant
+    """
+    if len(mtm) < 2:
+        return np.nan
+    returns = np.diff(mtm) / mtm[:-1]
+    std = returns.std()
+    return returns.mean() / std * np.sqrt(units_in_year) if std > 0 else np.nan
+
+
+def run_config(config : Dict,
+               quote : float,
+               base : float,
+               ts : TS = None,
+               **kwargs) -> Dict:
+    """
+    Runs kandel_simulator for one config and returns its summary row
+    """
+    if ts is None:
+        ts = _TS
+        kwargs.setdefault('vol_index', _VOL)
+    _, res, _ = kandel_simulator(ts=ts,
+                                 quote=quote,
+                                 base=base,
+                                 vol_mult=config['vol_mult'],
+                                 n_points=config['n_points'],
+                                 step_size=config['step_size'],
+                                 order_book=OrderBook(),
+                                 window=config['window'],
+                                 **kwargs)
+    # mtm from the row before the strategy start, holding the initial inventory
+    start = strategy_start(ts, config['window'])
+    mtm = res.column('mtm')
+    volume = res.column('volume')
+    uptime = res.column('uptime')
+    return dict(config,
+                mtm=mtm[-1],
+                sharpe=sharpe(mtm[max(start - 1, 0):], ts.units_in_year()),
+                volume=volume.sum(),
+                n_fills=int(np.count_nonzero(volume)),
+                uptime=uptime[start:].mean() if start < ts.n_rows else np.nan,
+                error=None)
+
+
+def run_jobs(jobs : List[Tuple],
+             fn : Callable,
+             done : Callable,
+             failed : Callable,
+             n_workers : int,
+             initializer : Callable = None,
+             initargs : Tuple = ()) -> None:
+    """
+    Runs fn(*args) for every (key, args) of jobs on a process pool, in order.
+    Calls done(key, result) as jobs complete, or failed(key, message) if fn raised.
+    At most n_workers jobs are in flight: when a worker dies, the jobs in flight are
+    rerun alone to find the one that crashed, which fails with 'worker crashed'.
+    """
+    def run_pool(jobs, max_workers):
+        """
+        Runs jobs keeping at most max_workers in flight, returns the jobs that were
+        running when the pool broke (a worker died) plus the ones never started
+        """
+        jobs = list(jobs)
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 initializer=initializer,
+                                 initargs=initargs) as pool:
+            in_flight = {}
+            while jobs or in_flight:
+                while jobs and len(in_flight) < max_workers:
+                    key, args = jobs.pop(0)
+                    in_flight[pool.submit(fn, *args)] = (key, args)
+                completed, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                broken = []
+                for future in completed:
+                    key, args = in_flight.pop(future)
+                    try:
+                        done(key, future.result())
+                    except BrokenProcessPool:
+                        broken.append((key, args))
+                    except Exception as e:
+                        failed(key, repr(e))
+                if broken:
+                    return broken + list(in_flight.values()), jobs
+        return [], []
+
+    pending = list(jobs)
+    while pending:
+        suspects, pending = run_pool(pending, n_workers)
+        # Rerun each job that was in flight during a crash alone to find the culprit
+        for key, args in suspects:
+            crashed, _ = run_pool([(key, args)], 1)
+            for key, _ in crashed:
+                failed(key, 'worker crashed')
+
+
+def sweep(ts : TS,
+          configs : List[Dict],
+          quote : float,
+          base : float,
+          n_workers : int = None,
+          out_path : str = None,
+          ladder : bool = True,
+          event_skip : bool = True,
+          exact_vol : bool = False) -> pd.DataFrame:
+    """
+    Runs every config of configs (see param_grid) over ts on a process pool.
+    Returns one row per config with final mtm, Sharpe ratio, total volume, number of fill ticks
+    and uptime ratio.
+    Finished rows are appended to out_path (csv) as they complete. A config that raises or
+    crashes its worker gets an error message instead of results, the other rows are kept.
+    exact_vol: regrid vols equal to kandel_simulator's bit for bit, O(window) lookups instead
+               of O(1) ones within float rounding (see RollingVol)
+    """
+    n_workers = n_workers or os.cpu_count()
+    values_shm, values_spec = _to_shared(np.ascontiguousarray(ts.values))
+    index_shm, index_spec = _to_shared(np.ascontiguousarray(ts.index))
+    # The gap map is small (one entry per hole), it is pickled to the workers
+    gaps = None if ts.gaps is None else (ts.gaps.step, ts.gaps.rows, ts.gaps.missing)
+    rows = []
+
+    def record(row):
+        rows.append(row)
+        if out_path:
+            pd.DataFrame([row]).to_csv(out_path, mode='a', index=False,
+                                       header=not os.path.exists(out_path))
+
+    try:
+        run_jobs([(k, (config, quote, base)) for k, config in enumerate(configs)],
+                 partial(run_config, ladder=ladder, event_skip=event_skip),
+                 done=lambda k, row: record(dict(row, config_id=k)),
+                 failed=lambda k, error: record(dict(configs[k], config_id=k, error=error)),
+                 n_workers=n_workers,
+                 initializer=_init_worker,
+                 initargs=(values_spec, index_spec, ts.unit, ts.col_names, ts.index_dtype, gaps, exact_vol))
+    finally:
+        for shm in (values_shm, index_shm):
+            shm.close()
+            shm.unlink()
+
+    return pd.DataFrame(rows).sort_values('config_id').set_index('config_id')
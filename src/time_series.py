@@ -1,8 +1,12 @@
 import numpy as np
 import linecache
 import pandas as pd
-from typing import Tuple, Union
+from typing import List, Tuple, Union
 import datetime
+import hashlib
+import json
+import os
+import shutil
 """
 Files need to have the following format:
 first column needs to be a string representing time up to ms
@@ -13,38 +17,134 @@ dates will always be handled as timestamps
 class TS:
     """
     Time Series Model
+    Columns are kept either as one 2D array (values) or as a list of 1D arrays (columns),
+    slices and column selections are views and adding columns only adds references.
+    values stacks a column list into one 2D array on first access (then cached).
+    Timestamps are kept as raw int64 (index, in units of index_dtype), the pandas
+    DatetimeIndex (row_names) is only built when asked for. Regular timestamps can be given
+    as a range, index is then built on first access (then cached) and slices slice the range.
+    gaps: GapMap of the ticks missing between rows (see load_csv(gaps=True)), None if uniform
     """
 
-    row_names : pd.DatetimeIndex
+    index_dtype : str
     unit : Tuple[int, str]
     n_rows : int
     col_names : np.array
     n_cols : int
-    values : np.array
 
     def __init__(self,
-                 row_names : pd.DatetimeIndex,
+                 row_names : Union[pd.DatetimeIndex, np.array],
                  unit : Tuple[int, str],
                  n_rows : int,
                  col_names : np.array,
-                 values : np.array) -> None:
-        self.row_names = row_names
+                 values : np.array = None,
+                 columns : List[np.array] = None,
+                 index_dtype : str = 'datetime64[ns]',
+                 gaps : 'GapMap' = None) -> None:
+        """
+        row_names: DatetimeIndex, datetime64 array, int64 array in units of index_dtype,
+                   or range of int64 timestamps
+        values: 2D array (one row per column), or columns: list of 1D arrays
+        """
+        self._row_names = None
+        self._index_range = None
+        if isinstance(row_names, range):
+            self._index_range = row_names
+            index = None
+        elif isinstance(row_names, pd.DatetimeIndex):
+            self._row_names = row_names
+            index = row_names.values
+        else:
+            index = np.asarray(row_names)
+        if index is not None and index.dtype.kind == 'M':
+            index_dtype = index.dtype.str
+            index = index.view('int64')
+        self._index = index
+        self.index_dtype = np.dtype(index_dtype).str
         self.unit = unit
         self.n_rows = n_rows
         self.col_names = col_names
         self.n_cols = len(self.col_names)
-        self.values = values
+        self._values = values
+        self._columns = None if values is not None else list(columns if columns is not None else [])
+        self.gaps = gaps
+
+    @property
+    def index(self) -> np.array:
+        if self._index is None:
+            r = self._index_range
+            self._index = r.start + np.arange(len(r), dtype='int64') * r.step
+        return self._index
+
+    def _rows(self) -> Union[np.array, range]:
+        # Timestamps as given: the range while index is not built
+        return self._index_range if self._index is None else self._index
+
+    @property
+    def row_names(self) -> pd.DatetimeIndex:
+        if self._row_names is None:
+            self._row_names = pd.DatetimeIndex(self.index.view(self.index_dtype))
+        return self._row_names
+
+    @property
+    def values(self) -> np.array:
+        if self._values is None:
+            if len(self._columns) == 1:
+                # 2D view of the single column, no copy
+                return self._columns[0][np.newaxis]
+            self._values = np.stack(self._columns) if self._columns else np.empty((0, self.n_rows))
+            self._columns = None
+        return self._values
+
+    @values.setter
+    def values(self, values : np.array) -> None:
+        self._values = values
+        self._columns = None
+
+    @property
+    def columns(self) -> List[np.array]:
+        """
+        list of the 1D columns (views)
+        """
+        if self._values is not None:
+            return list(self._values)
+        return list(self._columns)
+
+    def column(self, col : Union[int, str]) -> np.array:
+        """
+        1D view of a column, by position or name
+        """
+        if isinstance(col, str):
+            matches = np.flatnonzero(np.asarray(self.col_names) == col)
+            assert len(matches), f"Column {col} not found"
+            col = int(matches[0])
+        return self._values[col] if self._values is not None else self._columns[col]
+
+    def like(self, col_names : np.array, values : np.array = None, columns : List[np.array] = None):
+        """
+        TS with the rows (index, unit) of self and the given columns
+        """
+        return TS(row_names=self._rows(),
+                  unit=self.unit,
+                  n_rows=self.n_rows,
+                  col_names=col_names,
+                  values=values,
+                  columns=columns,
+                  index_dtype=self.index_dtype,
+                  gaps=self.gaps)
 
     def copy(self):
         """
         Generate a copy of the Time Series Model instance.
         """
         return TS(
-            row_names=self.row_names.copy(),
+            row_names=self.index.copy(),
             unit=self.unit,
             n_rows=self.n_rows,
             col_names=self.col_names.copy(),
-            values=self.values.copy()
+            values=np.array(self.values),
+            index_dtype=self.index_dtype,
+            gaps=self.gaps
         )
 
     def to_pandas(self):
@@ -68,51 +168,169 @@ class TS:
             'h' : 24 * 365,
             'm' : 60 * 24 * 365,
             's' : 60 * 60 * 24 * 365,
-            'ms' : 60 * 60 * 60 * 24 * 365,
+            'ms' : 1000 * 60 * 60 * 24 * 365,
+            'us' : 1000 ** 2 * 60 * 60 * 24 * 365,
+            'ns' : 1000 ** 3 * 60 * 60 * 24 * 365,
         }
         return int(d[self.unit[1]] / self.unit[0])
     
     def __getitem__(self, index: Union[int, slice, str]):
         if isinstance(index, int):
             if index == 0:
-                return TS(row_names=self.row_names[:1],
-                          unit=self.unit,
-                          n_rows=1,
-                          col_names=self.col_names,
-                          values=self.values[:, :1])
+                return self[:1]
             elif index > self.n_rows:
                 index = self.n_rows
             
-            return self.values[:, index]
+            return np.array([col[index] for col in self.columns])
         elif isinstance(index, slice):
             start, stop, step = index.indices(self.n_rows)
-            temp_values = self.values[:, start:stop:step]
-            return TS(row_names=self.row_names[start:stop:step],
+            row_index = self._rows()[start:stop:step]
+            if self._values is not None:
+                values, columns = self._values[:, start:stop:step], None
+            else:
+                values, columns = None, [col[start:stop:step] for col in self._columns]
+            gaps = None
+            if self.gaps is not None:
+                gaps = self.gaps.slice(start, stop) if step == 1 else \
+                    GapMap.from_index(self.index[start:stop:step], self.gaps.step)
+            return TS(row_names=row_index,
                       unit=self.unit,
-                      n_rows=stop - start,
+                      n_rows=len(row_index),
                       col_names=self.col_names,
-                      values=temp_values)
+                      values=values,
+                      columns=columns,
+                      index_dtype=self.index_dtype,
+                      gaps=gaps)
         
         elif isinstance(index, str):
             assert index in self.col_names, f"Column {index} not found"
-            idx = np.where(self.col_names == index)
-            return TS(row_names=self.row_names,
-                      unit = self.unit,
-                      n_rows = self.n_rows,
-                      col_names = [index],
-                      values = self.values[idx])
+            return self.like([index], columns=[self.column(index)])
         
         else:
             raise TypeError("Index must be an integer or a slice or a str")
     
     def add_column(self, col_name : str,
                    new_values : np.array):
+        """
+        returns a TS with the columns of self and new_values, the existing columns are not copied
+        """
         assert(len(new_values) == self.n_rows)
-        res = self.copy()
-        res.n_cols += 1
-        res.col_names = np.concatenate((res.col_names, [col_name]))
-        res.values = np.concatenate((res.values, [new_values]), axis = 0)
-        return res
+        return self.like(np.concatenate((self.col_names, [col_name])),
+                         columns=self.columns + [np.asarray(new_values)])
+
+
+class GapMap:
+    """
+    Ticks missing between the observed rows of a TS, the price being unchanged over them.
+    rows[k] is preceded by missing[k] unobserved ticks, step is the tick length in index units.
+    Only the rows after a gap are stored, not the filled rows.
+    """
+    step : int
+    rows : np.array
+    missing : np.array
+
+    def __init__(self, step : int, rows : np.array, missing : np.array) -> None:
+        self.step = int(step)
+        self.rows = np.asarray(rows, dtype='int64')
+        self.missing = np.asarray(missing, dtype='int64')
+
+    @classmethod
+    def from_index(cls, index : np.array, step : int) -> 'GapMap':
+        """
+        Gaps of an int64 index on a grid of step (integer arithmetic only)
+        """
+        diffs = np.diff(index)
+        if (diffs <= 0).any():
+            raise Exception("Time series index is not increasing")
+        if (diffs % step).any():
+            raise Exception(f"Time series index is not on a grid of {step}")
+        missing = diffs // step - 1
+        rows = np.flatnonzero(missing)
+        return cls(step, rows + 1, missing[rows])
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __repr__(self) -> str:
+        return f"GapMap: {len(self)} gaps, {self.n_missing()} missing ticks of {self.step}"
+
+    def n_missing(self) -> int:
+        return int(self.missing.sum())
+
+    def ticks(self, n_rows : int) -> np.array:
+        """
+        tick number of each of the n_rows rows, the first row being tick 0
+        """
+        extra = np.zeros(n_rows, dtype='int64')
+        extra[self.rows[self.rows < n_rows]] = self.missing[self.rows < n_rows]
+        return np.arange(n_rows, dtype='int64') + np.cumsum(extra)
+
+    def slice(self, start : int, stop : int) -> 'GapMap':
+        """
+        gaps between the rows start..stop - 1
+        """
+        keep = (self.rows > start) & (self.rows < stop)
+        return GapMap(self.step, self.rows[keep] - start, self.missing[keep])
+
+    def expand(self, ts : TS) -> TS:
+        """
+        forward filled TS with one row per tick, as load_csv(ffill=True) would build it
+        """
+        ticks = self.ticks(ts.n_rows)
+        n_ticks = int(ticks[-1]) + 1 if ts.n_rows else 0
+        rows = np.repeat(np.arange(ts.n_rows), np.diff(ticks, append=n_ticks))
+        return TS(row_names=ts.index[0] + np.arange(n_ticks, dtype='int64') * self.step if n_ticks else ts.index,
+                  unit=ts.unit,
+                  n_rows=n_ticks,
+                  col_names=ts.col_names,
+                  columns=[col[rows] for col in ts.columns],
+                  index_dtype=ts.index_dtype)
+
+
+# Smallest magnitude of a current epoch timestamp in each unit (2001-09-09 in seconds)
+EPOCH_UNITS = (('s', 10 ** 9), ('ms', 10 ** 12), ('us', 10 ** 15), ('ns', 10 ** 18))
+
+
+def detect_time_unit(raw : np.array) -> str:
+    """
+    unit (s, ms, us or ns) of raw integer epoch timestamps, from their magnitude
+    """
+    magnitude = int(np.abs(raw).max()) if len(raw) else 0
+    unit = 's'
+    for name, threshold in EPOCH_UNITS:
+        if magnitude >= threshold:
+            unit = name
+    return unit
+
+
+def tick_step(raw : np.array) -> int:
+    """
+    most common difference between consecutive raw timestamps
+    """
+    diffs, counts = np.unique(np.diff(raw), return_counts=True)
+    return int(diffs[np.argmax(counts)])
+
+
+def load_csv_gaps(path : str) -> TS:
+    """
+    Loads csv into a TS of the observed rows only, holes are kept in a GapMap (ts.gaps)
+    instead of being forward filled. The first column must hold integer epoch timestamps,
+    their unit (s, ms, us) is detected from their magnitude.
+    """
+    temp = pd.read_csv(path, index_col=0, sep=";")
+    raw = temp.index.to_numpy()
+    if raw.dtype.kind not in 'iu':
+        raise Exception("gaps mode needs integer epoch timestamps")
+    raw = raw.astype('int64', copy=False)
+    unit = detect_time_unit(raw)
+    step = tick_step(raw) if len(raw) > 1 else 1
+    return TS(row_names = raw,
+              unit = get_timedelta_unit(pd.Timedelta(step, unit=unit)),
+              n_rows = len(raw),
+              col_names = np.array(temp.columns),
+              values = np.ascontiguousarray(temp.values.T),
+              index_dtype = f'datetime64[{unit}]',
+              gaps = GapMap.from_index(raw, step))
 
 
 def get_timedelta_unit(timedelta : pd.Timedelta) -> str:
@@ -124,16 +342,215 @@ def get_timedelta_unit(timedelta : pd.Timedelta) -> str:
         return (timedelta.components.minutes, 'm')
     elif timedelta.components.seconds != 0:
         return (timedelta.components.seconds, 's')
-    else:
-        return (timedelta.components.milliseconds, 'ms')  # Default unit if all others are 0
+    # Under a second, the coarsest of ms, us and ns that counts it whole (ms if it is 0)
+    for unit, ns in (('ms', 10 ** 6), ('us', 10 ** 3), ('ns', 1)):
+        if timedelta.value % ns == 0:
+            return (timedelta.value // ns, unit)
 
 
-        
-def load_csv(path : str, ffill : bool = True) -> TS:
+OHLC = ('open', 'high', 'low', 'close')
+
+
+def is_ohlc(ts : TS) -> bool:
+    """
+    whether ts holds OHLC bars (see ohlc_bars)
+    """
+    return tuple(str(c) for c in ts.col_names[:4]) == OHLC
+
+
+def bar_rows(unit : Tuple[int, str], resolution : Union[int, str]) -> int:
+    """
+    rows of unit per bar of resolution: a number of rows, or a pandas timedelta string ('1min')
+    """
+    if isinstance(resolution, str):
+        rows = pd.Timedelta(resolution) / pd.Timedelta(unit[0], unit=unit[1])
+        if rows != int(rows) or rows < 1:
+            raise Exception(f"Resolution {resolution} is not a multiple of the ts unit {unit}")
+        return int(rows)
+    return int(resolution)
+
+
+def _ohlc(open_ : np.array, high : np.array, low : np.array, close : np.array, bar : int) -> np.array:
+    # (4, n_bars) open, high, low, close of groups of bar consecutive rows, the last one possibly shorter
+    starts = np.arange(0, len(open_), bar)
+    if not len(starts):
+        return np.empty((4, 0))
+    ends = np.minimum(starts + bar, len(open_)) - 1
+    return np.stack([open_[starts],
+                     np.maximum.reduceat(high, starts),
+                     np.minimum.reduceat(low, starts),
+                     close[ends]])
+
+
+def ohlc_bars(ts : TS, resolution : Union[int, str]) -> TS:
+    """
+    OHLC bars of the first column of a forward filled ts, one bar per resolution
+    (see bar_rows), the last one possibly shorter. Bars are labelled by their first row
+    and their unit is resolution, built in one vectorized pass.
+    """
+    if ts.gaps is not None:
+        raise Exception("ohlc_bars needs a forward filled ts, expand its gaps first")
+    bar = bar_rows(ts.unit, resolution)
+    prices = np.asarray(ts.column(0))
+    return TS(row_names=ts.index[::bar],
+              unit=(ts.unit[0] * bar, ts.unit[1]),
+              n_rows=len(ts.index[::bar]),
+              col_names=np.array(OHLC),
+              values=_ohlc(prices, prices, prices, prices, bar),
+              index_dtype=ts.index_dtype)
+
+
+PYRAMID_LEVELS = ('1min', '5min', '15min', '1h', '4h', '1D')
+
+
+class Pyramid:
+    """
+    Multi-resolution OHLC levels of the first column of a forward filled TS.
+    levels[bar] is the (4, n_bars) array of open, high, low, close (last price) of the bars
+    of bar rows, bar k covering rows k * bar .. (k + 1) * bar - 1. Rows are on a uniform grid
+    (timestamp start + row * step) so the bars of a row or time range are found by arithmetic:
+    a slice of a level is an O(1) view and never reads the full resolution prices.
+    """
+    def __init__(self,
+                 start : int,
+                 step : int,
+                 n_rows : int,
+                 unit : Tuple[int, str],
+                 index_dtype : str,
+                 levels : dict) -> None:
+        self.start = int(start)
+        self.step = int(step)
+        self.n_rows = n_rows
+        self.unit = tuple(unit)
+        self.index_dtype = index_dtype
+        self.levels = levels
+
+    def __repr__(self) -> str:
+        return f"Pyramid: {self.n_rows} rows of {self.unit}, levels {self.resolutions()}"
+
+    @classmethod
+    def build(cls, ts : TS, resolutions : Tuple = PYRAMID_LEVELS) -> 'Pyramid':
+        """
+        Levels of ts at resolutions (rows or timedelta strings, those that are not a multiple
+        of the ts unit or longer than ts are skipped), in one pass over the prices:
+        the finest level is aggregated from them, each coarser one from the finest level
+        it is a multiple of
+        """
+        if ts.gaps is not None:
+            raise Exception("Pyramid needs a forward filled ts, expand its gaps first")
+        bars = set()
+        for resolution in resolutions:
+            try:
+                bar = bar_rows(ts.unit, resolution)
+            except Exception:
+                continue
+            if 1 < bar <= ts.n_rows:
+                bars.add(bar)
+        prices = np.asarray(ts.column(0))
+        levels = {}
+        for bar in sorted(bars):
+            finer = max((b for b in levels if bar % b == 0), default=None)
+            if finer is None:
+                levels[bar] = _ohlc(prices, prices, prices, prices, bar)
+            else:
+                levels[bar] = _ohlc(*levels[finer], bar // finer)
+        step = int(ts.index[1] - ts.index[0]) if ts.n_rows > 1 else 0
+        return cls(ts.index[0] if ts.n_rows else 0, step, ts.n_rows, ts.unit, ts.index_dtype, levels)
+
+    def resolutions(self) -> List[int]:
+        return sorted(self.levels)
+
+    def _bar(self, resolution : Union[int, str]) -> int:
+        bar = bar_rows(self.unit, resolution)
+        if bar not in self.levels:
+            raise Exception(f"No level of {bar} rows, levels are {self.resolutions()}")
+        return bar
+
+    def slice(self, start : int, stop : int, resolution : Union[int, str]) -> TS:
+        """
+        OHLC bars of resolution overlapping rows start..stop - 1 (views of the level)
+        """
+        bar = self._bar(resolution)
+        start, stop, _ = slice(start, stop).indices(self.n_rows)
+        first, last = start // bar, -(-stop // bar) if stop > start else start // bar
+        # Bar timestamps as a range, the index is only built if asked for (step is 0 for one row)
+        tick = max(bar * self.step, 1)
+        ticks = self.start + first * bar * self.step
+        return TS(row_names=range(ticks, ticks + (last - first) * tick, tick),
+                  unit=(self.unit[0] * bar, self.unit[1]),
+                  n_rows=last - first,
+                  col_names=np.array(OHLC),
+                  values=self.levels[bar][:, first:last],
+                  index_dtype=self.index_dtype)
+
+    def level(self, resolution : Union[int, str]) -> TS:
+        """
+        all the bars of resolution
+        """
+        return self.slice(0, self.n_rows, resolution)
+
+    def row(self, timestamp) -> int:
+        """
+        row of timestamp (int64 in units of index_dtype, or anything pd.Timestamp takes)
+        """
+        if not isinstance(timestamp, (int, np.integer)):
+            timestamp = int(pd.Timestamp(timestamp).to_datetime64().astype(self.index_dtype).astype('int64'))
+        return -(-(timestamp - self.start) // self.step) if self.step else 0
+
+    def between(self, start, stop, resolution : Union[int, str]) -> TS:
+        """
+        OHLC bars of resolution overlapping timestamps start (included) to stop (excluded)
+        """
+        return self.slice(max(self.row(start), 0), max(self.row(stop), 0), resolution)
+
+    def resolution_for(self, start : int, stop : int, max_bars : int) -> int:
+        """
+        finest level with at most max_bars bars over rows start..stop - 1 (coarsest if none), for plots
+        """
+        for bar in self.resolutions():
+            if -(-(stop - start) // bar) <= max_bars:
+                return bar
+        return self.resolutions()[-1]
+
+    def save(self, path : str) -> None:
+        os.makedirs(path, exist_ok=True)
+        for bar, level in self.levels.items():
+            np.save(os.path.join(path, f'level_{bar}.npy'), level)
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(dict(start=self.start, step=self.step, n_rows=self.n_rows,
+                           unit=list(self.unit), index_dtype=self.index_dtype,
+                           levels=self.resolutions()), f)
+
+    @classmethod
+    def load(cls, path : str) -> 'Pyramid':
+        """
+        Opens a saved pyramid, levels are memory-mapped (read only)
+        """
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        levels = {bar: np.load(os.path.join(path, f'level_{bar}.npy'), mmap_mode='r')
+                  for bar in meta['levels']}
+        return cls(meta['start'], meta['step'], meta['n_rows'], meta['unit'], meta['index_dtype'], levels)
+
+
+def load_csv(path : str, ffill : bool = True, cache : bool = False,
+             cache_dir : str = None, gaps : bool = False,
+             bar : Union[int, str] = None) -> TS:
     """
     Loads csv into a TS object.
+    cache: keep the cleaned TS in a binary cache (see load_cached), later loads memory-map it
+    gaps: keep only the observed rows and a map of the holes (see load_csv_gaps), ffill is ignored
+    bar: load as OHLC bars of this resolution (see ohlc_bars), rows or a timedelta string
     TO DO: not use pandas, check if there is a faster way
     """
+    if bar is not None:
+        if gaps:
+            raise Exception("bars are built on forward filled data, not gap-aware")
+        return ohlc_bars(load_csv(path, ffill=ffill, cache=cache, cache_dir=cache_dir), bar)
+    if cache:
+        return load_cached(path, ffill=ffill, cache_dir=cache_dir, gaps=gaps)
+    if gaps:
+        return load_csv_gaps(path)
     temp = pd.read_csv(path, index_col=0, sep=";")
     temp.index = pd.to_datetime(temp.index, unit = 's') # TO DO: what if other unit?
     # check if index has "holes"
@@ -161,22 +578,208 @@ def load_csv(path : str, ffill : bool = True) -> TS:
               unit = unit,
               n_rows = len(temp.index),
               col_names = np.array(temp.columns),
-              values = np.array(temp.values).reshape(len(temp.columns), len(temp.index))
+              # One row per column: transposed, reshaping would interleave multi-column data
+              values = np.ascontiguousarray(temp.values.T)
               )
 
 
+def _same_index(a : np.array, b : np.array) -> bool:
+    # Views of the same memory are equal without comparing them
+    if len(a) != len(b):
+        return False
+    if a is b or (a.__array_interface__['data'][0] == b.__array_interface__['data'][0]
+                  and a.strides == b.strides):
+        return True
+    return np.array_equal(a, b)
+
+
 def col_concat(t : TS, s : TS) -> TS:
+    """
+    TS with the columns of t then the columns of s, the columns are not copied
+    """
     if t.n_rows != s.n_rows:
-        raise('Cannot concat, not same dimensions')
+        raise Exception('Cannot concat, not same dimensions')
     elif t.unit != s.unit:
-        raise('Cannot concat, not same unit')
-    elif not (t.row_names == s.row_names).all():
+        raise Exception('Cannot concat, not same unit')
+    elif t.index_dtype != s.index_dtype or not _same_index(t.index, s.index):
         # TO DO: handle this case
-        raise('Cannot concat, different index')
+        raise Exception('Cannot concat, different index')
     else:
-        return TS(row_names=t.row_names,
-                  unit = t.unit,
-                  n_rows=t.n_rows,
-                  col_names=np.concatenate([t.col_names, s.col_names]),
-                  values = np.concatenate([t.values, s.values]))
+        return t.like(np.concatenate([t.col_names, s.col_names]),
+                      columns=t.columns + s.columns)
 
+
+def row_concat(t : TS, s : TS) -> TS:
+    """
+    Appends the rows of s after the rows of t
+    """
+    if t.n_cols != s.n_cols or not (np.asarray(t.col_names) == np.asarray(s.col_names)).all():
+        raise Exception('Cannot concat, not same columns')
+    elif t.unit != s.unit:
+        raise Exception('Cannot concat, not same unit')
+    elif t.index_dtype != s.index_dtype:
+        raise Exception('Cannot concat, not same index dtype')
+    index = np.concatenate([t.index, s.index])
+    gaps = t.gaps if t.gaps is not None else s.gaps
+    return TS(row_names=index,
+              unit=t.unit,
+              n_rows=t.n_rows + s.n_rows,
+              col_names=t.col_names,
+              values=np.concatenate([t.values, s.values], axis=1),
+              index_dtype=t.index_dtype,
+              gaps=None if gaps is None else GapMap.from_index(index, gaps.step))
+
+
+def iter_csv(path : str, chunk_size : int = 1_000_000, ffill : bool = True):
+    """
+    Streaming version of load_csv, yields consecutive TS of chunk_size rows (last one shorter).
+    The time step is the most common one of the first chunk, holes are forward filled
+    across chunk boundaries with the last row of the previous chunk.
+    """
+    step = None
+    unit = None
+    last = None
+    buffer = None
+    for temp in pd.read_csv(path, index_col=0, sep=";", chunksize=chunk_size):
+        temp.index = pd.to_datetime(temp.index, unit = 's')
+        if step is None:
+            diffs = temp.index.diff().dropna()
+            step = diffs.value_counts().idxmax()
+            unit = get_timedelta_unit(step)
+        if last is not None:
+            temp = pd.concat([last, temp])
+        new_index = pd.date_range(start = temp.index[0],
+                                  end = temp.index[-1],
+                                  freq = step)
+        if len(new_index) != len(temp.index) or not (new_index == temp.index).all():
+            if not ffill:
+                raise Exception("Time series index is not uniform, please check data")
+            temp = temp.reindex(new_index)
+            temp.ffill(inplace = True)
+        if last is not None:
+            temp = temp.iloc[1:]
+        last = temp.iloc[-1:]
+        buffer = temp if buffer is None else pd.concat([buffer, temp])
+        while len(buffer) >= chunk_size:
+            yield _frame_to_ts(buffer.iloc[:chunk_size], unit)
+            buffer = buffer.iloc[chunk_size:]
+    if buffer is not None and len(buffer):
+        yield _frame_to_ts(buffer, unit)
+
+
+def _frame_to_ts(frame : pd.DataFrame, unit : Tuple[int, str]) -> TS:
+    return TS(row_names = frame.index,
+              unit = unit,
+              n_rows = len(frame.index),
+              col_names = np.array(frame.columns),
+              values = np.ascontiguousarray(frame.values.T))
+
+
+# 3: caches of multi-column csv built before the load_csv layout fix are rebuilt
+CACHE_VERSION = 3
+HASH_CHUNK = 1 << 24
+
+
+def file_hash(path : str) -> str:
+    """
+    blake2b digest of the file content, read by chunks
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_cache(ts : TS, cache_dir : str, meta : dict = None) -> None:
+    """
+    Writes ts to cache_dir as raw columns:
+    index.npy (int64 timestamps), values.npy (float matrix) and meta.json (unit, columns, ...),
+    with the Pyramid of a forward filled ts in cache_dir/pyramid.
+    Written to a temporary dir then renamed so that a crash never leaves a half written cache
+    """
+    tmp_dir = cache_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, 'index.npy'), ts.index)
+    np.save(os.path.join(tmp_dir, 'values.npy'), np.ascontiguousarray(ts.values))
+    if ts.gaps is None:
+        Pyramid.build(ts).save(os.path.join(tmp_dir, 'pyramid'))
+    meta = dict(meta or {},
+                version=CACHE_VERSION,
+                index_dtype=ts.index_dtype,
+                step=None if ts.gaps is None else ts.gaps.step,
+                unit=list(ts.unit),
+                col_names=[str(c) for c in ts.col_names])
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.rename(tmp_dir, cache_dir)
+
+
+def read_cache_meta(cache_dir : str) -> dict:
+    try:
+        with open(os.path.join(cache_dir, 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def read_cache(cache_dir : str) -> TS:
+    """
+    Opens a cache written by write_cache, columns are memory-mapped (read only)
+    """
+    meta = read_cache_meta(cache_dir)
+    index = np.load(os.path.join(cache_dir, 'index.npy'), mmap_mode='r')
+    values = np.load(os.path.join(cache_dir, 'values.npy'), mmap_mode='r')
+    step = meta.get('step')
+    return TS(row_names=index,
+              unit=tuple(meta['unit']),
+              n_rows=len(index),
+              col_names=np.array(meta['col_names']),
+              values=values,
+              index_dtype=meta['index_dtype'],
+              gaps=None if step is None else GapMap.from_index(index, step))
+
+
+def load_cached(path : str, ffill : bool = True, cache_dir : str = None,
+                check_hash : bool = False, gaps : bool = False) -> TS:
+    """
+    Same as load_csv but goes through a binary cache stored in cache_dir (default path + '.cache').
+    The cache is rebuilt when the source size changes, or when its mtime changes
+    and its content hash too (a touched but identical file keeps its cache).
+    check_hash: always compare the content hash, even if size and mtime match
+    """
+    cache_dir = cache_dir or path + '.cache'
+    stat = os.stat(path)
+    meta = read_cache_meta(cache_dir)
+    valid = meta is not None and meta.get('version') == CACHE_VERSION \
+        and meta.get('ffill') == ffill and meta.get('gaps', False) == gaps \
+        and meta.get('size') == stat.st_size
+    if valid and (check_hash or meta.get('mtime') != stat.st_mtime_ns):
+        digest = file_hash(path)
+        valid = meta.get('hash') == digest
+        if valid and meta.get('mtime') != stat.st_mtime_ns:
+            meta['mtime'] = stat.st_mtime_ns
+            with open(os.path.join(cache_dir, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+    if valid:
+        return read_cache(cache_dir)
+
+    ts = load_csv(path, ffill=ffill, gaps=gaps)
+    write_cache(ts, cache_dir, dict(source=os.path.abspath(path),
+                                    size=stat.st_size,
+                                    mtime=stat.st_mtime_ns,
+                                    hash=file_hash(path),
+                                    ffill=ffill,
+                                    gaps=gaps))
+    return read_cache(cache_dir)
+
+
+def load_pyramid(path : str, ffill : bool = True, cache_dir : str = None) -> Pyramid:
+    """
+    Pyramid of the csv at path, stored with its binary cache (see load_cached)
+    """
+    cache_dir = cache_dir or path + '.cache'
+    load_cached(path, ffill=ffill, cache_dir=cache_dir)
+    return Pyramid.load(os.path.join(cache_dir, 'pyramid'))
@@ -1,4 +1,5 @@
 import math
+from bisect import bisect_left
 import numpy as np
 from numpy import linspace
 
@@ -37,11 +38,18 @@ def geo_price_grid_gen(entry_price, end_price, ratio):
         raise Exception("Can't be negative or inferior to one")
 
     if entry_price < end_price:
-        mylist = [entry_price]
-        new_value = entry_price
-        while round(new_value, 10) < round(end_price, 10):
-            new_value = mylist[-1] * ratio
-            mylist.append(new_value)
+        # entry_price times ratio again and again, the cumulative product multiplying in the same
+        # order as a loop, up to one level past log(end_price / entry_price) / log(ratio)
+        n = max(int(math.ceil(math.log(end_price / entry_price) / math.log(ratio))), 1) + 2
+        end = round(end_price, 10)
+        while True:
+            mylist = np.cumprod(np.r_[entry_price, np.full(n - 1, ratio)]).tolist()
+            # Kept up to the first level reaching end_price once rounded to 10 decimals
+            k = next((k for k, level in enumerate(mylist) if round(level, 10) >= end), None)
+            if k is not None:
+                break
+            n *= 2
+        mylist = mylist[:k + 1]
         # edit list elt minimum between end_price and last_elt
         mylist[-1] = end_price
         return mylist
@@ -133,20 +141,11 @@ def cursor(specific_price, price_grid):
         print("Current price is > p_max")  # price is above range
         return (None, np.inf)
 
-    floor_price = None
-    floor_price_index = None
-
-    # TODO: Ameliorate by doing a research
-    for (index, price_point) in enumerate(price_grid):
-        if (specific_price > price_point):
-            floor_price = price_point
-            floor_price_index = index
-
-        elif specific_price < price_point:
-            return floor_price_index, floor_price
-
-        elif (specific_price == price_point):
-            return (index, price_point)
+    # First grid point equal to price, else the highest one below it, by bisection
+    floor_price_index = bisect_left(price_grid, specific_price)
+    if price_grid[floor_price_index] != specific_price:
+        floor_price_index -= 1
+    return (floor_price_index, price_grid[floor_price_index])
 
 """
 Generates a prices series with random brownian jumps
@@ -0,0 +1,33 @@
+import unittest
+import numpy as np
+
+from src.time_series import load_csv
+from src.order_book import OrderBook
+from src.kandel import kandel_simulator
+from src.analytics import analyze
+
+
+class TestAnalyze(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ts = load_csv('data/ETHUSDC-1s-2024-09-15.csv')[:20000]
+        cls.args = dict(quote=75000, base=0, vol_mult=0.4, n_points=10, step_size=1,
+                        order_book=OrderBook(), window=3600, ladder=True, event_skip=True)
+
+    def test_sparse_run(self):
+        _, res, _ = kandel_simulator(self.ts, **self.args)
+        _, sparse, _ = kandel_simulator(self.ts, sparse=True, **self.args)
+        freqs = ('row', '1h')
+        dense = analyze(res, 3600, freqs)
+        for chunk_rows in (1 << 20, 7000):
+            summary = analyze(sparse, 3600, freqs, chunk_rows=chunk_rows)
+            self.assertEqual(summary.keys(), dense.keys())
+            for key, value in dense.items():
+                if isinstance(value, float):
+                    self.assertTrue(np.isclose(summary[key], value, rtol=1e-12, equal_nan=True), key)
+                else:
+                    self.assertEqual(summary[key], value, key)
+
+
+if __name__ == '__main__':
+    unittest.main()
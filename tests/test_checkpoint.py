@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from src.order_book import OrderBook
+from src.kandel import kandel_simulator
+from tests.test_instrumentation import walk_ts
+
+
+def fills(transactions) -> list:
+    return [[(t.order_type, t.price, t.qty) for t in tick] for tick in transactions]
+
+
+class TestCheckpoint(unittest.TestCase):
+    args = dict(quote=75000, base=0, vol_mult=0.4, n_points=10, step_size=1, window=600,
+                ladder=True, event_skip=True)
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.ts = walk_ts()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_sim(self, ts, **kwargs):
+        return kandel_simulator(ts, order_book=OrderBook(), **self.args, **kwargs)
+
+    def test_resume_and_extend_identical(self):
+        ref_transactions, ref, _ = self.run_sim(self.ts)
+        path = os.path.join(self.dir, 'run')
+        # Run stopped after its first 1500 rows, then resumed on all the rows
+        self.run_sim(self.ts[:1500], checkpoint_dir=path, checkpoint_every=700)
+        for _ in range(2):
+            transactions, res, _ = self.run_sim(self.ts, checkpoint_dir=path, checkpoint_every=700)
+            self.assertTrue(np.array_equal(res.values, ref.values, equal_nan=True))
+            self.assertEqual(fills(transactions), fills(ref_transactions))
+
+    def test_refuses_other_params_or_data(self):
+        path = os.path.join(self.dir, 'run')
+        self.run_sim(self.ts[:1500], checkpoint_dir=path)
+        with self.assertRaisesRegex(Exception, 'other parameters'):
+            kandel_simulator(self.ts, order_book=OrderBook(), checkpoint_dir=path,
+                             **dict(self.args, vol_mult=0.8))
+        changed = self.ts.copy()
+        changed.values[0, 1000] += 1
+        with self.assertRaisesRegex(Exception, 'changed in the data'):
+            self.run_sim(changed, checkpoint_dir=path)
+
+
+if __name__ == '__main__':
+    unittest.main()
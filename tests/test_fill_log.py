@@ -0,0 +1,37 @@
+import unittest
+import pandas as pd
+
+from src.fill_log import FillLog
+from src.order_book import OrderBook
+from src.kandel import kandel_simulator
+from tests.test_kandel import gap_ts
+
+
+class TestFillLog(unittest.TestCase):
+    def run_fills(self, ts):
+        fill_log = FillLog(chunk_size=16, max_memory_rows=64)
+        kandel_simulator(ts, quote=75000, base=0, vol_mult=0.4, n_points=10, step_size=1,
+                         order_book=OrderBook(), window=600, ladder=True, fill_log=fill_log)
+        return fill_log
+
+    def test_gap_series_timestamps(self):
+        # Fills of a gap-aware run land on the same timestamps as on its forward filled series
+        ts = gap_ts()
+        filled = ts.gaps.expand(ts)
+        gap_fills = self.run_fills(ts).to_pandas(ts=ts)
+        ref = self.run_fills(filled).to_pandas(ts=filled)
+        self.assertGreater(len(ref), 0)
+        pd.testing.assert_frame_equal(gap_fills, ref)
+
+    def test_read_by_timestamp(self):
+        ts = gap_ts()
+        filled = ts.gaps.expand(ts)
+        fill_log = self.run_fills(ts)
+        ref = self.run_fills(filled).to_pandas(ts=filled)
+        start, stop = ref.index[len(ref) // 3], ref.index[2 * len(ref) // 3]
+        res = fill_log.to_pandas(ts=ts, start=start, stop=stop)
+        pd.testing.assert_frame_equal(res, ref[(ref.index >= start) & (ref.index < stop)])
+
+
+if __name__ == '__main__':
+    unittest.main()
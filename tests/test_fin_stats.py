@@ -0,0 +1,75 @@
+import unittest
+import warnings
+import numpy as np
+import pandas as pd
+
+from src.time_series import TS
+from src.fin_stats import vol_, log_ret_, rolling_std_, rolling_bollinger_bands_, RollingVol
+
+
+def walk_ts(n_rows : int = 3000) -> TS:
+    rng = np.random.default_rng(4)
+    prices = np.round(2400 * np.exp(np.cumsum(rng.normal(0, 2e-4, n_rows))), 2)
+    return TS(pd.date_range('2024-01-01', periods=n_rows, freq='s'), (1, 's'), n_rows,
+              np.array(['price']), values=prices[None, :])
+
+
+class TestRollingVol(unittest.TestCase):
+    def test_same_as_vol_of_log_ret(self):
+        ts = walk_ts()
+        fast, exact = RollingVol(ts, lookback=500), RollingVol(ts, lookback=500, exact=True)
+        for i, window in [(60, 60), (600, 60), (900, 500), (2999, 800), (3000, 1440)]:
+            ref = vol_(log_ret_(ts[i - min(window, 500):i]))
+            self.assertEqual(exact.vol(i, window), ref)
+            self.assertTrue(np.isclose(fast.vol(i, window), ref, rtol=1e-9, atol=0))
+
+    def test_rolling_same_as_vol(self):
+        index = RollingVol(walk_ts(), lookback=500)
+        rolling = index.rolling(60)
+        self.assertTrue(np.isnan(rolling[:60]).all())
+        self.assertTrue(np.allclose(rolling[60:], [index.vol(i, 60) for i in range(60, 3000)],
+                                    rtol=1e-12, atol=0))
+
+
+def naive_rolling(values : np.array, window : int, stat) -> np.array:
+    # stat of each column over the trailing window rows, nan until the first full window
+    res = np.full(values.shape, np.nan)
+    with warnings.catch_warnings():
+        # Windows of nans only
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for i in range(window - 1, values.shape[1]):
+            res[:, i] = stat(values[:, i - window + 1:i + 1], axis=1)
+    return res
+
+
+class TestRolling(unittest.TestCase):
+    def setUp(self):
+        # Two columns, one with missing values
+        rng = np.random.default_rng(5)
+        values = 2400 + np.cumsum(rng.normal(0, 1, (2, 1000)), axis=1)
+        values[1, rng.random(1000) < 0.2] = np.nan
+        self.ts = TS(pd.date_range('2024-01-01', periods=1000, freq='s'), (1, 's'), 1000,
+                     np.array(['a', 'b']), values=values)
+
+    def test_std_same_as_nanstd(self):
+        # Windows with a single value (std 0) are only within ~1e-6 of the column spread
+        spread = np.nanstd(self.ts.values)
+        for window in (1, 30, 1000):
+            res = rolling_std_(self.ts, window)
+            ref = naive_rolling(self.ts.values, window, np.nanstd)
+            self.assertTrue(np.allclose(res.values, ref, rtol=1e-9, atol=1e-6 * spread, equal_nan=True))
+        self.assertTrue(np.isnan(rolling_std_(self.ts, 1001).values).all())
+
+    def test_bollinger_bands(self):
+        res = rolling_bollinger_bands_(self.ts, 30, 2)
+        self.assertEqual(list(res.col_names), ['a_mean', 'a_lower', 'a_upper',
+                                               'b_mean', 'b_lower', 'b_upper'])
+        mean = naive_rolling(self.ts.values, 30, np.nanmean)
+        std = naive_rolling(self.ts.values, 30, np.nanstd)
+        ref = np.stack([mean, mean - 2 * std, mean + 2 * std], axis=1).reshape(6, -1)
+        self.assertTrue(np.allclose(res.values, ref, rtol=1e-9, atol=1e-6 * np.nanstd(self.ts.values),
+                                    equal_nan=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+import numpy as np
+import pandas as pd
+
+from src.time_series import TS
+from src.order_book import OrderBook
+from src.instrumentation import RunStats
+from src.kandel import kandel_simulator
+
+
+def walk_ts(n_rows : int = 3000) -> TS:
+    rng = np.random.default_rng(2)
+    prices = np.round(2400 * np.exp(np.cumsum(rng.normal(0, 2e-4, n_rows))), 2)
+    return TS(pd.date_range('2024-01-01', periods=n_rows, freq='s'), (1, 's'), n_rows,
+              np.array(['price']), values=prices[None, :])
+
+
+class TestRunStats(unittest.TestCase):
+    args = dict(quote=75000, base=0, vol_mult=0.4, n_points=10, step_size=1, window=600)
+
+    def test_counters(self):
+        ts = walk_ts()
+        for ladder in (False, True):
+            for event_skip in (False, True):
+                stats = RunStats()
+                transactions, res, _ = kandel_simulator(ts, order_book=OrderBook(), ladder=ladder,
+                                                        event_skip=event_skip, stats=stats,
+                                                        **self.args)
+                counts = res.stats['counts']
+                self.assertEqual(counts['ticks'], ts.n_rows - self.args['window'] - 1)
+                self.assertEqual(counts['events'] + counts['skipped_ticks'], counts['ticks'])
+                self.assertEqual(counts['fills'], sum(len(t) for t in transactions))
+                self.assertGreater(counts['regrids'], 0)
+                if not event_skip:
+                    self.assertEqual(counts['skipped_ticks'], 0)
+
+    def test_same_results(self):
+        ts = walk_ts()
+        _, ref, _ = kandel_simulator(ts, order_book=OrderBook(), **self.args)
+        _, res, _ = kandel_simulator(ts, order_book=OrderBook(), stats=RunStats(), **self.args)
+        self.assertTrue(np.array_equal(res.values, ref.values, equal_nan=True))
+        self.assertGreaterEqual(res.stats['wall'], sum(p['seconds'] for p in res.stats['phases'].values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
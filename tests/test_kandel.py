@@ -0,0 +1,131 @@
+import unittest
+import warnings
+import numpy as np
+import pandas as pd
+
+from src.time_series import TS, GapMap, ohlc_bars
+from src.order_book import OrderBook
+from src.kandel import kandel_simulator, KandelSimulator
+from src.kandel_batch import kandel_batch_simulator
+from src.sweep import sweep
+from tests.test_instrumentation import walk_ts
+
+"""
+Run from the repo root:
+    python -m unittest discover -s tests -t .
+"""
+
+
+def flat_ts(n_rows : int = 2000) -> TS:
+    # Flat price with two steps: the first windows have zero vol and collapse the grid
+    prices = np.full(n_rows, 2400.)
+    prices[n_rows // 4:] = 2401.
+    prices[3 * n_rows // 5:] = 2399.5
+    return TS(pd.date_range('2024-01-01', periods=n_rows, freq='s'), (1, 's'), n_rows,
+              np.array(['price']), values=prices[None, :])
+
+
+class TestFlatSeries(unittest.TestCase):
+    def test_collapsed_grid_same_in_both_books(self):
+        ts = flat_ts()
+        runs = {}
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            for ladder in (False, True):
+                for event_skip in (False, True):
+                    _, res, _ = kandel_simulator(ts, quote=75000, base=0, vol_mult=0.05, n_points=10,
+                                                 step_size=3, order_book=OrderBook(), window=60,
+                                                 ladder=ladder, event_skip=event_skip)
+                    runs[ladder, event_skip] = res.values
+        ref = runs[False, False]
+        for key, values in runs.items():
+            self.assertTrue(np.array_equal(values, ref, equal_nan=True), key)
+
+
+def gap_ts(n_rows : int = 6000) -> TS:
+    # Random walk observed on about 9 ticks out of 10
+    rng = np.random.default_rng(0)
+    prices = np.round(2400 * np.exp(np.cumsum(rng.normal(0, 2e-4, n_rows))), 2)
+    index = np.flatnonzero(rng.random(n_rows) > 0.1).astype('int64') + 1_726_358_400
+    return TS(index, (1, 's'), len(index), np.array(['price']), columns=[prices[:len(index)]],
+              index_dtype='datetime64[s]', gaps=GapMap.from_index(index, 1))
+
+
+class TestSweep(unittest.TestCase):
+    args = dict(quote=75000, base=0)
+    config = dict(vol_mult=0.4, n_points=10, step_size=1, window=600)
+
+    def assert_same_as_simulator(self, ts : TS) -> None:
+        row = sweep(ts, [self.config], n_workers=1, exact_vol=True, **self.args).iloc[0]
+        _, res, _ = kandel_simulator(ts, order_book=OrderBook(), ladder=True, event_skip=True,
+                                     **self.args, **self.config)
+        self.assertIsNone(row['error'])
+        self.assertEqual(row['mtm'], res.column('mtm')[-1])
+        self.assertEqual(row['volume'], res.column('volume').sum())
+
+    def test_tick_series(self):
+        ts = gap_ts()
+        self.assert_same_as_simulator(ts.gaps.expand(ts))
+
+    def test_bar_series(self):
+        ts = gap_ts()
+        self.assert_same_as_simulator(ohlc_bars(ts.gaps.expand(ts), 2))
+
+    def test_gap_series(self):
+        self.assert_same_as_simulator(gap_ts())
+
+    def test_cumulative_vol_within_tolerance(self):
+        ts = gap_ts()
+        ts = ts.gaps.expand(ts)
+        exact = sweep(ts, [self.config], n_workers=1, exact_vol=True, **self.args).iloc[0]
+        fast = sweep(ts, [self.config], n_workers=1, **self.args).iloc[0]
+        self.assertTrue(np.isclose(fast['mtm'], exact['mtm'], rtol=1e-9))
+
+
+class TestBatch(unittest.TestCase):
+    def test_dual_offer_off_grid_refused(self):
+        with self.assertRaisesRegex(Exception, r'config 1 \(n_points=3, step_size=5\)'):
+            kandel_batch_simulator(flat_ts(), 75000, 0, np.array([0.4, 0.4]), np.array([10, 3]),
+                                   np.array([1, 5]), 60)
+
+    def test_no_dual_offer_refused(self):
+        with self.assertRaisesRegex(Exception, r'config 0 \(n_points=10, step_size=0\)'):
+            kandel_batch_simulator(flat_ts(), 75000, 0, np.array([0.4, 0.4]), np.array([10, 3]),
+                                   np.array([0, 1]), 60)
+
+
+class TestKandelSimulator(unittest.TestCase):
+    args = dict(quote=75000, base=0, vol_mult=0.4, n_points=10, step_size=1, window=300)
+
+    def setUp(self):
+        self.ts = walk_ts(2500)
+        transactions, res, _ = kandel_simulator(self.ts, order_book=OrderBook(), ladder=True,
+                                                event_skip=True, **self.args)
+        self.ref = {name: res.column(name) for name in ('quote', 'base', 'volume', 'uptime')}
+        self.ref_fills = [[(t.price, t.qty) for t in tick] for tick in transactions]
+
+    def test_step(self):
+        # Small history buffer, compacted many times
+        sim = KandelSimulator(capacity=400, **self.args)
+        rows = [sim.step(price) for price in self.ts.column(0)]
+        for k, name in enumerate(('quote', 'base', 'volume', 'uptime')):
+            self.assertTrue(np.array_equal([row[k + 1] for row in rows], self.ref[name]), name)
+        start = self.args['window'] + 1
+        self.assertEqual([[(t.price, t.qty) for t in row[0]] for row in rows[start:]], self.ref_fills)
+        self.assertEqual(sim.latency()['calls'], self.ts.n_rows)
+
+    def test_step_batch(self):
+        sim = KandelSimulator(capacity=400, **self.args)
+        fills, results = [], {name: [] for name in self.ref}
+        for a, b in [(0, 1), (1, 350), (350, 1200), (1200, 1201), (1201, 2500)]:
+            transactions, res = sim.step_batch(self.ts.column(0)[a:b])
+            fills.extend([(t.price, t.qty) for t in tick] for tick in transactions)
+            for name in results:
+                results[name].extend(res[name])
+        for name, values in results.items():
+            self.assertTrue(np.array_equal(values, self.ref[name]), name)
+        self.assertEqual(fills, self.ref_fills)
+
+
+if __name__ == '__main__':
+    unittest.main()
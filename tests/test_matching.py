@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+from src.matching import MatchingEngine
+from src.time_series import load_csv
+
+
+class TestMatchingEngine(unittest.TestCase):
+    def setUp(self):
+        self.engine = MatchingEngine()
+        self.first, _ = self.engine.limit('ask', 2401., 1.)
+        self.second, _ = self.engine.limit('ask', 2401., 2.)
+        self.engine.limit('ask', 2402., 1.)
+
+    def test_price_time_priority(self):
+        # The first order placed at a price fills first, a partial fill keeps its place
+        fills = self.engine.market('bid', 0.5)
+        self.assertEqual(fills['maker_id'].tolist(), [self.first])
+        fills = self.engine.market('bid', 1.)
+        self.assertEqual(fills['maker_id'].tolist(), [self.first, self.second])
+        self.assertEqual(fills['qty'].tolist(), [0.5, 0.5])
+        self.assertEqual(self.engine.depth('ask'), [(2401., 1.5), (2402., 1.)])
+
+    def test_cancel(self):
+        self.assertEqual(self.engine.cancel(self.first), 1.)
+        self.assertEqual(self.engine.cancel(self.first), 0.)
+        fills = self.engine.market('bid', 1.)
+        self.assertEqual(fills['maker_id'].tolist(), [self.second])
+        self.engine.cancel(self.second)
+        self.assertEqual(self.engine.depth('ask'), [(2402., 1.)])
+
+    def test_immediate_or_cancel(self):
+        # Fills up to its price, the rest is dropped instead of resting
+        order_id, fills = self.engine.limit('bid', 2401., 5., rest=False)
+        self.assertEqual(fills['qty'].sum(), 3.)
+        self.assertNotIn(order_id, self.engine.orders)
+        self.assertEqual(self.engine.best_bid(), -np.inf)
+        self.assertEqual(self.engine.depth('ask'), [(2402., 1.)])
+
+    def test_replay_multi_column_csv(self):
+        frame = pd.DataFrame({'time': 1_726_358_400 + np.arange(4),
+                              'price': [2400., 2401., 2402., 2399.],
+                              'volume': [5., 0.5, 3., 1.]})
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        try:
+            frame.to_csv(path, sep=';', index=False)
+            ts = load_csv(path)
+        finally:
+            os.remove(path)
+        fills = self.engine.replay(ts)
+        self.assertEqual(fills['tick'].tolist(), [1, 2, 2, 2])
+        self.assertEqual(fills['qty'].tolist(), [0.5, 0.5, 2., 0.5])
+
+
+if __name__ == '__main__':
+    unittest.main()
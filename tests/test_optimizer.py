@@ -0,0 +1,40 @@
+import unittest
+import numpy as np
+
+from src.sweep import param_grid, sweep
+from src.optimizer import fidelities, successive_halving
+from tests.test_instrumentation import walk_ts
+
+
+class TestSuccessiveHalving(unittest.TestCase):
+    args = dict(quote=75000, base=0)
+
+    def test_fidelities(self):
+        self.assertEqual(fidelities(9000, 9, eta=3), [(1000, 1), (3000, 1), (9000, 1)])
+        self.assertEqual(fidelities(9000, 9, eta=3, fidelity='downsample'),
+                         [(9000, 9), (9000, 3), (9000, 1)])
+        # Rungs under min_rows are dropped
+        self.assertEqual(fidelities(9000, 9, eta=3, min_rows=2000), [(3000, 1), (9000, 1)])
+
+    def test_keeps_the_top_fraction(self):
+        ts = walk_ts(6000)
+        configs = param_grid(dict(vol_mult=[0.2, 0.4, 0.8], n_points=[6, 10, 20], step_size=[1],
+                                  window=[300]))
+        ranking, history = successive_halving(ts, configs, objective='mtm', eta=3, n_workers=1,
+                                              **self.args)
+        self.assertEqual(list(history.groupby('rung').size()), [9, 3, 1])
+        for r in (0, 1):
+            rung = history[history['rung'] == r]
+            kept = rung[rung['kept']]
+            self.assertEqual(len(kept), int(np.ceil(len(rung) / 3)))
+            # The kept configs are the best by the objective, and the only ones run next
+            self.assertTrue(kept['objective'].min() >= rung[~rung['kept']]['objective'].max())
+            self.assertEqual(set(kept['config_id']),
+                             set(history[history['rung'] == r + 1]['config_id']))
+        best = ranking.index[0]
+        full = sweep(ts, [configs[best]], n_workers=1, **self.args).iloc[0]
+        self.assertEqual(ranking.loc[best, 'mtm'], full['mtm'])
+
+
+if __name__ == '__main__':
+    unittest.main()
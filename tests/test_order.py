@@ -0,0 +1,45 @@
+import unittest
+from sortedcontainers import SortedList
+
+from src.order import Order, OrderPool
+
+
+class TestOrder(unittest.TestCase):
+    def test_slotted_with_increasing_ids(self):
+        first, second = Order('bid', 1., 2400.), Order('bid', 1., 2400.)
+        self.assertFalse(hasattr(first, '__dict__'))
+        self.assertLess(first.order_id, second.order_id)
+        self.assertEqual(first.uuid, first.order_id)
+
+    def test_best_first_sort(self):
+        bids = SortedList([Order('bid', 1., p) for p in (2399., 2401., 2400.)])
+        asks = SortedList([Order('ask', 1., p) for p in (2402., 2401.5, 2403.)])
+        self.assertEqual([o.price for o in bids], [2401., 2400., 2399.])
+        self.assertEqual([o.price for o in asks], [2401.5, 2402., 2403.])
+
+    def test_price_setter_updates_key(self):
+        order = Order('bid', 1., 2400.)
+        order.price = 2401.
+        self.assertEqual(order.key, -2401.)
+
+    def test_rounding(self):
+        order = Order('ask', 1.23456789, 2400.123456789)
+        self.assertEqual((order.qty, order.price), (1.234568, 2400.123457))
+        exact = Order.exact('ask', 1.23456789, 2400.123456789)
+        self.assertEqual((exact.qty, exact.price), (1.23456789, 2400.123456789))
+        self.assertEqual(exact.key, 2400.123456789)
+
+
+class TestOrderPool(unittest.TestCase):
+    def test_released_orders_reused(self):
+        pool = OrderPool()
+        order = pool.acquire('bid', 1., 2400.)
+        pool.release([order])
+        reused = pool.acquire('ask', 2., 2401.)
+        self.assertIs(reused, order)
+        self.assertEqual((reused.order_type, reused.qty, reused.price, reused.key),
+                         ('ask', 2., 2401., 2401.))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+import numpy as np
+from sortedcontainers import SortedList
+
+from src.order_book import Order, OrderBook, execute_market_order, match_market_order, LadderOrderBook
+
+BOUNDS = ('best_bid', 'low_bid', 'best_ask', 'high_ask',
+          'best_bid_price', 'low_bid_price', 'best_ask_price', 'high_ask_price')
+
+
+class TestLadderOrderBook(unittest.TestCase):
+    def test_bounds_follow_the_live_levels(self):
+        # Bounds updated level by level must equal a full rescan after every operation
+        rng = np.random.default_rng(3)
+        grid = list(2400 * 1.001 ** np.arange(-10, 11))
+        book = LadderOrderBook(grid)
+        for _ in range(2000):
+            if rng.random() < 0.7:
+                level = int(rng.integers(len(grid)))
+                book.add_limit_order('bid' if rng.random() < 0.5 else 'ask', level, 1.)
+            else:
+                book.arbitrage(float(rng.choice(grid)) * (1 + rng.normal(0, 1e-4)))
+            bounds = [getattr(book, name) for name in BOUNDS]
+            book._refresh()
+            self.assertEqual(bounds, [getattr(book, name) for name in BOUNDS])
+
+
+class TestExecuteMarketOrder(unittest.TestCase):
+    def test_price_qty_trades(self):
+        asks = SortedList([Order('ask', 1., 2401.), Order('ask', 2., 2402.)])
+        trades, (bids, asks) = execute_market_order(2402., 2., OrderBook(SortedList(), asks))
+        self.assertEqual(trades, [(2401., 1.), (2402., 1.)])
+        self.assertEqual(len(bids), 0)
+        self.assertEqual([(o.price, o.qty) for o in asks], [(2402., 1.)])
+
+    def test_one_sided_book(self):
+        # arbitrage_order_book leaves None for a side it emptied
+        asks = SortedList([Order('ask', 1., 2401.), Order('ask', 2., 2402.)])
+        trades, book = match_market_order(2401.5, 3., OrderBook(None, asks))
+        self.assertEqual([(t.order_type, t.price, t.qty) for t in trades], [('ask', 2401., 1.)])
+        self.assertEqual(len(book.bids), 0)
+        self.assertEqual([(o.price, o.qty) for o in book.asks], [(2402., 2.)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import unittest
+import numpy as np
+
+from src.time_series import load_csv
+from src.results_io import ResultWriter, write_results, read_results
+from tests.test_time_series import TempDirTest
+
+
+class TestResultsIO(TempDirTest):
+    def test_round_trip(self):
+        ts = load_csv(self.path)
+        out = os.path.join(self.dir, 'results.tsz')
+        write_results(ts, out, chunk_size=1000)
+        read = read_results(out)
+        self.assertTrue(np.array_equal(read.values, ts.values))
+        self.assertTrue(read.row_names.equals(ts.row_names))
+        self.assertEqual(read.unit, ts.unit)
+
+    def test_read_columns_and_range(self):
+        ts = load_csv(self.path)
+        out = os.path.join(self.dir, 'results.tsz')
+        write_results(ts, out, chunk_size=1000)
+        start, stop = ts.row_names[1500], ts.row_names[3200]
+        read = read_results(out, columns=['ETHUSDT'], start=start, stop=stop)
+        keep = (ts.row_names >= start) & (ts.row_names < stop)
+        self.assertEqual(list(read.col_names), ['ETHUSDT'])
+        self.assertTrue(np.array_equal(read.values[0], ts.values[0][keep]))
+        self.assertTrue(read.row_names.equals(ts.row_names[keep]))
+
+    def test_refuses_empty_close(self):
+        out = os.path.join(self.dir, 'results.tsz')
+        writer = ResultWriter(out)
+        with self.assertRaises(Exception):
+            writer.close()
+        self.assertFalse(os.path.exists(out))
+
+
+if __name__ == '__main__':
+    unittest.main()
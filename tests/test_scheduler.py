@@ -0,0 +1,40 @@
+import os
+import unittest
+import pandas as pd
+
+from src.time_series import load_csv
+from src.sweep import run_config
+from src.scheduler import expand_paths, schedule
+from tests.test_time_series import TempDirTest, write_csv
+
+
+class TestSchedule(TempDirTest):
+    args = dict(quote=75000, base=0)
+    configs = [dict(vol_mult=0.4, n_points=10, step_size=1, window=600),
+               dict(vol_mult=0.8, n_points=6, step_size=2, window=300)]
+
+    def setUp(self):
+        super().setUp()
+        write_csv(os.path.join(self.dir, 'short.csv'), n_rows=3000)
+
+    def test_rows_same_as_run_config(self):
+        paths = expand_paths([os.path.join(self.dir, '*.csv'), self.path])
+        self.assertEqual(len(paths), 2)
+        missing = os.path.join(self.dir, 'missing.csv')
+        res = schedule(paths + [missing], self.configs, n_workers=2, exact_vol=True, **self.args)
+        self.assertEqual(list(zip(res['dataset'], res['config_id'])),
+                         [(p, c) for p in sorted(paths + [missing]) for c in range(2)])
+        for path in paths:
+            ts = load_csv(path)
+            for c, config in enumerate(self.configs):
+                row = res[(res['dataset'] == path) & (res['config_id'] == c)].iloc[0]
+                ref = run_config(config, ts=ts, ladder=True, event_skip=True, **self.args)
+                self.assertTrue(pd.isna(row['error']), row['error'])
+                self.assertEqual(row['n_rows'], ts.n_rows)
+                for key in ('mtm', 'volume', 'n_fills', 'uptime'):
+                    self.assertEqual(row[key], ref[key], (path, c, key))
+        self.assertTrue(res[res['dataset'] == missing]['error'].notna().all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+from src.time_series import TS, GapMap, load_csv, load_cached, col_concat, get_timedelta_unit, ohlc_bars, \
+    Pyramid, load_pyramid
+
+
+def write_csv(path : str, n_rows : int = 5000, drop : float = 0.) -> None:
+    # First n_rows of the sample day, a share drop of the rows (never the first) left out
+    frame = pd.read_csv('data/ETHUSDC-1s-2024-09-15.csv', sep=';', nrows=n_rows)
+    if drop:
+        keep = np.random.default_rng(1).random(n_rows) >= drop
+        keep[0] = True
+        frame = frame[keep]
+    frame.to_csv(path, sep=';', index=False)
+
+
+class TempDirTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'prices.csv')
+        write_csv(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+class TestCache(TempDirTest):
+    def test_cached_same_as_csv(self):
+        ts = load_csv(self.path)
+        cache_dir = os.path.join(self.dir, 'cache')
+        for _ in range(2):
+            cached = load_cached(self.path, cache_dir=cache_dir)
+            self.assertTrue(np.array_equal(cached.values, ts.values))
+            self.assertTrue(cached.row_names.equals(ts.row_names))
+            self.assertEqual(cached.unit, ts.unit)
+        # Reopened memory-mapped, read only
+        self.assertFalse(cached.values.flags.writeable)
+
+    def test_rebuilt_when_source_changes(self):
+        cache_dir = os.path.join(self.dir, 'cache')
+        self.assertEqual(load_cached(self.path, cache_dir=cache_dir).n_rows, 5000)
+        write_csv(self.path, n_rows=6000)
+        self.assertEqual(load_cached(self.path, cache_dir=cache_dir).n_rows, 6000)
+
+
+class TestColumnar(unittest.TestCase):
+    def setUp(self):
+        self.index = np.arange(1_726_358_400, 1_726_358_400 + 100, dtype='int64')
+        self.values = np.random.default_rng(6).random((2, 100))
+
+    def layouts(self):
+        # Same series as one 2D array and as a list of columns
+        yield TS(self.index, (1, 's'), 100, np.array(['a', 'b']), values=self.values,
+                 index_dtype='datetime64[s]')
+        yield TS(self.index, (1, 's'), 100, np.array(['a', 'b']), columns=list(self.values.copy()),
+                 index_dtype='datetime64[s]')
+
+    def test_slices_and_columns_are_views(self):
+        for ts in self.layouts():
+            part = ts[10:20]
+            self.assertEqual(part.n_rows, 10)
+            self.assertTrue(np.shares_memory(part.column('b'), ts.column('b')))
+            self.assertTrue(np.array_equal(part.values, self.values[:, 10:20]))
+            self.assertTrue(np.shares_memory(ts['a'].column(0), ts.column(0)))
+            added = ts.add_column('c', np.zeros(100))
+            self.assertTrue(np.shares_memory(added.column('a'), ts.column('a')))
+            self.assertEqual(list(added.col_names), ['a', 'b', 'c'])
+
+    def test_row_names_from_int64_index(self):
+        ts = next(self.layouts())
+        self.assertEqual(ts.index.dtype, np.int64)
+        self.assertTrue(ts.row_names.equals(pd.date_range('2024-09-15', periods=100, freq='s')))
+        self.assertTrue(ts[5:].row_names.equals(ts.row_names[5:]))
+
+    def test_col_concat(self):
+        t, s = self.layouts()
+        res = col_concat(t, s['a'])
+        self.assertEqual(list(res.col_names), ['a', 'b', 'a'])
+        self.assertTrue(np.shares_memory(res.column(2), s.column('a')))
+        shifted = TS(self.index + 1, (1, 's'), 100, np.array(['c']), values=self.values[:1],
+                     index_dtype='datetime64[s]')
+        with self.assertRaisesRegex(Exception, 'different index'):
+            col_concat(t, shifted)
+
+
+class TestUnits(unittest.TestCase):
+    def test_units_in_year(self):
+        year = {'y': 1, 'b': 12, 'w': 52, 'd': 365, 'h': 8760, 'm': 525_600, 's': 31_536_000,
+                'ms': 31_536_000_000, 'us': 31_536_000_000_000, 'ns': 31_536_000_000_000_000}
+        for unit, n in year.items():
+            for k in (1, 5):
+                ts = TS(np.arange(2, dtype='int64'), (k, unit), 2, np.array(['price']),
+                        values=np.ones((1, 2)))
+                self.assertEqual(ts.units_in_year(), int(n / k), (k, unit))
+
+    def test_timedelta_unit(self):
+        for timedelta, unit in [('2D', (2, 'd')), ('3h', (3, 'h')), ('1min', (1, 'm')),
+                                ('1s', (1, 's')), ('250ms', (250, 'ms')), ('1500us', (1500, 'us')),
+                                ('500us', (500, 'us')), ('100ns', (100, 'ns')), ('0s', (0, 'ms'))]:
+            self.assertEqual(get_timedelta_unit(pd.Timedelta(timedelta)), unit, timedelta)
+
+
+class TestGaps(TempDirTest):
+    def test_gap_map(self):
+        index = np.array([0, 1, 2, 5, 6, 9], dtype='int64') * 10
+        gaps = GapMap.from_index(index, 10)
+        self.assertEqual(list(gaps.rows), [3, 5])
+        self.assertEqual(list(gaps.missing), [2, 2])
+        self.assertEqual(list(gaps.ticks(6)), [0, 1, 2, 5, 6, 9])
+        part = gaps.slice(2, 6)
+        self.assertEqual((list(part.rows), list(part.missing)), ([1, 3], [2, 2]))
+        for bad in ([0, 10, 10], [0, 15]):
+            with self.assertRaises(Exception):
+                GapMap.from_index(np.array(bad, dtype='int64'), 10)
+
+    def test_load_csv_gaps_expands_to_ffill(self):
+        write_csv(self.path, drop=0.1)
+        filled = load_csv(self.path)
+        ts = load_csv(self.path, gaps=True)
+        self.assertLess(ts.n_rows, filled.n_rows)
+        self.assertEqual(ts.gaps.n_missing(), filled.n_rows - ts.n_rows)
+        self.assertEqual(ts.unit, filled.unit)
+        expanded = ts.gaps.expand(ts)
+        self.assertTrue(np.array_equal(expanded.values, filled.values))
+        self.assertTrue(expanded.row_names.equals(filled.row_names))
+        # Slices keep the gaps between their rows
+        part = ts[100:900]
+        self.assertTrue(np.array_equal(part.gaps.expand(part).values,
+                                       filled.values[:, ts.gaps.ticks(ts.n_rows)[100]:
+                                                     ts.gaps.ticks(ts.n_rows)[899] + 1]))
+
+
+def naive_ohlc(prices : np.array, bar : int) -> np.array:
+    groups = [prices[k:k + bar] for k in range(0, len(prices), bar)]
+    return np.array([[g[0], g.max(), g.min(), g[-1]] for g in groups]).T
+
+
+class TestOhlcBars(TempDirTest):
+    def test_bars(self):
+        ts = load_csv(self.path)
+        for resolution, bar in [(7, 7), ('1min', 60), ('15min', 900)]:
+            bars = ohlc_bars(ts, resolution)
+            self.assertEqual(list(bars.col_names), ['open', 'high', 'low', 'close'])
+            self.assertEqual(bars.unit, (bar, 's'))
+            self.assertTrue(bars.row_names.equals(ts.row_names[::bar]))
+            # 5000 rows: the last bar is shorter
+            self.assertTrue(np.array_equal(bars.values, naive_ohlc(ts.values[0], bar)))
+        loaded = load_csv(self.path, bar='1min')
+        self.assertTrue(np.array_equal(loaded.values, ohlc_bars(ts, '1min').values))
+        with self.assertRaises(Exception):
+            ohlc_bars(ts, '1500ms')
+
+
+class TestPyramid(TempDirTest):
+    def test_levels_same_as_bars(self):
+        ts = load_csv(self.path)
+        pyramid = Pyramid.build(ts)
+        # 5000 rows: no 4h or 1D level
+        self.assertEqual(pyramid.resolutions(), [60, 300, 900, 3600])
+        for resolution in ('1min', '5min', '15min', '1h'):
+            level = pyramid.level(resolution)
+            bars = ohlc_bars(ts, resolution)
+            self.assertTrue(np.array_equal(level.values, bars.values))
+            self.assertTrue(level.row_names.equals(bars.row_names))
+
+    def test_between(self):
+        ts = load_csv(self.path)
+        pyramid = Pyramid.build(ts)
+        bars = ohlc_bars(ts, '5min')
+        # Bars overlapping the range, from the one holding its start
+        part = pyramid.between('2024-09-15 00:07:30', '2024-09-15 00:20:00', '5min')
+        self.assertTrue(part.row_names.equals(bars.row_names[1:4]))
+        self.assertTrue(np.array_equal(part.values, bars.values[:, 1:4]))
+        self.assertEqual(pyramid.row(ts.index[123]), 123)
+        self.assertEqual(pyramid.between(ts.index[-1] + 10 ** 9, ts.index[-1] + 10 ** 10, '5min').n_rows, 0)
+
+    def test_saved_with_the_cache(self):
+        pyramid = load_pyramid(self.path, cache_dir=os.path.join(self.dir, 'cache'))
+        loaded = load_pyramid(self.path, cache_dir=os.path.join(self.dir, 'cache'))
+        self.assertEqual(loaded.resolutions(), pyramid.resolutions())
+        self.assertTrue(np.array_equal(loaded.level('1h').values, pyramid.level('1h').values))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import numpy as np
+
+from src.utils_grid import geo_price_grid_gen, cursor
+from src.price_grid import PriceGrid
+
+
+def geo_price_grid_gen_loop(entry_price, end_price, ratio):
+    # Reference: the loop geo_price_grid_gen replaced
+    mylist = [entry_price]
+    new_value = entry_price
+    while round(new_value, 10) < round(end_price, 10):
+        new_value = mylist[-1] * ratio
+        mylist.append(new_value)
+    mylist[-1] = end_price
+    return mylist
+
+
+def cursor_scan(specific_price, price_grid):
+    # Reference: the linear scan cursor replaced, in range prices only
+    floor_price, floor_price_index = None, None
+    for index, price_point in enumerate(price_grid):
+        if specific_price > price_point:
+            floor_price, floor_price_index = price_point, index
+        elif specific_price < price_point:
+            return floor_price_index, floor_price
+        else:
+            return index, price_point
+
+
+class TestGeoPriceGrid(unittest.TestCase):
+    def test_same_levels_as_loop(self):
+        rng = np.random.default_rng(5)
+        cases = [(2000., 2000. * 1.01 ** 10, 1.01), (1., 100., 1.1), (2400., 2400.0000000001, 1.001)]
+        cases += [(p, p * rng.uniform(1.001, 3.), rng.uniform(1.0001, 1.2))
+                  for p in rng.uniform(1., 5000., 200)]
+        for entry_price, end_price, ratio in cases:
+            self.assertEqual(geo_price_grid_gen(entry_price, end_price, ratio),
+                             geo_price_grid_gen_loop(entry_price, end_price, ratio))
+
+
+class TestCursor(unittest.TestCase):
+    def test_same_as_scan(self):
+        grids = [[1., 2., 3., 4.], [2400., 2400., 2400.], [1., 2., 2., 2., 3.]]
+        for grid in grids:
+            for price in [1., 1.5, 2., 2.5, 3., 4., 2400.]:
+                if grid[0] <= price <= grid[-1]:
+                    expected = cursor_scan(price, grid)
+                    self.assertEqual(cursor(price, grid), expected, (grid, price))
+                    self.assertEqual(PriceGrid(grid).cursor(price), expected, (grid, price))
+
+
+if __name__ == '__main__':
+    unittest.main()